@@ -42,6 +42,14 @@ LOCALE_PATHS = [str(ROOT_DIR / "locale")]
 # https://docs.djangoproject.com/en/dev/ref/settings/#databases
 DATABASES = {"default": env.db("DATABASE_URL")}
 DATABASES["default"]["ATOMIC_REQUESTS"] = True
+# Read replicas of "default", for the views marked read-only; see
+# movierama.utils.replicas.
+DATABASE_REPLICAS = []
+for i, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[]), 1):
+    DATABASES[f"replica{i}"] = env.db_url_config(url)
+    DATABASES[f"replica{i}"]["TEST"] = {"MIRROR": "default"}
+    DATABASE_REPLICAS.append(f"replica{i}")
+DATABASE_ROUTERS = ["movierama.utils.replicas.ReplicaRouter"]
 # https://docs.djangoproject.com/en/stable/ref/settings/#std:setting-DEFAULT_AUTO_FIELD
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -137,6 +145,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.common.BrokenLinkEmailsMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "movierama.utils.replicas.ReplicaMiddleware",
 ]
 
 # STATIC
@@ -277,3 +286,41 @@ SOCIALACCOUNT_FORMS = {"signup": "movierama.users.forms.UserSocialSignupForm"}
 # Your stuff...
 # ------------------------------------------------------------------------------
 DJANGO_TABLES2_TEMPLATE = "django_tables2/semantic.html"
+# Buffer vote counter updates in Redis and flush them into movies in batches,
+# see movierama.movies.counters. Needs a django_redis cache.
+MOVIES_VOTE_BUFFER = env.bool("DJANGO_MOVIES_VOTE_BUFFER", default=False)
+MOVIES_VOTE_BUFFER_CACHE = "default"
+# Spread the vote counter updates of each movie over this many rows, folded
+# into movies by the compact_vote_counters command; 0 updates movies directly.
+# See movierama.movies.counters.
+MOVIES_VOTE_SHARDS = env.int("DJANGO_MOVIES_VOTE_SHARDS", default=0)
+# How long a client reads from the primary after writing, and how far behind
+# a replica may be (both in seconds); see movierama.utils.replicas.
+DATABASE_REPLICA_PIN_SECONDS = env.int(
+    "DJANGO_DATABASE_REPLICA_PIN_SECONDS", default=10
+)
+DATABASE_REPLICA_MAX_LAG = env.float("DJANGO_DATABASE_REPLICA_MAX_LAG", default=5.0)
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = 5
+# Transaction policies of the movies views, which opt them out of
+# ATOMIC_REQUESTS, and the timeouts of their queries (in milliseconds); see
+# movierama.utils.transactions.
+VIEW_TRANSACTION_POLICIES = {
+    "read": {
+        "statement_timeout": env.int("DJANGO_READ_STATEMENT_TIMEOUT", default=10000),
+    },
+    "write": {
+        "lock_timeout": env.int("DJANGO_WRITE_LOCK_TIMEOUT", default=2000),
+        "statement_timeout": env.int("DJANGO_WRITE_STATEMENT_TIMEOUT", default=10000),
+    },
+}
+# How long a vote waits for the locks of its movie before giving up (in
+# milliseconds), and how many times it is tried; see movierama.movies.services.
+MOVIES_VOTE_LOCK_TIMEOUT = env.int("DJANGO_MOVIES_VOTE_LOCK_TIMEOUT", default=200)
+MOVIES_VOTE_ATTEMPTS = env.int("DJANGO_MOVIES_VOTE_ATTEMPTS", default=3)
+# Cache of the public movie listings, see movierama.movies.cache.
+MOVIES_CACHE = "default"
+MOVIES_CACHE_TIMEOUT = env.int("DJANGO_MOVIES_CACHE_TIMEOUT", default=600)
+# How long title completions are cached, by the server and by browsers.
+MOVIES_AUTOCOMPLETE_CACHE_TIMEOUT = env.int(
+    "DJANGO_MOVIES_AUTOCOMPLETE_CACHE_TIMEOUT", default=60
+)
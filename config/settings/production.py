@@ -20,6 +20,19 @@ ALLOWED_HOSTS = env.list("DJANGO_ALLOWED_HOSTS", default=["petrorama.com"])
 DATABASES["default"] = env.db("DATABASE_URL")  # noqa F405
 DATABASES["default"]["ATOMIC_REQUESTS"] = True  # noqa F405
 DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60)  # noqa F405
+for alias in DATABASE_REPLICAS:  # noqa F405
+    DATABASES[alias]["CONN_MAX_AGE"] = DATABASES["default"]["CONN_MAX_AGE"]  # noqa F405
+if env.bool("DJANGO_DATABASE_POOL", default=False):
+    # Borrow connections from a capped pool per process for each request,
+    # instead of keeping one per thread; see movierama.utils.pooled_postgresql.
+    DATABASES["default"]["ENGINE"] = "movierama.utils.pooled_postgresql"  # noqa F405
+    DATABASES["default"]["CONN_MAX_AGE"] = 0  # noqa F405
+    DATABASES["default"]["POOL"] = {  # noqa F405
+        "MAX_SIZE": env.int("DJANGO_DATABASE_POOL_MAX_SIZE", default=10),
+        "TIMEOUT": env.float("DJANGO_DATABASE_POOL_TIMEOUT", default=5.0),
+        "PRE_PING": env.bool("DJANGO_DATABASE_POOL_PRE_PING", default=True),
+        "MAX_IDLE": env.int("DJANGO_DATABASE_POOL_MAX_IDLE", default=300),
+    }
 
 # CACHES
 # ------------------------------------------------------------------------------
@@ -35,6 +48,24 @@ CACHES = {
         },
     }
 }
+if env.bool("DJANGO_CACHE_L1", default=False):
+    # Keep the hottest movie list keys in process as well, dropped on writes
+    # through Redis pub/sub; see movierama.utils.tiered_cache.
+    CACHES["default"]["BACKEND"] = "movierama.utils.tiered_cache.TieredRedisCache"
+    CACHES["default"]["OPTIONS"].update(
+        {
+            "L1_MAX_ENTRIES": env.int("DJANGO_CACHE_L1_MAX_ENTRIES", default=1000),
+            "L1_TIMEOUT": env.int("DJANGO_CACHE_L1_TIMEOUT", default=5),
+            "L1_KEY_PREFIXES": [
+                "movies:autocomplete:",
+                "movies:list-generation",
+                "movies:page:",
+                "movies:row-version:",
+                "movies:user-generation",
+                "template.cache.movie_row.",
+            ],
+        }
+    )
 
 # SECURITY
 # ------------------------------------------------------------------------------
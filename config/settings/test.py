@@ -27,3 +27,10 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+# A replica alias mirroring the test database, for the tests of the replica
+# router to turn on through DATABASE_REPLICAS.
+DATABASES["replica1"] = {  # noqa F405
+    **DATABASES["default"],  # noqa F405
+    "ATOMIC_REQUESTS": False,
+    "TEST": {"MIRROR": "default"},
+}
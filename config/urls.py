@@ -5,6 +5,8 @@ from django.urls import include, path
 from django.views import defaults as default_views
 from django.views.generic import TemplateView
 
+from movierama.utils.views import database_pool_stats
+
 urlpatterns = [
     path("", TemplateView.as_view(template_name="pages/home.html"), name="home"),
     path(
@@ -17,6 +19,7 @@ urlpatterns = [
     path("accounts/", include("allauth.urls")),
     # Your stuff: custom urls includes go here
     path("movies/", include("movierama.movies.urls", namespace="movies")),
+    path("db-pool-stats/", database_pool_stats, name="database_pool_stats"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 
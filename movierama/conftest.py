@@ -1,4 +1,5 @@
 import pytest
+from django.core.cache import caches
 
 from movierama.users.models import User
 from movierama.users.tests.factories import UserFactory
@@ -9,6 +10,13 @@ def media_storage(settings, tmpdir):
     settings.MEDIA_ROOT = tmpdir.strpath
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    yield
+    for cache in caches.all():
+        cache.clear()
+
+
 @pytest.fixture
 def user() -> User:
     return UserFactory()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MoviesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "movierama.movies"
+
+    def ready(self):
+        import movierama.movies.signals  # noqa F401
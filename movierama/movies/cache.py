@@ -0,0 +1,149 @@
+"""
+Generation-keyed cache for the public movie listings.
+
+Rendered pages for anonymous visitors are stored along with the list
+generation they were rendered for, and rendered table rows under a key that
+embeds the movie's own version. Invalidation never deletes anything: bumping
+a generation (see ``signals.py``) makes pages stale, to be rebuilt by a single
+worker (see ``movierama.utils.cache``), and row keys built from the old
+version unreachable, so that the stale entries simply expire.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from movierama.utils.cache import get_or_compute
+
+LIST_GENERATION_KEY = "movies:list-generation"
+# Moves on as users or movies are added or removed, not on votes.
+USER_GENERATION_KEY = "movies:user-generation"
+ROW_VERSION_KEY = "movies:row-version:{}"
+STATS_KEY = "movies:cache-stats:{}"
+
+
+def get_cache():
+    return caches[settings.MOVIES_CACHE]
+
+
+def _incr(key):
+    cache = get_cache()
+    # ``add`` is a no-op if the counter exists; ``incr`` needs it to.
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The key was evicted between the two calls.
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def list_generation():
+    return get_cache().get(LIST_GENERATION_KEY, 0)
+
+
+def bump_list_generation():
+    _incr(LIST_GENERATION_KEY)
+
+
+def user_generation():
+    return get_cache().get(USER_GENERATION_KEY, 0)
+
+
+def bump_user_generation():
+    _incr(USER_GENERATION_KEY)
+
+
+def bump_row_versions(movie_ids):
+    for movie_id in movie_ids:
+        _incr(ROW_VERSION_KEY.format(movie_id))
+
+
+def annotate_row_versions(movies):
+    """Set ``cache_version`` on ``movies``, for their row fragment keys."""
+    keys = {movie.pk: ROW_VERSION_KEY.format(movie.pk) for movie in movies}
+    versions = get_cache().get_many(keys.values())
+    for movie in movies:
+        movie.cache_version = versions.get(keys[movie.pk], 0)
+    return movies
+
+
+def record(outcome):
+    """Count a cache ``"hit"`` or ``"miss"``."""
+    _incr(STATS_KEY.format(outcome))
+
+
+def cache_stats():
+    stats = get_cache().get_many([STATS_KEY.format("hit"), STATS_KEY.format("miss")])
+    hits = stats.get(STATS_KEY.format("hit"), 0)
+    misses = stats.get(STATS_KEY.format("miss"), 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+    }
+
+
+def _cacheable(request):
+    # Pages for signed in users carry their name, and pending messages are
+    # shown once only; neither may be served to someone else.
+    return (
+        request.method == "GET"
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+class _Uncacheable(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def cache_anonymous_page(name):
+    """
+    Serve the decorated view to anonymous visitors from the cache, keyed by
+    ``name`` and the query string, and rebuilt once the list generation moves
+    on. While one worker rebuilds a page, the others serve the previous one.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view(request, *args, **kwargs)
+
+            rendered = []
+
+            def render():
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    raise _Uncacheable(response)
+                rendered.append(response)
+                # The headers too, as UpdateCacheMiddleware does, for the
+                # content type and those the view sets.
+                return response.status_code, list(response.items()), response.content
+
+            query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+            try:
+                status, headers, content = get_or_compute(
+                    f"movies:page:{name}:{query}:response",
+                    render,
+                    settings.MOVIES_CACHE_TIMEOUT,
+                    generation=list_generation(),
+                    cache=get_cache(),
+                )
+            except _Uncacheable as e:
+                return e.response
+            if rendered:
+                record("miss")
+                return rendered[0]
+            record("hit")
+            return HttpResponse(content, status=status, headers=dict(headers))
+
+        return wrapper
+
+    return decorator
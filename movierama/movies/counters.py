@@ -0,0 +1,397 @@
+"""
+Deferred updates of the vote counters of movies.
+
+By default every vote updates its ``Movie`` row, so votes on a single popular
+movie queue up on that row's lock. Two options take the row out of the vote:
+
+* With ``MOVIES_VOTE_BUFFER`` enabled, the counter deltas are added to a
+  Redis hash once the vote commits, and folded into ``Movie`` in batches by
+  :func:`flush_vote_buffer` (see the ``flush_vote_counters`` management
+  command).
+* With ``MOVIES_VOTE_SHARDS`` set, the deltas are added, in the vote's own
+  transaction, to one of that many :model:`movies.VoteCounterShard` rows of
+  the movie picked at random, so that concurrent votes on it rarely wait for
+  each other. :func:`compact_vote_shards` folds the shards into ``Movie``
+  (see the ``compact_vote_counters`` management command); keep running it
+  for a while after turning the shards off.
+
+Either way :func:`with_pending_votes` merges the deltas not yet folded into
+the movies read from the database. Orderings by score only catch up once they
+are folded.
+
+Writes that bypass the vote service (admin edits, imports, failures halfway)
+can leave the counters off the vote table; :func:`reconcile_vote_counts`
+(the ``reconcile_vote_counts`` command) recomputes them from it.
+
+Flush protocol of the Redis buffer:
+
+1. Under a Redis lock, atomically rename the live hash to the flushing hash
+   and stamp it with a fresh batch id. New votes start a new live hash.
+2. In one database transaction, add the deltas to the movies and record the
+   batch id in :model:`movies.VoteCounterFlush`.
+3. Delete the flushing hash.
+
+A flusher that dies before step 3 leaves the flushing hash behind; the next
+flush picks it up first, and skips the database step if the ledger shows the
+batch was already committed.
+"""
+import random
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import DISLIKE, LIKE, Movie, MovieVote, VoteCounterFlush, VoteCounterShard
+from .signals import votes_changed
+from .trending import add_to_rollups
+
+LIVE_KEY = "movierama:vote-buffer:live"
+FLUSHING_KEY = "movierama:vote-buffer:flushing"
+LOCK_KEY = "movierama:vote-buffer:lock"
+BATCH_FIELD = "batch"
+
+# How many movies are updated per statement during a flush or a compaction.
+FLUSH_CHUNK_SIZE = 1000
+# How many movies :func:`reconcile_vote_counts` checks per statement.
+RECONCILE_CHUNK_SIZE = 5000
+# How long ledger rows are kept, to recognise replays of crashed flushes.
+LEDGER_RETENTION = timedelta(days=1)
+
+
+def get_redis():
+    return get_redis_connection(settings.MOVIES_VOTE_BUFFER_CACHE)
+
+
+def buffer_enabled():
+    return settings.MOVIES_VOTE_BUFFER
+
+
+def shards_enabled():
+    return settings.MOVIES_VOTE_SHARDS > 0
+
+
+def buffer_vote_delta(movie_id, up, down):
+    """Add a counter delta for ``movie_id`` to the live hash."""
+    pipe = get_redis().pipeline()
+    if up:
+        pipe.hincrby(LIVE_KEY, f"{movie_id}:up", up)
+    if down:
+        pipe.hincrby(LIVE_KEY, f"{movie_id}:down", down)
+    pipe.execute()
+
+
+def add_to_vote_shard(movie_id, up, down):
+    """Add a counter delta for ``movie_id`` to one of its shards."""
+    table = connection.ops.quote_name(VoteCounterShard._meta.db_table)
+    shard = random.randrange(settings.MOVIES_VOTE_SHARDS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (movie_id, shard, up, down)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (movie_id, shard) DO UPDATE SET
+                up = {table}.up + EXCLUDED.up,
+                down = {table}.down + EXCLUDED.down
+            """,
+            [movie_id, shard, up, down],
+        )
+
+
+def sharded_vote_deltas(movie_ids):
+    """
+    Return ``{movie_id: (up, down)}`` for the deltas of ``movie_ids`` left in
+    their shards.
+    """
+    rows = (
+        VoteCounterShard.objects.filter(movie_id__in=list(movie_ids))
+        .values("movie_id")
+        .annotate(up=Sum("up"), down=Sum("down"))
+        .values_list("movie_id", "up", "down")
+    )
+    return {movie_id: (up, down) for movie_id, up, down in rows if up or down}
+
+
+def pending_vote_deltas(movie_ids):
+    """
+    Return ``{movie_id: (up, down)}`` for the deltas of ``movie_ids`` that
+    have not reached the database yet.
+    """
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return {}
+    fields = [f"{pk}:{kind}" for pk in movie_ids for kind in ("up", "down")]
+    pipe = get_redis().pipeline()
+    pipe.hmget(LIVE_KEY, fields)
+    pipe.hmget(FLUSHING_KEY, fields + [BATCH_FIELD])
+    live, flushing = pipe.execute()
+
+    # The flushing hash only counts while its batch is not yet committed.
+    batch = flushing.pop()
+    if batch is not None and _batch_committed(batch):
+        flushing = [None] * len(fields)
+
+    values = [int(a or 0) + int(b or 0) for a, b in zip(live, flushing)]
+    return {
+        pk: (values[2 * i], values[2 * i + 1])
+        for i, pk in enumerate(movie_ids)
+        if values[2 * i] or values[2 * i + 1]
+    }
+
+
+def with_pending_votes(movies):
+    """
+    Merge the deltas not yet folded into the counters of ``movies`` and
+    return them as a list. Without the buffer or the shards this is a no-op.
+    """
+    movies = list(movies)
+    sources = []
+    if buffer_enabled():
+        sources.append(pending_vote_deltas)
+    if shards_enabled():
+        sources.append(sharded_vote_deltas)
+    if not movies or not sources:
+        return movies
+    deltas = [source([movie.pk for movie in movies]) for source in sources]
+    for movie in movies:
+        up = sum(delta.get(movie.pk, (0, 0))[0] for delta in deltas)
+        down = sum(delta.get(movie.pk, (0, 0))[1] for delta in deltas)
+        movie.num_vote_up += up
+        movie.num_vote_down += down
+        movie.vote_score += up - down
+    return movies
+
+
+def flush_vote_buffer():
+    """
+    Fold the buffered deltas into ``Movie``. Return the number of movies
+    updated, or ``None`` if another flusher holds the lock.
+    """
+    redis = get_redis()
+    lock = redis.lock(LOCK_KEY, timeout=300)
+    if not lock.acquire(blocking=False):
+        return None
+    try:
+        updated = 0
+        # A batch left over by a crashed flusher goes first.
+        if not redis.exists(FLUSHING_KEY):
+            if not redis.exists(LIVE_KEY):
+                return 0
+            pipe = redis.pipeline(transaction=True)
+            pipe.rename(LIVE_KEY, FLUSHING_KEY)
+            pipe.hset(FLUSHING_KEY, BATCH_FIELD, str(uuid.uuid4()))
+            pipe.execute()
+
+        snapshot = redis.hgetall(FLUSHING_KEY)
+        batch = snapshot.pop(BATCH_FIELD.encode()).decode()
+        if not _batch_committed(batch):
+            updated = _apply_batch(batch, _parse_deltas(snapshot))
+        redis.delete(FLUSHING_KEY)
+        return updated
+    finally:
+        lock.release()
+
+
+def _parse_deltas(snapshot):
+    deltas = {}
+    for field, value in snapshot.items():
+        movie_id, kind = field.decode().split(":")
+        up, down = deltas.get(int(movie_id), (0, 0))
+        if kind == "up":
+            up += int(value)
+        else:
+            down += int(value)
+        deltas[int(movie_id)] = (up, down)
+    return deltas
+
+
+def compact_vote_shards():
+    """
+    Fold the deltas of the vote counter shards into ``Movie``, a chunk of
+    movies per transaction, and return the number of movies updated. Votes
+    arriving meanwhile start new shards, left to the next compaction.
+    """
+    table = connection.ops.quote_name(VoteCounterShard._meta.db_table)
+    updated = last_id = 0
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    WITH folded AS (
+                        DELETE FROM {table}
+                        WHERE movie_id IN (
+                            SELECT DISTINCT movie_id FROM {table}
+                            WHERE movie_id > %s
+                            ORDER BY movie_id
+                            LIMIT %s
+                        )
+                        RETURNING movie_id, up, down
+                    )
+                    SELECT movie_id, sum(up), sum(down)
+                    FROM folded
+                    GROUP BY movie_id
+                    ORDER BY movie_id
+                    """,
+                    [last_id, FLUSH_CHUNK_SIZE],
+                )
+                deltas = cursor.fetchall()
+                if not deltas:
+                    return updated
+                last_id = deltas[-1][0]
+                rows = [row for row in deltas if row[1] or row[2]]
+                _add_vote_deltas(cursor, rows)
+            _votes_changed([movie_id for movie_id, _, _ in rows])
+        updated += len(rows)
+
+
+VoteDrift = namedtuple(
+    "VoteDrift", "movie_id stored_up stored_down stored_score up down score"
+)
+
+
+def reconcile_vote_counts(chunk_size=RECONCILE_CHUNK_SIZE, dry_run=False):
+    """
+    Recompute the counters of all movies from the vote table, one range of
+    ids per statement and transaction, and fix the movies they are off for.
+    Yield a :class:`VoteDrift` per such movie, after its range committed;
+    with ``dry_run`` nothing is written.
+
+    Deltas still in the shards count as already in the counters. Those of the
+    Redis buffer cannot be told apart from drift; flush it and turn it off
+    first.
+    """
+    movies = connection.ops.quote_name(Movie._meta.db_table)
+    drift_sql = f"""
+        SELECT m.id, m.num_vote_up, m.num_vote_down, m.vote_score,
+               a.up, a.down, a.up - a.down
+        FROM {movies} AS m
+        JOIN (
+            SELECT m.id,
+                   (coalesce(v.up, 0) + coalesce(s.up, 0))::integer AS up,
+                   (coalesce(v.down, 0) + coalesce(s.down, 0))::integer AS down
+            FROM {movies} AS m
+            LEFT JOIN (
+                SELECT movie_id,
+                       count(*) FILTER (WHERE value = %s) AS up,
+                       count(*) FILTER (WHERE value = %s) AS down
+                FROM {connection.ops.quote_name(MovieVote._meta.db_table)}
+                WHERE movie_id >= %s AND movie_id < %s
+                GROUP BY movie_id
+            ) AS v ON v.movie_id = m.id
+            LEFT JOIN (
+                SELECT movie_id, -sum(up) AS up, -sum(down) AS down
+                FROM {connection.ops.quote_name(VoteCounterShard._meta.db_table)}
+                WHERE movie_id >= %s AND movie_id < %s
+                GROUP BY movie_id
+            ) AS s ON s.movie_id = m.id
+            WHERE m.id >= %s AND m.id < %s
+        ) AS a ON a.id = m.id
+        WHERE (m.num_vote_up, m.num_vote_down, m.vote_score)
+            IS DISTINCT FROM (a.up, a.down, a.up - a.down)
+    """
+    bounds = Movie.objects.order_by("id").values_list("id", flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return
+    for start in range(first, last + 1, chunk_size):
+        end = start + chunk_size
+        params = [LIKE, DISLIKE] + [start, end] * 3
+        with transaction.atomic(), connection.cursor() as cursor:
+            if dry_run:
+                cursor.execute(drift_sql, params)
+            else:
+                # Lock the range first, so that the counts below are taken
+                # after the votes in progress on it commit, and not
+                # overwritten by them. The lock is held for the range only.
+                cursor.execute(
+                    f"SELECT 1 FROM {movies} WHERE id >= %s AND id < %s FOR UPDATE",
+                    [start, end],
+                )
+                cursor.execute(
+                    f"""
+                    WITH drift (id, stored_up, stored_down, stored_score,
+                                up, down, score) AS ({drift_sql})
+                    UPDATE {movies} AS m SET
+                        num_vote_up = d.up,
+                        num_vote_down = d.down,
+                        vote_score = d.score,
+                        hot_score = m.hot_score
+                            + movies_movie_score_weight(d.score)
+                            - movies_movie_score_weight(m.vote_score),
+                        wilson_score = movies_movie_wilson_score(d.up, d.down)
+                    FROM drift AS d
+                    WHERE m.id = d.id
+                    RETURNING d.*
+                    """,
+                    params,
+                )
+            drift = [VoteDrift(*row) for row in cursor.fetchall()]
+            if not dry_run:
+                _votes_changed([row.movie_id for row in drift])
+        yield from sorted(drift)
+
+
+def _apply_batch(batch, deltas):
+    rows = [
+        (movie_id, up, down)
+        for movie_id, (up, down) in sorted(deltas.items())
+        if up or down
+    ]
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), FLUSH_CHUNK_SIZE):
+                end = start + FLUSH_CHUNK_SIZE
+                _add_vote_deltas(cursor, rows[start:end])
+        VoteCounterFlush.objects.create(batch=batch)
+        VoteCounterFlush.objects.filter(
+            flushed_at__lt=timezone.now() - LEDGER_RETENTION
+        ).delete()
+        _votes_changed([movie_id for movie_id, _, _ in rows])
+    return len(rows)
+
+
+def _add_vote_deltas(cursor, rows):
+    """
+    Add the ``(movie_id, up, down)`` deltas of ``rows`` to the movies, and
+    to their rollups of the hour.
+    """
+    if not rows:
+        return
+    table = connection.ops.quote_name(Movie._meta.db_table)
+    values = ", ".join(["(%s, %s, %s)"] * len(rows))
+    cursor.execute(
+        f"""
+        UPDATE {table} AS m SET
+            num_vote_up = m.num_vote_up + d.up,
+            num_vote_down = m.num_vote_down + d.down,
+            vote_score = m.vote_score + d.up - d.down,
+            hot_score = m.hot_score
+                + movies_movie_score_weight(m.vote_score + d.up - d.down)
+                - movies_movie_score_weight(m.vote_score),
+            wilson_score = movies_movie_wilson_score(
+                m.num_vote_up + d.up, m.num_vote_down + d.down
+            )
+        FROM (VALUES {values}) AS d (id, up, down)
+        WHERE m.id = d.id
+        """,
+        [value for row in rows for value in row],
+    )
+    add_to_rollups(rows)
+
+
+def _votes_changed(movie_ids):
+    if movie_ids:
+        transaction.on_commit(
+            lambda: votes_changed.send(sender=Movie, movie_ids=movie_ids)
+        )
+
+
+def _batch_committed(batch):
+    if isinstance(batch, bytes):
+        batch = batch.decode()
+    return VoteCounterFlush.objects.filter(batch=batch).exists()
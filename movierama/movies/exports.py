@@ -0,0 +1,139 @@
+"""
+Streaming exports of movies, votes and per-user stats, as CSV or JSON lines.
+
+Rows are read through a server-side cursor (``QuerySet.iterator``), a chunk
+at a time, rendered and optionally gzipped as they go, so that memory stays
+flat whatever the size of the tables. Related names are joined in the same
+query. A server-side cursor lives as long as its transaction, so exports
+must run outside of one, or within one that outlives the stream: views
+serving them are ``non_atomic_requests``.
+"""
+import csv
+import json
+import zlib
+from datetime import datetime
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from movierama.users.models import User
+
+from .models import DISLIKE, LIKE, Movie, MovieVote
+
+# How many rows are fetched from the server-side cursor at a time.
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def _per_user(queryset, aggregate):
+    # A per-user aggregate as a correlated subquery, so that several of them
+    # do not multiply each other's joined rows.
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .values("user")
+            .annotate(total=aggregate)
+            .values("total"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def movies():
+    return Movie.objects.order_by("id").values_list(
+        "id",
+        "title",
+        "description",
+        "user__username",
+        "pub_date",
+        "num_vote_up",
+        "num_vote_down",
+        "vote_score",
+        "hot_score",
+        "wilson_score",
+    )
+
+
+def votes():
+    return MovieVote.objects.order_by("id").values_list(
+        "id", "movie_id", "movie__title", "user__username", "value", "created_at"
+    )
+
+
+def user_stats():
+    votes = MovieVote.objects.filter(user=OuterRef("pk"))
+    authored = Movie.objects.filter(user=OuterRef("pk"))
+    return (
+        User.objects.order_by("id")
+        .annotate(
+            movies=_per_user(authored, Count("pk")),
+            likes_given=_per_user(votes.filter(value=LIKE), Count("pk")),
+            hates_given=_per_user(votes.filter(value=DISLIKE), Count("pk")),
+            likes_received=_per_user(authored, Sum("num_vote_up")),
+            hates_received=_per_user(authored, Sum("num_vote_down")),
+        )
+        .values_list(
+            "id",
+            "username",
+            "date_joined",
+            "movies",
+            "likes_given",
+            "hates_given",
+            "likes_received",
+            "hates_received",
+        )
+    )
+
+
+# Exports by name, as querysets of ``values_list`` rows.
+EXPORTS = {"movies": movies, "votes": votes, "user-stats": user_stats}
+
+
+def export(name, fmt="csv", compress=False, chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """
+    Yield the export ``name`` in format ``fmt``, as chunks of bytes, gzipped
+    if ``compress``, read from the database ``using`` if given.
+    """
+    queryset = EXPORTS[name]().using(using)
+    columns = [_column_name(field) for field in queryset._fields]
+    rows = queryset.iterator(chunk_size=chunk_size)
+    render = _render_csv if fmt == "csv" else _render_jsonl
+    chunks = (chunk.encode() for chunk in render(columns, rows))
+    return _gzip(chunks) if compress else chunks
+
+
+def _column_name(field):
+    return field.replace("__", "_")
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _render_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _render_jsonl(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,4 +1,13 @@
-from django.forms import CharField, ChoiceField, Form, ModelForm, RadioSelect, Textarea
+from django.forms import (
+    CharField,
+    ChoiceField,
+    Form,
+    ModelForm,
+    RadioSelect,
+    Textarea,
+    TextInput,
+)
+from django.urls import reverse_lazy
 
 from .models import Movie
 
@@ -15,6 +24,14 @@ class MovieForm(ModelForm):
     class Meta:
         model = Movie
         fields = ["title", "description"]
+        widgets = {
+            # Existing titles show up while typing, see project.js
+            "title": TextInput(
+                attrs={
+                    "data-autocomplete-url": reverse_lazy("movies:movie_autocomplete")
+                }
+            ),
+        }
 
 
 class VoteForm(Form):
@@ -0,0 +1,290 @@
+"""
+Bulk imports of movies and votes from CSV or JSON lines files.
+
+Records stream from the file through a pipeline of generators (read, skip
+what an earlier run imported, batch), so that memory holds a single batch.
+Each batch is validated, ``COPY``'d into a temporary staging table and
+merged into its target by one ``INSERT ... SELECT ... ON CONFLICT``, in a
+transaction that also records in :model:`movies.ImportProgress` how far
+into the file it got. An interrupted import resumes after its last
+committed batch, as long as the file did not change.
+
+Movies are matched on their unique title: a title already taken is skipped,
+or, with ``on_conflict="update"``, gets the new description. Authors and
+voters are matched on username, and votes on movie title; the merge drops
+records naming unknown users or movies, and votes on one's own movies.
+Votes go to :model:`movies.MovieVote` directly, bypassing the vote service,
+so the counters of the movies are then rebuilt from it in one pass of
+``counters.reconcile_vote_counts``. Imported votes are history, and stay out
+of the trending rollups.
+"""
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from movierama.users.models import User
+
+from .cache import bump_list_generation, bump_row_versions, bump_user_generation
+from .counters import buffer_enabled, reconcile_vote_counts
+from .models import DISLIKE, LIKE, ImportProgress, Movie, MovieVote
+
+# How many records are copied and merged per transaction.
+BATCH_SIZE = 10000
+FORMATS = ("csv", "jsonl")
+ON_CONFLICT = ("skip", "update")
+# Accepted spellings of the ``vote`` of a vote record.
+VOTE_INPUT = {
+    "like": LIKE,
+    "1": LIKE,
+    "dislike": DISLIKE,
+    "hate": DISLIKE,
+    "-1": DISLIKE,
+}
+_INVALID = object()
+BUFFER_ENABLED = "Flush the vote buffer and turn off DJANGO_MOVIES_VOTE_BUFFER first."
+
+# Staging tables, private to the connection; ``line`` lets the last record
+# of a batch win when several share a key.
+MOVIE_STAGING_SQL = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS movies_import_movie (
+        line bigint, title text, description text, username text,
+        pub_date timestamptz
+    )
+"""
+VOTE_STAGING_SQL = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS movies_import_vote (
+        line bigint, username text, title text, value smallint,
+        created_at timestamptz
+    )
+"""
+
+
+def read_records(path, fmt=None):
+    """
+    Yield the records of the CSV (with a header) or JSON lines ``path``, and
+    None in place of each line that is not a JSON object.
+    """
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield record if isinstance(record, dict) else None
+
+
+def import_movies(path, fmt=None, on_conflict="skip", **kwargs):
+    """
+    Import the movies of ``path``, with their ``title``, ``description``,
+    author ``username`` and optional ``pub_date``. Return the counts of
+    records ``read``, ``rejected`` as invalid and ``merged``.
+    """
+    table = connection.ops.quote_name(Movie._meta.db_table)
+    users = connection.ops.quote_name(User._meta.db_table)
+    if on_conflict == "update":
+        conflict = f"""
+            DO UPDATE SET description = EXCLUDED.description
+            WHERE {table}.description <> EXCLUDED.description
+        """
+    else:
+        conflict = "DO NOTHING"
+    merge_sql = f"""
+        INSERT INTO {table} (
+            title, description, user_id, pub_date, num_vote_up, num_vote_down,
+            vote_score, hot_score, wilson_score
+        )
+        SELECT DISTINCT ON (s.title)
+            s.title, coalesce(s.description, ''), u.id, coalesce(s.pub_date, now()),
+            0, 0, 0, 0, 0
+        FROM movies_import_movie AS s
+        JOIN {users} AS u ON u.username = s.username
+        ORDER BY s.title, s.line DESC
+        ON CONFLICT (title) {conflict}
+        RETURNING id, xmax <> 0
+    """
+
+    def merged(rows):
+        # The cached table rows of updated movies carry the old description.
+        updated = [movie_id for movie_id, update in rows if update]
+        if updated:
+            transaction.on_commit(lambda: bump_row_versions(updated))
+
+    stats = _import(
+        ImportProgress.MOVIES,
+        path,
+        read_records(path, fmt),
+        _movie_row,
+        MOVIE_STAGING_SQL,
+        "movies_import_movie",
+        "line, title, description, username, pub_date",
+        merge_sql,
+        on_merge=merged,
+        **kwargs,
+    )
+    bump_list_generation()
+    bump_user_generation()
+    return stats
+
+
+def import_votes(path, fmt=None, **kwargs):
+    """
+    Import the votes of ``path``, with the voter's ``username``, the movie
+    ``title``, the ``vote`` ("like" or "dislike") and an optional
+    ``created_at``, then rebuild the vote counters. Return the counts of
+    records ``read``, ``rejected`` as invalid and ``merged``, and of movies
+    whose counters were ``reconciled``.
+
+    The counters are rebuilt whole, so deltas still in the Redis vote buffer
+    would count twice once flushed: this refuses to run while it is on.
+    """
+    if buffer_enabled():
+        raise ValueError(BUFFER_ENABLED)
+    table = connection.ops.quote_name(MovieVote._meta.db_table)
+    movies = connection.ops.quote_name(Movie._meta.db_table)
+    users = connection.ops.quote_name(User._meta.db_table)
+    merge_sql = f"""
+        INSERT INTO {table} (user_id, movie_id, value, created_at)
+        SELECT DISTINCT ON (m.id, u.id)
+            u.id, m.id, s.value, coalesce(s.created_at, now())
+        FROM movies_import_vote AS s
+        JOIN {users} AS u ON u.username = s.username
+        JOIN {movies} AS m ON m.title = s.title
+        WHERE m.user_id <> u.id
+        ORDER BY m.id, u.id, s.line DESC
+        ON CONFLICT (movie_id, user_id) DO UPDATE
+            SET value = EXCLUDED.value, created_at = EXCLUDED.created_at
+            WHERE {table}.value <> EXCLUDED.value
+    """
+    stats = _import(
+        ImportProgress.VOTES,
+        path,
+        read_records(path, fmt),
+        _vote_row,
+        VOTE_STAGING_SQL,
+        "movies_import_vote",
+        "line, username, title, value, created_at",
+        merge_sql,
+        **kwargs,
+    )
+    stats["reconciled"] = sum(1 for _ in reconcile_vote_counts())
+    return stats
+
+
+def _import(
+    kind,
+    path,
+    records,
+    parse,
+    staging_sql,
+    staging,
+    columns,
+    merge_sql,
+    batch_size=BATCH_SIZE,
+    restart=False,
+    progress=None,
+    on_merge=None,
+):
+    ledger, _ = ImportProgress.objects.get_or_create(
+        kind=kind, source=os.path.abspath(path)
+    )
+    if restart:
+        ledger.position = 0
+        ledger.finished = False
+        ledger.save()
+    stats = {"read": ledger.position, "rejected": 0, "merged": 0}
+    records = islice(enumerate(records), ledger.position, None)
+
+    for batch in _batches(records, batch_size):
+        rows = []
+        for line, record in batch:
+            row = parse(record) if record is not None else None
+            if row is not None:
+                rows.append((line,) + row)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(staging_sql)
+            cursor.execute(f"TRUNCATE {staging}")
+            cursor.copy_expert(
+                f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+            cursor.execute(merge_sql)
+            stats["merged"] += cursor.rowcount
+            if on_merge:
+                on_merge(cursor.fetchall())
+            ledger.position += len(batch)
+            ledger.save(update_fields=["position", "updated_at"])
+        stats["read"] += len(batch)
+        stats["rejected"] += len(batch) - len(rows)
+        if progress:
+            progress(stats)
+
+    ledger.finished = True
+    ledger.save(update_fields=["finished", "updated_at"])
+    return stats
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _text(record, field, max_length):
+    # None stands for an invalid value, "" for a missing one.
+    value = record.get(field) or ""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    return value if len(value) <= max_length else None
+
+
+def _datetime(record, field):
+    # A missing date is NULL, defaulted on merge; a bad one is invalid.
+    value = record.get(field)
+    if not value:
+        return None
+    if not isinstance(value, str):
+        return _INVALID
+    try:
+        return parse_datetime(value) or _INVALID
+    except ValueError:
+        return _INVALID
+
+
+def _movie_row(record):
+    title = _text(record, "title", Movie._meta.get_field("title").max_length)
+    description = _text(
+        record, "description", Movie._meta.get_field("description").max_length
+    )
+    username = _text(record, "username", User._meta.get_field("username").max_length)
+    pub_date = _datetime(record, "pub_date")
+    if not title or description is None or not username or pub_date is _INVALID:
+        return None
+    return title, description, username, pub_date
+
+
+def _vote_row(record):
+    username = _text(record, "username", User._meta.get_field("username").max_length)
+    title = _text(record, "title", Movie._meta.get_field("title").max_length)
+    value = VOTE_INPUT.get(str(record.get("vote", "")).strip().lower())
+    created_at = _datetime(record, "created_at")
+    if not username or not title or value is None or created_at is _INVALID:
+        return None
+    return username, title, value, created_at
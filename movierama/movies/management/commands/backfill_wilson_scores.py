@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from movierama.movies.ranking import BACKFILL_CHUNK_SIZE, backfill_wilson_scores
+
+
+class Command(BaseCommand):
+    help = "Recompute the Wilson scores of all movies from their vote counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=BACKFILL_CHUNK_SIZE,
+            help="Movies updated per statement.",
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        updated = backfill_wilson_scores(chunk_size)
+        self.stdout.write(f"Updated the Wilson scores of {updated} movies.")
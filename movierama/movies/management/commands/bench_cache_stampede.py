@@ -0,0 +1,81 @@
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from movierama.utils.cache import get_or_compute
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate many workers reading a cached aggregate across its expiry, "
+        "and compare how often a plain get-or-set and get_or_compute rebuild it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=32)
+        parser.add_argument(
+            "--duration", type=float, default=6.0, help="Seconds to run each strategy."
+        )
+        parser.add_argument(
+            "--ttl", type=float, default=2.0, help="Seconds the value stays fresh."
+        )
+        parser.add_argument(
+            "--cost", type=float, default=0.1, help="Seconds one rebuild takes."
+        )
+        parser.add_argument("--cache", default="default", help="Cache alias to use.")
+
+    def handle(self, *args, workers, duration, ttl, cost, cache, **options):
+        cache = caches[cache]
+        for name, strategy in (("get-or-set", self.naive), ("get_or_compute", None)):
+            key = f"bench:stampede:{name}"
+            cache.delete(key)
+            rebuilds = []
+
+            def compute():
+                # Stands in for the aggregate query.
+                time.sleep(cost)
+                rebuilds.append(1)
+                return "value"
+
+            def read():
+                if strategy:
+                    return strategy(cache, key, compute, ttl)
+                return get_or_compute(key, compute, ttl, cache=cache)
+
+            reads = self.run(workers, duration, read)
+            self.stdout.write(
+                f"{name:>15}: {len(rebuilds):4d} rebuilds, "
+                f"{len(rebuilds) * cost:6.1f}s of database time, {reads} reads"
+            )
+
+    @staticmethod
+    def naive(cache, key, compute, ttl):
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, ttl)
+        return value
+
+    @staticmethod
+    def run(workers, duration, read):
+        reads = []
+        start = threading.Barrier(workers)
+        deadline = time.monotonic() + duration
+
+        def worker():
+            start.wait()
+            count = 0
+            while time.monotonic() < deadline:
+                read()
+                count += 1
+                time.sleep(0.01)
+            reads.append(count)
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(reads)
@@ -0,0 +1,137 @@
+import threading
+import time
+from statistics import quantiles
+
+import psycopg2
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import load_backend
+
+from movierama.utils.pooled_postgresql.pool import close_pools
+
+APPLICATION_NAME = "movierama-bench-db-pool"
+
+
+class Command(BaseCommand):
+    help = (
+        "Run requests from many threads with a connection per request, with "
+        "persistent connections (CONN_MAX_AGE) and with the connection pool, "
+        "and compare throughput, latency and server connections used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--requests", type=int, default=50, help="Per thread.")
+        parser.add_argument(
+            "--query-ms", type=float, default=5.0, help="Database time per request."
+        )
+        parser.add_argument("--max-size", type=int, default=8, help="Pool size.")
+
+    def handle(self, *args, threads, requests, query_ms, max_size, **options):
+        settings_dict = {
+            **connections[DEFAULT_DB_ALIAS].settings_dict,
+            "ENGINE": "django.db.backends.postgresql",
+            "CONN_MAX_AGE": 0,
+        }
+        settings_dict["OPTIONS"] = {
+            **settings_dict["OPTIONS"],
+            "application_name": APPLICATION_NAME,
+        }
+        strategies = [
+            ("connect per request", settings_dict, True),
+            ("CONN_MAX_AGE", settings_dict, False),
+            (
+                "pool",
+                {
+                    **settings_dict,
+                    "ENGINE": "movierama.utils.pooled_postgresql",
+                    "POOL": {"MAX_SIZE": max_size, "TIMEOUT": 30.0},
+                },
+                True,
+            ),
+        ]
+        self.stdout.write(
+            f"{'':>20} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7} "
+            f"{'connects':>8} {'server conns':>12} {'errors':>6}"
+        )
+        for name, settings, close in strategies:
+            result = self.run(settings, close, threads, requests, query_ms / 1000)
+            self.stdout.write(
+                f"{name:>20} {result['throughput']:7.0f} {result['p50']:7.1f} "
+                f"{result['p95']:7.1f} {result['connects']:8d} "
+                f"{result['peak']:12d} {result['errors']:6d}"
+            )
+        close_pools()
+
+    def run(self, settings_dict, close, threads, requests, query_seconds):
+        backend = load_backend(settings_dict["ENGINE"])
+        latencies, errors, backends = [], [], set()
+        start = threading.Barrier(threads + 1)
+        done = threading.Event()
+
+        def worker():
+            wrapper = backend.DatabaseWrapper(settings_dict, "bench")
+            start.wait()
+            for _ in range(requests):
+                began = time.perf_counter()
+                try:
+                    with wrapper.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT pg_backend_pid(), pg_sleep(%s)", [query_seconds]
+                        )
+                        backends.add(cursor.fetchone()[0])
+                except Exception:
+                    errors.append(1)
+                    wrapper.close()
+                    continue
+                # The end of a request, when Django closes a connection that
+                # is not to be kept.
+                if close:
+                    wrapper.close()
+                latencies.append((time.perf_counter() - began) * 1000)
+            wrapper.close()
+
+        peak = []
+        monitor = threading.Thread(target=self.monitor, args=(done, peak))
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers + [monitor]:
+            thread.start()
+        start.wait()
+        began = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        done.set()
+        monitor.join()
+
+        p50, p95 = (
+            quantiles(latencies, n=20)[9:19:9] if len(latencies) > 1 else (0.0, 0.0)
+        )
+        return {
+            "throughput": len(latencies) / elapsed,
+            "p50": p50,
+            "p95": p95,
+            # Server processes, one per connection opened.
+            "connects": len(backends),
+            "peak": max(peak, default=0),
+            "errors": len(errors),
+        }
+
+    @staticmethod
+    def monitor(done, peak):
+        """Sample the server connections of the bench until ``done``."""
+        params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+        params.pop("application_name", None)
+        conn = psycopg2.connect(**params)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                while not done.wait(0.01):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE application_name = %s",
+                        [APPLICATION_NAME],
+                    )
+                    peak.append(cursor.fetchone()[0])
+        finally:
+            conn.close()
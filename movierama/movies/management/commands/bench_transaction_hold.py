@@ -0,0 +1,135 @@
+import time
+import uuid
+from statistics import mean
+from unittest import mock
+
+from django.core.handlers.base import BaseHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+from django.urls import reverse
+
+from movierama.movies.models import Movie
+from movierama.users.models import User
+
+PAGES = ["movie_list", "vote_movies", "my_movie_list", "user_vote_list"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Request the movie pages as USERNAME, and vote on a throwaway movie, "
+        "once with a transaction per request (ATOMIC_REQUESTS) and once with "
+        "the per-view policies, and compare how long each request keeps a "
+        "transaction open on the primary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--requests", type=int, default=20, help="Per page.")
+        parser.add_argument("--host", default="localhost")
+
+    def handle(self, *args, username, requests, host, **options):
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"No user {username!r}")
+
+        # Votes go to a movie and from a voter made for the bench, and
+        # deleted with their votes afterwards, so that real votes are left
+        # alone.
+        name = f"bench-{uuid.uuid4().hex[:12]}"
+        author = User.objects.create_user(username=f"{name}-author")
+        voter = User.objects.create_user(username=f"{name}-voter")
+        try:
+            movie = Movie.objects.create(
+                title=name, description="Transaction hold bench", user=author
+            )
+            self.bench(user, voter, movie, requests, host)
+        finally:
+            Movie.objects.filter(user=author).delete()
+            User.objects.filter(pk__in=[author.pk, voter.pk]).delete()
+
+    def bench(self, user, voter, movie, requests, host):
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+        vote_client = Client(HTTP_HOST=host)
+        vote_client.force_login(voter)
+        targets = [
+            (name, client, "get", reverse(f"movies:{name}"), {}) for name in PAGES
+        ]
+        vote_url = reverse("movies:movie_vote", args=[movie.pk])
+        targets.append(("movie_vote", vote_client, "post", vote_url, {"vote": "like"}))
+        targets.append(
+            ("movie_vote", vote_client, "post", vote_url, {"vote": "remove"})
+        )
+
+        self.stdout.write(
+            f"{'view':>16} {'request ms':>11} {'per request':>12} {'per view':>9}"
+        )
+        for name, client, method, url, data in targets:
+            results = {}
+            for policy in ("request", "view"):
+                results[policy] = self.run(client, method, url, data, requests, policy)
+            self.stdout.write(
+                f"{name:>16} {mean(results['view'][0]):11.1f} "
+                f"{mean(results['request'][1]):10.1f}ms {mean(results['view'][1]):7.1f}ms"
+            )
+
+    @staticmethod
+    def run(client, method, url, data, requests, policy):
+        """Return the request times and the times spent in a transaction."""
+        elapsed, held = [], []
+        patches = [_track_transactions(held)]
+        if policy == "request":
+            # What ATOMIC_REQUESTS does, regardless of the views' policies.
+            patches.append(
+                mock.patch.object(
+                    BaseHandler,
+                    "make_view_atomic",
+                    lambda handler, view: transaction.atomic(using=DEFAULT_DB_ALIAS)(
+                        view
+                    ),
+                )
+            )
+        for patch in patches:
+            patch.start()
+        try:
+            for _ in range(requests):
+                held.append(0.0)
+                start = time.perf_counter()
+                getattr(client, method)(url, data, secure=True)
+                elapsed.append((time.perf_counter() - start) * 1000)
+        finally:
+            for patch in reversed(patches):
+                patch.stop()
+        return elapsed, held
+
+
+def _track_transactions(held):
+    """
+    Add the time spent in outermost transactions on the primary to the last
+    entry of ``held``, in milliseconds.
+    """
+    enter, leave = transaction.Atomic.__enter__, transaction.Atomic.__exit__
+    started = []
+
+    def outermost(atomic):
+        connection = connections[atomic.using or DEFAULT_DB_ALIAS]
+        return atomic.using in (None, DEFAULT_DB_ALIAS) and not (
+            connection.in_atomic_block
+        )
+
+    def timed_enter(atomic):
+        if outermost(atomic):
+            started.append(time.perf_counter())
+        return enter(atomic)
+
+    def timed_exit(atomic, *exc_info):
+        result = leave(atomic, *exc_info)
+        if started and outermost(atomic):
+            held[-1] += (time.perf_counter() - started.pop()) * 1000
+        return result
+
+    return mock.patch.multiple(
+        transaction.Atomic, __enter__=timed_enter, __exit__=timed_exit
+    )
@@ -0,0 +1,54 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from movierama.movies.recommendations import (
+    BUILD_CHUNK_SIZE,
+    RECOMMENDATIONS,
+    build_recommendations,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the movie recommendations of the users active lately."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--active-days",
+            type=int,
+            default=30,
+            help="Only the users signed in within the last ACTIVE_DAYS days.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Processes computing chunks of users, one per core by default.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=BUILD_CHUNK_SIZE,
+            help="Users computed per statement.",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=RECOMMENDATIONS,
+            help="Movies recommended per user.",
+        )
+
+    def handle(self, *args, active_days, workers, chunk_size, top, **options):
+        stats = build_recommendations(
+            timezone.now() - timedelta(days=active_days),
+            workers=workers,
+            chunk_size=chunk_size,
+            top=top,
+        )
+        self.stdout.write(
+            "Stored {recommendations} recommendations for {users} users "
+            "in {seconds:.1f}s (peak memory: {max_rss_kb} kB, "
+            "{worker_max_rss_kb} kB per worker).".format(**stats)
+        )
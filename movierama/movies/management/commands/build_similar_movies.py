@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from movierama.movies.similarity import (
+    BUILD_CHUNK_SIZE,
+    SIMILAR_MOVIES,
+    build_similar_movies,
+    refresh_similar_movies,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the similar movies of every movie, or of the movies voted lately."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--changed-since",
+            type=int,
+            metavar="HOURS",
+            help="Only rebuild the movies voted on in the last HOURS hours.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=BUILD_CHUNK_SIZE,
+            help="Movies computed per statement.",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=SIMILAR_MOVIES,
+            help="Similar movies kept per movie.",
+        )
+
+    def handle(self, *args, changed_since, chunk_size, top, **options):
+        start = time.monotonic()
+        if changed_since is None:
+            stored = build_similar_movies(chunk_size=chunk_size, top=top)
+        else:
+            since = timezone.now() - timedelta(hours=changed_since)
+            stored = refresh_similar_movies(since, chunk_size=chunk_size, top=top)
+        self.stdout.write(
+            f"Stored {stored} similar movies in {time.monotonic() - start:.1f}s."
+        )
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movierama.movies.counters import compact_vote_shards
+
+
+class Command(BaseCommand):
+    help = "Fold the sharded vote counter deltas into the movies."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep compacting every INTERVAL seconds instead of compacting once.",
+        )
+
+    def handle(self, *args, interval, **options):
+        while True:
+            updated = compact_vote_shards()
+            self.stdout.write(f"Compacted vote counters of {updated} movies.")
+            if not interval:
+                break
+            time.sleep(interval)
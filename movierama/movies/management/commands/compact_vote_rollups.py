@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from movierama.movies.trending import HOURLY_RETENTION, compact_vote_rollups
+
+
+class Command(BaseCommand):
+    help = "Fold the hourly vote rollups of past days into daily ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-hours",
+            type=int,
+            default=HOURLY_RETENTION // timedelta(hours=1),
+            help="Keep the hourly rollups of the last KEEP_HOURS hours.",
+        )
+
+    def handle(self, *args, keep_hours, **options):
+        folded = compact_vote_rollups(timedelta(hours=keep_hours))
+        self.stdout.write(f"Folded the vote rollups of {folded} days.")
@@ -0,0 +1,51 @@
+import codecs
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movierama.movies.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, EXPORTS, export
+
+
+class Command(BaseCommand):
+    help = "Stream an export of movies, votes or per-user stats to a file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=EXPORTS)
+        parser.add_argument(
+            "-o",
+            "--output",
+            default="-",
+            help="File to write, standard output by default.",
+        )
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output.")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help="Rows fetched from the database at a time.",
+        )
+
+    def handle(self, *args, name, output, format, gzip, chunk_size, **options):
+        chunks = export(name, format, compress=gzip, chunk_size=chunk_size)
+        if output != "-":
+            with open(output, "wb") as f:
+                self._write(f, chunks)
+            return
+        # self.stdout, rather than sys.stdout, so that call_command can
+        # capture it: in bytes if it has a binary buffer, in text otherwise.
+        buffer = getattr(self.stdout, "buffer", None)
+        if buffer is not None:
+            self.stdout.flush()
+            self._write(buffer, chunks)
+            buffer.flush()
+        elif gzip:
+            raise CommandError("Gzipped exports need a binary output, see --output.")
+        else:
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            for chunk in chunks:
+                self.stdout.write(decoder.decode(chunk), ending="")
+            self.stdout.write(decoder.decode(b"", final=True), ending="")
+
+    def _write(self, f, chunks):
+        for chunk in chunks:
+            f.write(chunk)
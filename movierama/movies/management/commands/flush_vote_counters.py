@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movierama.movies.counters import buffer_enabled, flush_vote_buffer
+
+
+class Command(BaseCommand):
+    help = "Fold the vote counter deltas buffered in Redis into the movies."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep flushing every INTERVAL seconds instead of flushing once.",
+        )
+
+    def handle(self, *args, interval, **options):
+        if not buffer_enabled():
+            raise CommandError("The vote buffer is off, set DJANGO_MOVIES_VOTE_BUFFER.")
+        while True:
+            updated = flush_vote_buffer()
+            if updated is None:
+                self.stderr.write("Another flush is in progress.")
+            else:
+                self.stdout.write(f"Flushed vote counters of {updated} movies.")
+            if not interval:
+                break
+            time.sleep(interval)
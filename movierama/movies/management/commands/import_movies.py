@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from movierama.movies.imports import BATCH_SIZE, FORMATS, ON_CONFLICT, import_movies
+
+
+class Command(BaseCommand):
+    help = (
+        "Import movies (title, description, username, pub_date) from a CSV or "
+        "JSON lines file, resuming an interrupted import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header, or JSON lines file.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Format of the file, guessed from its extension by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Records copied and merged per transaction.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Import the file from the start, instead of resuming.",
+        )
+        parser.add_argument(
+            "--on-conflict",
+            choices=ON_CONFLICT,
+            default="skip",
+            help="Skip the movies whose title exists, or update their description.",
+        )
+
+    def handle(self, *args, path, format, batch_size, restart, on_conflict, **options):
+        stats = import_movies(
+            path,
+            fmt=format,
+            on_conflict=on_conflict,
+            batch_size=batch_size,
+            restart=restart,
+            progress=self.progress,
+        )
+        self.stdout.write(
+            "Done: {read} records read, {rejected} rejected, "
+            "{merged} movies merged.".format(**stats)
+        )
+
+    def progress(self, stats):
+        self.stdout.write(
+            "{read} records read, {rejected} rejected, "
+            "{merged} movies merged...".format(**stats)
+        )
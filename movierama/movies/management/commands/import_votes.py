@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movierama.movies.counters import buffer_enabled
+from movierama.movies.imports import BATCH_SIZE, BUFFER_ENABLED, FORMATS, import_votes
+
+
+class Command(BaseCommand):
+    help = (
+        "Import votes (username, title, vote, created_at) from a CSV or JSON "
+        "lines file, resuming an interrupted import, and rebuild the counters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header, or JSON lines file.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Format of the file, guessed from its extension by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Records copied and merged per transaction.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Import the file from the start, instead of resuming.",
+        )
+
+    def handle(self, *args, path, format, batch_size, restart, **options):
+        if buffer_enabled():
+            raise CommandError(BUFFER_ENABLED)
+        stats = import_votes(
+            path,
+            fmt=format,
+            batch_size=batch_size,
+            restart=restart,
+            progress=self.progress,
+        )
+        self.stdout.write(
+            "Done: {read} records read, {rejected} rejected, {merged} votes "
+            "merged, counters of {reconciled} movies rebuilt.".format(**stats)
+        )
+
+    def progress(self, stats):
+        self.stdout.write(
+            "{read} records read, {rejected} rejected, "
+            "{merged} votes merged...".format(**stats)
+        )
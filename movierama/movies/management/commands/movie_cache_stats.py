@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from movierama.movies.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show the hit and miss counts of the movie listing cache."
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        self.stdout.write(
+            f"hits: {stats['hits']}  misses: {stats['misses']}  "
+            f"hit ratio: {stats['hit_ratio']:.1%}"
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from movierama.movies.ranking import BACKFILL_CHUNK_SIZE, rebase_hot_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the epoch of the hot movie ranking to now and recompute every hot "
+        "score. Run it from time to time, e.g. weekly, at a quiet hour."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=BACKFILL_CHUNK_SIZE,
+            help="Movies updated per statement.",
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        updated = rebase_hot_scores(chunk_size=chunk_size)
+        self.stdout.write(f"Rebased the hot scores of {updated} movies.")
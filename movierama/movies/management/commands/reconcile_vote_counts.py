@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movierama.movies.counters import (
+    RECONCILE_CHUNK_SIZE,
+    buffer_enabled,
+    reconcile_vote_counts,
+)
+
+# How many drifted movies are listed without --verbosity 2.
+REPORT_ROWS = 20
+
+
+class Command(BaseCommand):
+    help = "Recompute the vote counters of all movies from their votes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=RECONCILE_CHUNK_SIZE,
+            help="Movies checked per statement.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the drifted movies without fixing them.",
+        )
+
+    def handle(self, *args, chunk_size, dry_run, verbosity, **options):
+        if buffer_enabled():
+            raise CommandError(
+                "Flush the vote buffer and turn off DJANGO_MOVIES_VOTE_BUFFER first."
+            )
+        drifted = up = down = 0
+        for drift in reconcile_vote_counts(chunk_size, dry_run=dry_run):
+            drifted += 1
+            up += drift.up - drift.stored_up
+            down += drift.down - drift.stored_down
+            if verbosity > 1 or drifted <= REPORT_ROWS:
+                self.stdout.write(
+                    f"Movie {drift.movie_id}: "
+                    f"{drift.stored_up}/{drift.stored_down}/{drift.stored_score} "
+                    f"-> {drift.up}/{drift.down}/{drift.score} (up/down/score)"
+                )
+        if drifted > REPORT_ROWS and verbosity < 2:
+            self.stdout.write(f"... and {drifted - REPORT_ROWS} more.")
+        action = "Found" if dry_run else "Fixed"
+        self.stdout.write(
+            f"{action} {drifted} movies with drifted counters "
+            f"({up:+d} likes, {down:+d} hates)."
+        )
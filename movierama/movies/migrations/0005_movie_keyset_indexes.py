@@ -0,0 +1,23 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Build the indexes without locking the movies table against writes.
+    atomic = False
+
+    dependencies = [
+        ('movies', '0004_auto_20220511_1630'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(fields=['vote_score', 'pub_date', 'id'], name='movie_score_keyset_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(fields=['pub_date', 'id'], name='movie_pub_date_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# django-vote keeps a single vote per user and object, but only enforces
+# uniqueness per action. The vote upsert in ``movies.services`` needs a unique
+# index on (user_id, content_type_id, object_id) as its conflict target.
+# Stray duplicates, left behind by racing requests, keep their latest row.
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('movies', '0005_movie_keyset_indexes'),
+        ('vote', '0004_auto_20170110_1150'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                DELETE FROM vote_vote a USING vote_vote b
+                WHERE a.user_id = b.user_id
+                  AND a.content_type_id = b.content_type_id
+                  AND a.object_id = b.object_id
+                  AND a.id < b.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            sql="""
+                CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS vote_vote_user_object_uniq
+                ON vote_vote (user_id, content_type_id, object_id);
+            """,
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS vote_vote_user_object_uniq;",
+        ),
+    ]
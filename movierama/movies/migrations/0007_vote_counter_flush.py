@@ -0,0 +1,21 @@
+# Generated by Django 3.2.13 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_vote_user_object_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteCounterFlush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.UUIDField(unique=True)),
+                ('flushed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
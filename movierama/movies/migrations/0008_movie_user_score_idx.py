@@ -0,0 +1,18 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('movies', '0007_vote_counter_flush'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(fields=['user', 'vote_score', 'pub_date', 'id'], name='movie_user_score_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The search vector is kept up to date by a trigger rather than a generated
+# column: adding a stored generated column rewrites the whole table under an
+# exclusive lock, while a nullable column is added at once and backfilled in
+# chunks by the next migration. The trigger only fires when the title or the
+# description is written, not on vote counter updates.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_movie_user_score_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            sql="""
+                CREATE FUNCTION movies_movie_search_vector_update() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector :=
+                        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+                        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER movies_movie_search_vector_update
+                BEFORE INSERT OR UPDATE OF title, description ON movies_movie
+                FOR EACH ROW EXECUTE FUNCTION movies_movie_search_vector_update();
+            """,
+            reverse_sql="""
+                DROP TRIGGER movies_movie_search_vector_update ON movies_movie;
+                DROP FUNCTION movies_movie_search_vector_update();
+            """,
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+# Movies are backfilled by ranges of ids, each range in its own transaction,
+# so that rows are only locked for as long as their chunk takes. Rewriting
+# the title fires the search vector trigger of 0009.
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def backfill_search_vector(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    bounds = Movie.objects.order_by('id').values_list('id', flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(first, last + 1, BACKFILL_CHUNK_SIZE):
+            cursor.execute(
+                """
+                UPDATE movies_movie SET title = title
+                WHERE id >= %s AND id < %s AND search_vector IS NULL
+                """,
+                [start, start + BACKFILL_CHUNK_SIZE],
+            )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('movies', '0009_movie_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=GinIndex(fields=['search_vector'], name='movie_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('movies', '0010_movie_search_vector_backfill'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=GinIndex(fields=['title'], name='movie_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, models
+
+# hot_score = sign(score) * log10(max(|score|, 1)) + (pub_date - epoch) / 45000s
+#
+# A movie needs ten times the score to rank level with one posted 12.5 hours
+# later. The score part is recomputed from the counters as votes shift them,
+# see ``movies.ranking``; the age part is fixed at insert time, relative to the
+# epoch row, which ``rebase_hot_scores`` moves forward. Inserts take a share
+# lock on the epoch row, so that none of them straddles a rebase.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_movie_title_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotScoreEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO movies_hotscoreepoch (epoch) VALUES (now());
+
+                CREATE FUNCTION movies_movie_score_weight(integer) RETURNS double precision
+                AS $$
+                    SELECT sign($1::double precision) * log(greatest(abs($1), 1)::double precision)
+                $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+                CREATE FUNCTION movies_movie_hot_score(integer, timestamptz, timestamptz)
+                RETURNS double precision AS $$
+                    SELECT movies_movie_score_weight($1)
+                        + extract(epoch FROM $2 - $3)::double precision / 45000
+                $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+                CREATE FUNCTION movies_movie_hot_score_insert() RETURNS trigger AS $$
+                DECLARE
+                    origin timestamptz;
+                BEGIN
+                    SELECT epoch INTO origin FROM movies_hotscoreepoch FOR SHARE;
+                    NEW.hot_score := movies_movie_hot_score(NEW.vote_score, NEW.pub_date, origin);
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER movies_movie_hot_score_insert
+                BEFORE INSERT ON movies_movie
+                FOR EACH ROW EXECUTE FUNCTION movies_movie_hot_score_insert();
+            """,
+            reverse_sql="""
+                DROP TRIGGER movies_movie_hot_score_insert ON movies_movie;
+                DROP FUNCTION movies_movie_hot_score_insert();
+                DROP FUNCTION movies_movie_hot_score(integer, timestamptz, timestamptz);
+                DROP FUNCTION movies_movie_score_weight(integer);
+            """,
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+# Same chunking as 0010. Votes cast meanwhile shift the hot score of rows not
+# backfilled yet, which the backfill then recomputes from their counters.
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def backfill_hot_score(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    bounds = Movie.objects.order_by('id').values_list('id', flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(first, last + 1, BACKFILL_CHUNK_SIZE):
+            cursor.execute(
+                """
+                UPDATE movies_movie SET hot_score = movies_movie_hot_score(
+                    vote_score, pub_date, (SELECT epoch FROM movies_hotscoreepoch)
+                )
+                WHERE id >= %s AND id < %s
+                """,
+                [start, start + BACKFILL_CHUNK_SIZE],
+            )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('movies', '0012_hot_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_hot_score, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(fields=['hot_score', 'id'], name='movie_hot_keyset_idx'),
+        ),
+    ]
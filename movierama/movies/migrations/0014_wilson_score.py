@@ -0,0 +1,50 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+# Lower bound of the Wilson score interval of the share of likes, at 95%
+# confidence (z = 1.96), for up likes and down hates:
+#
+#   n = up + down, p = up / n
+#   (p + z²/2n - z * sqrt((p(1 - p) + z²/4n) / n)) / (1 + z²/n)
+#
+# and 0 for movies without votes. Existing movies are filled in by the
+# ``backfill_wilson_scores`` command.
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('movies', '0013_hot_score_backfill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='wilson_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            sql="""
+                CREATE FUNCTION movies_movie_wilson_score(integer, integer)
+                RETURNS double precision AS $$
+                    SELECT CASE WHEN n > 0 THEN
+                        (p + z * z / (2 * n) - z * sqrt((p * (1 - p) + z * z / (4 * n)) / n))
+                        / (1 + z * z / n)
+                    ELSE 0 END
+                    FROM (
+                        SELECT greatest($1, 0)::double precision
+                                / nullif(greatest($1, 0) + greatest($2, 0), 0) AS p,
+                            (greatest($1, 0) + greatest($2, 0))::double precision AS n,
+                            1.96::double precision AS z
+                    ) AS w
+                $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+            """,
+            reverse_sql="DROP FUNCTION movies_movie_wilson_score(integer, integer);",
+        ),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(fields=['wilson_score', 'id'], name='movie_wilson_keyset_idx'),
+        ),
+    ]
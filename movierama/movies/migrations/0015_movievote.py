@@ -0,0 +1,73 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Until every process writes votes to movies_movievote, votes written to
+# django-vote's table are mirrored into it by a trigger; 0016 copies the votes
+# from before. The trigger can go once nothing writes vote_vote anymore.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('movies', '0014_wilson_score'),
+        ('vote', '0004_auto_20170110_1150'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.SmallIntegerField(choices=[(1, 'Like'), (-1, 'Dislike')])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('movie', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='movies.movie')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='movievote',
+            index=models.Index(fields=['user', 'value', 'movie'], name='movievote_user_value_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='movievote',
+            constraint=models.UniqueConstraint(fields=('movie', 'user'), include=('value',), name='movievote_movie_user_uniq'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                CREATE FUNCTION movies_vote_vote_mirror() RETURNS trigger AS $$
+                DECLARE
+                    movie_type integer;
+                BEGIN
+                    SELECT id INTO movie_type FROM django_content_type
+                    WHERE app_label = 'movies' AND model = 'movie';
+                    IF TG_OP <> 'INSERT' AND OLD.content_type_id = movie_type THEN
+                        DELETE FROM movies_movievote
+                        WHERE movie_id = OLD.object_id AND user_id = OLD.user_id;
+                    END IF;
+                    IF TG_OP <> 'DELETE' AND NEW.content_type_id = movie_type THEN
+                        INSERT INTO movies_movievote (movie_id, user_id, value, created_at)
+                        SELECT NEW.object_id, NEW.user_id,
+                            CASE NEW.action WHEN 0 THEN 1 ELSE -1 END, NEW.create_at
+                        WHERE EXISTS (SELECT FROM movies_movie WHERE id = NEW.object_id)
+                          AND EXISTS (SELECT FROM users_user WHERE id = NEW.user_id)
+                        ON CONFLICT (movie_id, user_id) DO UPDATE
+                            SET value = EXCLUDED.value, created_at = EXCLUDED.created_at;
+                    END IF;
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER movies_vote_vote_mirror
+                AFTER INSERT OR UPDATE OR DELETE ON vote_vote
+                FOR EACH ROW EXECUTE FUNCTION movies_vote_vote_mirror();
+            """,
+            reverse_sql="""
+                DROP TRIGGER movies_vote_vote_mirror ON vote_vote;
+                DROP FUNCTION movies_vote_vote_mirror();
+            """,
+        ),
+    ]
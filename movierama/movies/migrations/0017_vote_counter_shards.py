@@ -0,0 +1,28 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0016_movievote_copy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.SmallIntegerField()),
+                ('up', models.IntegerField(default=0)),
+                ('down', models.IntegerField(default=0)),
+                ('movie', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='movies.movie')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='votecountershard',
+            constraint=models.UniqueConstraint(fields=('movie', 'shard'), name='votecountershard_movie_shard_uniq'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0017_vote_counter_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('span', models.PositiveSmallIntegerField(choices=[(1, 'hour'), (24, 'day')], default=1)),
+                ('ups', models.IntegerField(default=0)),
+                ('downs', models.IntegerField(default=0)),
+                ('net', models.IntegerField(default=0)),
+                ('movie', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='movies.movie')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='voterollup',
+            index=models.Index(fields=['bucket', 'net'], include=('movie',), name='voterollup_bucket_net_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='voterollup',
+            constraint=models.UniqueConstraint(fields=('movie', 'bucket', 'span'), name='voterollup_movie_bucket_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0018_vote_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarMovie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('movie', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='similar_movies', to='movies.movie')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='similarmovie',
+            constraint=models.UniqueConstraint(fields=('movie', 'rank'), include=('similar', 'score'), name='similarmovie_movie_rank_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0020_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('movies', 'movies'), ('votes', 'votes')], max_length=10)),
+                ('source', models.CharField(max_length=500)),
+                ('position', models.BigIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importprogress',
+            constraint=models.UniqueConstraint(fields=('kind', 'source'), name='importprogress_kind_source_uniq'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# Tables emptied by TRUNCATE (flush, TransactionTestCase) lose the epoch row;
+# inserts then fall back on the fixed ``ranking.DEFAULT_EPOCH`` instead of
+# a NULL hot score.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0021_import_progress'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION movies_movie_hot_score_insert() RETURNS trigger AS $$
+                DECLARE
+                    origin timestamptz;
+                BEGIN
+                    SELECT epoch INTO origin FROM movies_hotscoreepoch FOR SHARE;
+                    NEW.hot_score := movies_movie_hot_score(
+                        NEW.vote_score, NEW.pub_date,
+                        coalesce(origin, '2022-01-01T00:00:00+00:00'::timestamptz)
+                    );
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+            """,
+            reverse_sql="""
+                CREATE OR REPLACE FUNCTION movies_movie_hot_score_insert() RETURNS trigger AS $$
+                DECLARE
+                    origin timestamptz;
+                BEGIN
+                    SELECT epoch INTO origin FROM movies_hotscoreepoch FOR SHARE;
+                    NEW.hot_score := movies_movie_hot_score(NEW.vote_score, NEW.pub_date, origin);
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+            """,
+        ),
+    ]
@@ -1,7 +1,256 @@
+import re
+
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connection, models
+from django.db.models import (
+    BooleanField,
+    Case,
+    CharField,
+    Exists,
+    F,
+    FloatField,
+    Func,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast
 from django.urls import reverse
-from vote.models import VoteModel
+from vote.models import DOWN, UP, VoteModel
+
+# Values of ``MovieVote.value``
+LIKE = 1
+DISLIKE = -1
+# django-vote's actions, as taken by ``Movie.votes``, and their values
+ACTION_VALUES = {UP: LIKE, DOWN: DISLIKE}
+
+# Text search configuration of ``Movie.search_vector``, as built by the
+# trigger of migration 0009.
+SEARCH_CONFIG = "english"
+
+
+class TrigramWordSimilarity(Func):
+    """``word_similarity(text, field)``, missing from Django before 4.0."""
+
+    function = "WORD_SIMILARITY"
+    output_field = FloatField()
+
+
+class TrigramWordMatch(Func):
+    """
+    ``text <% field``: whether some word of ``field`` is similar enough to
+    ``text``, in the sense of ``word_similarity``. Served by trigram indexes.
+    """
+
+    template = "(%(expressions)s)"
+    arg_joiner = " <%% "
+    output_field = BooleanField()
+
+
+class ScoreWeight(Func):
+    """
+    The vote score part of ``Movie.hot_score``: its sign times the base 10
+    logarithm of its magnitude, as defined in migration 0012.
+    """
+
+    function = "movies_movie_score_weight"
+    output_field = FloatField()
+
+
+class WilsonScore(Func):
+    """
+    The lower bound of the 95% Wilson score interval of the share of likes,
+    given the likes and the hates, as defined in migration 0014.
+    """
+
+    function = "movies_movie_wilson_score"
+    output_field = FloatField()
+
+
+class MovieQuerySet(models.QuerySet):
+    def with_user_vote(self, user_id):
+        """
+        Annotate each movie with ``my_vote``, the vote of ``user_id`` on it
+        ("liked", "disliked" or "have not voted"), read from the vote table
+        in the same query as the movies.
+        """
+        value = MovieVote.objects.filter(movie=OuterRef("pk"), user=user_id).values(
+            "value"
+        )[:1]
+        return self.alias(my_vote_value=Subquery(value)).annotate(
+            my_vote=Case(
+                When(my_vote_value=LIKE, then=Value("liked")),
+                When(my_vote_value=DISLIKE, then=Value("disliked")),
+                default=Value("have not voted"),
+                output_field=CharField(),
+            )
+        )
+
+    def search(self, text):
+        """
+        Filter the movies matching ``text``, in web search syntax (quoted
+        phrases, ``or``, ``-word``), on their title and description. Each movie
+        carries its ``rank``, title matches weighing more than description
+        ones.
+        """
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        # ``ts_rank`` is a real; as a double it survives keyset cursors intact.
+        return self.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+
+    def autocomplete(self, text, limit):
+        """
+        Return the ``limit`` movies whose title best completes ``text``: the
+        titles starting with it or with a word similar to it, most similar
+        and best scored first.
+        """
+        return (
+            self.alias(similarity=TrigramWordSimilarity(Value(text), F("title")))
+            .filter(
+                # Unlike ``istartswith``, a regex is served by trigram indexes.
+                Q(title__iregex=f"^{re.escape(text)}")
+                | Q(TrigramWordMatch(Value(text), F("title")))
+            )
+            .order_by("-similarity", "-vote_score", "id")[:limit]
+        )
+
+    def voted_by(self, user_ids, limit, values=(LIKE, DISLIKE), before=None):
+        """
+        Return the latest ``limit`` movies of each of ``user_ids`` for each
+        vote value in ``values``, in one query. Every movie carries
+        ``voter_id``, ``vote_value`` and ``vote_total``, the number of movies
+        the voter gave that value to. Votes are read off the (user, value,
+        movie) vote index, newest movies first, starting below the movie id
+        ``before`` if given; later batches do not count the votes again, and
+        their ``vote_total`` is None.
+        """
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        votes = connection.ops.quote_name(MovieVote._meta.db_table)
+        if before is None:
+            total = "c.total"
+            count = f"""
+            CROSS JOIN LATERAL (
+                SELECT count(*) AS total FROM {votes}
+                WHERE user_id = u.id AND value = a.value
+            ) AS c"""
+        else:
+            total, count = "NULL::bigint", ""
+        return self.raw(
+            f"""
+            SELECT m.*, u.id AS voter_id, a.value AS vote_value,
+                   {total} AS vote_total
+            FROM unnest(%s::bigint[]) AS u (id)
+            CROSS JOIN unnest(%s::smallint[]) AS a (value){count}
+            CROSS JOIN LATERAL (
+                SELECT movie_id FROM {votes}
+                WHERE user_id = u.id AND value = a.value
+                  AND (%s::bigint IS NULL OR movie_id < %s)
+                ORDER BY movie_id DESC
+                LIMIT %s
+            ) AS v
+            JOIN {table} AS m ON m.id = v.movie_id
+            ORDER BY u.id, a.value DESC, m.id DESC
+            """,
+            [list(user_ids), list(values), before, before, limit],
+        )
+
+
+class MovieVotes:
+    """
+    ``Movie.votes``: the API of django-vote's ``VotableManager``, for the
+    callers written against it, on top of :model:`movies.MovieVote`. Votes
+    cast through it go through ``services.cast_vote``.
+    """
+
+    def __get__(self, instance, owner):
+        if instance is not None and instance.pk is None:
+            raise ValueError(
+                f"{owner.__name__} objects need to have a primary key value "
+                "before you can access their votes."
+            )
+        return MovieVoteManager(owner, instance)
+
+
+class MovieVoteManager:
+    def __init__(self, model, instance):
+        self.model = model
+        self.instance = instance
+
+    def _votes(self):
+        if self.instance is None:
+            raise TypeError("Only available on movie instances, not on Movie.")
+        return MovieVote.objects.filter(movie=self.instance)
+
+    def _cast(self, user_id, vote):
+        from .services import cast_vote
+
+        self._votes()
+        return cast_vote(self.instance, user_id, vote)
+
+    def up(self, user_id):
+        return self._cast(user_id, "like")
+
+    def down(self, user_id):
+        return self._cast(user_id, "dislike")
+
+    def delete(self, user_id):
+        return self._cast(user_id, "remove")
+
+    def get(self, user_id):
+        return self._votes().filter(user=user_id).first()
+
+    def exists(self, user_id, action=UP):
+        return self._votes().filter(user=user_id, value=ACTION_VALUES[action]).exists()
+
+    def all(self, user_id, action=UP):
+        voted = MovieVote.objects.filter(user=user_id, value=ACTION_VALUES[action])
+        return self.model.objects.filter(pk__in=voted.values("movie"))
+
+    def count(self, action=UP):
+        votes = MovieVote.objects.filter(value=ACTION_VALUES[action])
+        if self.instance is not None:
+            votes = votes.filter(movie=self.instance)
+        return votes.count()
+
+    def user_ids(self, action=UP):
+        return (
+            self._votes()
+            .filter(value=ACTION_VALUES[action])
+            .order_by("-created_at")
+            .values_list("user_id", "created_at")
+        )
+
+    def annotate(self, queryset=None, user_id=None, reverse=True, sort=True):
+        if queryset is None:
+            queryset = self.model.objects.all()
+        if sort:
+            queryset = queryset.order_by(
+                "-vote_score" if reverse else "vote_score", "-id"
+            )
+        return self._with_voted(queryset, user_id)
+
+    def vote_by(self, user_id, queryset=None, ids=None):
+        if queryset is None and ids is None:
+            raise ValueError("queryset or ids can not be None")
+        if ids is None:
+            return self._with_voted(queryset, user_id)
+        movies = self._with_voted(self.model.objects.filter(id__in=ids), user_id)
+        return sorted(movies, key=lambda movie: ids.index(movie.id))
+
+    def _with_voted(self, queryset, user_id):
+        # Sets ``is_voted_up`` and ``is_voted_down``, as django-vote does.
+        if user_id is None:
+            return queryset
+        votes = MovieVote.objects.filter(movie=OuterRef("pk"), user=user_id)
+        return queryset.annotate(
+            is_voted_up=Exists(votes.filter(value=LIKE)),
+            is_voted_down=Exists(votes.filter(value=DISLIKE)),
+        )
 
 
 class Movie(VoteModel, models.Model):
@@ -16,9 +265,260 @@ class Movie(VoteModel, models.Model):
         on_delete=models.CASCADE,
     )
     pub_date = models.DateTimeField("date published", auto_now_add=True)
+    # Weighted title and description lexemes, maintained by a trigger.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Vote score decayed by age, see ``ranking.py``. Set by a trigger on
+    # insert, then shifted along with the vote counters.
+    hot_score = models.FloatField(default=0, editable=False)
+    # Confidence that the movie is liked, see ``ranking.py``. Recomputed
+    # along with the vote counters.
+    wilson_score = models.FloatField(default=0, editable=False)
+
+    objects = MovieQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keysets of the paginated movie table, see ``tables.py``.
+            models.Index(
+                fields=["vote_score", "pub_date", "id"], name="movie_score_keyset_idx"
+            ),
+            models.Index(fields=["pub_date", "id"], name="movie_pub_date_keyset_idx"),
+            models.Index(fields=["hot_score", "id"], name="movie_hot_keyset_idx"),
+            models.Index(fields=["wilson_score", "id"], name="movie_wilson_keyset_idx"),
+            # Best movies of each author, see ``views.user_movie_fragment``.
+            models.Index(
+                fields=["user", "vote_score", "pub_date", "id"],
+                name="movie_user_score_idx",
+            ),
+            GinIndex(fields=["search_vector"], name="movie_search_vector_idx"),
+            # Title autocompletion, see ``MovieQuerySet.autocomplete``.
+            GinIndex(
+                fields=["title"],
+                opclasses=["gin_trgm_ops"],
+                name="movie_title_trgm_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
     def get_absolute_url(self):
         return reverse("movies:movie_edit", kwargs={"pk": self.pk})
+
+
+# django-vote's generic relation to its own table is attached to every
+# subclass of ``VoteModel`` after the class body, so its accessor is replaced
+# here. The relation itself stays, to delete legacy votes with their movie.
+Movie.votes = MovieVotes()
+
+
+class MovieVote(models.Model):
+    """
+    The like or dislike of a :model:`users.User` on a :model:`movies.Movie`,
+    one per user and movie.
+
+    Replaces django-vote's generic :model:`vote.Vote` for movies: rows are
+    narrow, cascade with their movie and user, and are read off covering
+    indexes, by movie (with the vote of a user) and by user (with the movies
+    per value).
+    """
+
+    VALUE_CHOICES = [(LIKE, "Like"), (DISLIKE, "Dislike")]
+
+    # Both foreign keys are indexed by the constraint and the index below.
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False
+    )
+    value = models.SmallIntegerField(choices=VALUE_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["movie", "user"],
+                include=["value"],
+                name="movievote_movie_user_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "value", "movie"], name="movievote_user_value_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.get_value_display()} {self.movie_id}"
+
+    @property
+    def action(self):
+        """The django-vote action of the vote."""
+        return UP if self.value == LIKE else DOWN
+
+
+class VoteCounterFlush(models.Model):
+    """
+    Ledger of vote counter batches flushed from the Redis buffer into
+    :model:`movies.Movie`, so that a replayed batch is applied only once.
+    """
+
+    batch = models.UUIDField(unique=True)
+    flushed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return str(self.batch)
+
+
+class VoteCounterShard(models.Model):
+    """
+    Share of the vote counter deltas of a movie not yet folded into
+    :model:`movies.Movie`, one of ``MOVIES_VOTE_SHARDS`` per movie; see
+    ``movies.counters``.
+    """
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, db_index=False)
+    shard = models.SmallIntegerField()
+    up = models.IntegerField(default=0)
+    down = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["movie", "shard"], name="votecountershard_movie_shard_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id}/{self.shard}: +{self.up} -{self.down}"
+
+
+class VoteRollup(models.Model):
+    """
+    The likes and hates a movie got within an hour, or within a day once
+    ``trending.compact_vote_rollups`` folded its hours; see ``movies.trending``.
+    """
+
+    HOUR = 1
+    DAY = 24
+    SPAN_CHOICES = [(HOUR, "hour"), (DAY, "day")]
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, db_index=False)
+    bucket = models.DateTimeField()
+    span = models.PositiveSmallIntegerField(choices=SPAN_CHOICES, default=HOUR)
+    ups = models.IntegerField(default=0)
+    downs = models.IntegerField(default=0)
+    net = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["movie", "bucket", "span"], name="voterollup_movie_bucket_uniq"
+            ),
+        ]
+        indexes = [
+            # Trending lists sum a window of buckets off the index alone.
+            models.Index(
+                fields=["bucket", "net"],
+                include=["movie"],
+                name="voterollup_bucket_net_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id} {self.bucket:%Y-%m-%d %H:00}: {self.net:+d}"
+
+
+class SimilarMovie(models.Model):
+    """
+    The ``rank``-th most similar movie to ``movie`` by the votes of the users
+    who voted both, as built by ``similarity.build_similar_movies``.
+    """
+
+    movie = models.ForeignKey(
+        Movie, on_delete=models.CASCADE, db_index=False, related_name="similar_movies"
+    )
+    rank = models.PositiveSmallIntegerField()
+    similar = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Serves a movie's list from the index alone.
+            models.UniqueConstraint(
+                fields=["movie", "rank"],
+                include=["similar", "score"],
+                name="similarmovie_movie_rank_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id} #{self.rank}: {self.similar_id} ({self.score:.2f})"
+
+
+class Recommendation(models.Model):
+    """
+    The ``rank``-th movie recommended to ``user``, among those they have not
+    voted, as built by ``recommendations.build_recommendations``.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name="movie_recommendations",
+    )
+    rank = models.PositiveSmallIntegerField()
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "rank"],
+                include=["movie", "score"],
+                name="recommendation_user_rank_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} #{self.rank}: {self.movie_id} ({self.score:.2f})"
+
+
+class ImportProgress(models.Model):
+    """
+    How far a bulk import of a file went, committed along with each batch,
+    so that an interrupted import resumes where it stopped; see
+    ``movies.imports``.
+    """
+
+    MOVIES = "movies"
+    VOTES = "votes"
+    KIND_CHOICES = [(MOVIES, "movies"), (VOTES, "votes")]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    source = models.CharField(max_length=500)
+    position = models.BigIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "source"], name="importprogress_kind_source_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} from {self.source}: {self.position}"
+
+
+class HotScoreEpoch(models.Model):
+    """
+    The single row holding the time origin of ``Movie.hot_score``, moved
+    forward by ``ranking.rebase_hot_scores``.
+    """
+
+    epoch = models.DateTimeField()
+
+    def __str__(self):
+        return str(self.epoch)
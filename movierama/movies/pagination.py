@@ -0,0 +1,170 @@
+"""
+Keyset (cursor) pagination for large, index-ordered querysets.
+
+Unlike :class:`django.core.paginator.Paginator`, which counts the whole result
+set and skips rows with ``OFFSET``, a keyset paginator remembers the sort key
+of the last row it served and asks the database for the rows that come right
+after it. With a matching composite index every page is a short index range
+scan, so the cost of a page does not grow with the size of the table.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    """One page of results, with opaque cursors for its neighbours."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` over the key ``ordering``.
+
+    ``ordering`` is a tuple of field or annotation names, all ascending or all
+    descending (e.g. ``("-vote_score", "-pub_date", "-id")``), that must end in
+    a unique field so that every row has a distinct key. Cursors are tied to the
+    ordering they were issued for; a cursor from another ordering is rejected.
+    """
+
+    def __init__(self, queryset, ordering, per_page=25):
+        directions = {field.startswith("-") for field in ordering}
+        if len(directions) != 1:
+            raise ValueError("Keyset ordering fields must share one direction.")
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip("-") for field in ordering)
+        self.descending = directions.pop()
+        self.per_page = per_page
+
+    def get_page(self, cursor=None):
+        """
+        Return the page for ``cursor``, or the first page if ``cursor`` is
+        empty or invalid.
+        """
+        try:
+            position = self.decode_cursor(cursor) if cursor else None
+        except InvalidCursor:
+            position = None
+
+        if position is None:
+            return self._page_after(None)
+        direction, key = position
+        if direction == "prev":
+            return self._page_before(key)
+        return self._page_after(key)
+
+    def _page_after(self, key):
+        queryset = self.queryset.order_by(*self.ordering)
+        if key is not None:
+            queryset = queryset.filter(self._seek(key, forward=True))
+        rows = list(queryset[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        return KeysetPage(
+            rows,
+            next_cursor=self._cursor("next", rows[-1]) if has_more else None,
+            previous_cursor=self._cursor("prev", rows[0])
+            if key is not None and rows
+            else None,
+        )
+
+    def _page_before(self, key):
+        reverse = tuple(self._flip(field) for field in self.ordering)
+        queryset = self.queryset.order_by(*reverse).filter(
+            self._seek(key, forward=False)
+        )
+        rows = list(queryset[: self.per_page + 1])
+        if not rows:
+            return self._page_after(None)
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=self._cursor("next", rows[-1]),
+            previous_cursor=self._cursor("prev", rows[0]) if has_more else None,
+        )
+
+    def _seek(self, key, forward):
+        """
+        Build ``(f1, f2, ...) > (k1, k2, ...)`` (or ``<``) as nested ``Q``
+        objects, led by a ``f1 >= k1`` bound so that the planner can start an
+        index range scan on the leading column.
+        """
+        after = forward != self.descending
+        strict, loose = ("gt", "gte") if after else ("lt", "lte")
+
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            equal = {name: key[j] for j, name in enumerate(self.fields[:i])}
+            condition |= Q(**equal, **{f"{field}__{strict}": key[i]})
+        return Q(**{f"{self.fields[0]}__{loose}": key[0]}) & condition
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def _cursor(self, direction, obj):
+        key = [self._dump(getattr(obj, field)) for field in self.fields]
+        payload = json.dumps({"o": list(self.ordering), "d": direction, "k": key})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            ordering, direction, key = payload["o"], payload["d"], payload["k"]
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor(cursor)
+        if tuple(ordering) != self.ordering or direction not in ("next", "prev"):
+            raise InvalidCursor(cursor)
+        if not isinstance(key, list) or len(key) != len(self.fields):
+            raise InvalidCursor(cursor)
+        return direction, [
+            self._load(field, value) for field, value in zip(self.fields, key)
+        ]
+
+    @staticmethod
+    def _dump(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    def _load(self, field, value):
+        # Keys hold scalars only; a forged cursor may hold anything.
+        if value is None or isinstance(value, (list, dict)):
+            raise InvalidCursor(value)
+        annotation = self.queryset.query.annotations.get(field)
+        if annotation is not None:
+            model_field = annotation.output_field
+        else:
+            model_field = self.queryset.model._meta.get_field(field)
+        try:
+            return model_field.to_python(value)
+        except (ValidationError, TypeError):
+            raise InvalidCursor(value)
@@ -0,0 +1,127 @@
+"""
+Stored rankings of movies: time-decayed "hot" and Wilson score "best".
+
+``Movie.hot_score`` is the sign of the vote score times its base 10
+logarithm, plus the age of the movie relative to an epoch, in units of 12.5
+hours (see migration 0012). The age part is set once, on insert. Counter
+updates shift the score part by :func:`hot_score_shift` in the same
+statement, so the column is always current and a "Hot" page is a plain
+index scan.
+
+The epoch is only an origin: moving it shifts every hot score alike and
+leaves the ranking as it is. :func:`rebase_hot_scores` moves it to the
+present every now and then, so that the scores of recent movies stay close
+to zero instead of growing by two a day. Without an epoch row, as after a
+``flush``, movies are scored against :data:`DEFAULT_EPOCH` until the next
+rebase.
+
+``Movie.wilson_score`` is the lower bound of the Wilson score confidence
+interval of the share of likes (see migration 0014): 2 likes out of 2 score
+0.34, 900 out of 1000 score 0.88. It depends on the counters alone, and is
+recomputed from their new values by the statements that change them.
+"""
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import HotScoreEpoch, Movie, ScoreWeight, WilsonScore
+
+# The epoch of hot scores when there is no epoch row; see migration 0022.
+DEFAULT_EPOCH = datetime(2022, 1, 1, tzinfo=dt_timezone.utc)
+# How many movies :func:`backfill_wilson_scores` updates per statement.
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def hot_score_shift(score_delta):
+    """
+    The change of ``hot_score`` when ``vote_score`` changes by
+    ``score_delta``, for use in an update along with the counters.
+    """
+    return ScoreWeight(F("vote_score") + score_delta) - ScoreWeight(F("vote_score"))
+
+
+def wilson_score_after(up, down):
+    """
+    ``wilson_score`` once the counters change by ``up`` likes and ``down``
+    hates, for use in the update of the counters.
+    """
+    return WilsonScore(F("num_vote_up") + up, F("num_vote_down") + down)
+
+
+def backfill_wilson_scores(chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Recompute the Wilson scores of all movies from their counters, one range
+    of ids per statement and transaction, writing only the rows that change.
+    Return the number of movies updated.
+    """
+    table = connection.ops.quote_name(Movie._meta.db_table)
+    bounds = Movie.objects.order_by("id").values_list("id", flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return 0
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(first, last + 1, chunk_size):
+            with transaction.atomic():
+                cursor.execute(
+                    f"""
+                    UPDATE {table} SET wilson_score = w.score
+                    FROM (
+                        SELECT id, movies_movie_wilson_score(
+                            num_vote_up, num_vote_down
+                        ) AS score
+                        FROM {table}
+                        WHERE id >= %s AND id < %s
+                    ) AS w
+                    WHERE {table}.id = w.id
+                      AND {table}.wilson_score IS DISTINCT FROM w.score
+                    """,
+                    [start, start + chunk_size],
+                )
+                updated += cursor.rowcount
+    return updated
+
+
+def rebase_hot_scores(epoch=None, chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Move the epoch of hot scores to ``epoch``, now by default, and recompute
+    every hot score against it, one range of ids per statement and
+    transaction. Return the number of movies updated.
+
+    Each transaction locks its range of movies only, so votes wait on one
+    chunk at most. Until the last chunk commits, the movies of the ranges not
+    yet done rank a constant behind (or ahead of) the others, as during the
+    backfill of migration 0013.
+    """
+    epoch = epoch or timezone.now()
+    table = connection.ops.quote_name(Movie._meta.db_table)
+    with transaction.atomic():
+        # Waits for the inserts in progress; those that follow use the new
+        # epoch.
+        origin, _ = HotScoreEpoch.objects.select_for_update().get_or_create(
+            defaults={"epoch": DEFAULT_EPOCH}
+        )
+        origin.epoch = epoch
+        origin.save(update_fields=["epoch"])
+
+    bounds = Movie.objects.order_by("id").values_list("id", flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return 0
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(first, last + 1, chunk_size):
+            with transaction.atomic():
+                cursor.execute(
+                    f"""
+                    UPDATE {table}
+                    SET hot_score = movies_movie_hot_score(vote_score, pub_date, %s)
+                    WHERE id >= %s AND id < %s
+                    """,
+                    [epoch, start, start + chunk_size],
+                )
+                updated += cursor.rowcount
+    return updated
@@ -0,0 +1,110 @@
+"""
+Precomputed "movies you may like" per user.
+
+A user's recommendations are the movies similar to the ones they voted,
+taken from :model:`movies.SimilarMovie` (see ``movies.similarity``): each
+candidate scores the sum of its similarities to the user's likes, minus
+those to their hates, and the top :data:`RECOMMENDATIONS` they have neither
+voted nor submitted are kept in :model:`movies.Recommendation`, where a page
+reads them off the (user, rank) index.
+
+:func:`build_recommendations` rebuilds those of the users active lately, a
+chunk of users per statement and transaction, spreading the chunks over a
+pool of processes, each with a database connection of its own.
+"""
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connection, connections, transaction
+
+from movierama.users.models import User
+
+from .models import Movie, MovieVote, Recommendation, SimilarMovie
+
+# How many movies are recommended per user.
+RECOMMENDATIONS = 20
+# How many users are computed per statement.
+BUILD_CHUNK_SIZE = 200
+
+
+def build_recommendations(
+    active_since, workers=1, chunk_size=BUILD_CHUNK_SIZE, top=RECOMMENDATIONS
+):
+    """
+    Rebuild the recommendations of the users signed in since
+    ``active_since``, over ``workers`` processes. Return a dict of the number
+    of ``users`` and ``recommendations`` stored, the wall clock ``seconds``
+    and the peak resident memory in kilobytes of this process,
+    ``max_rss_kb``, and of its largest worker, ``worker_max_rss_kb``.
+    """
+    start = time.monotonic()
+    user_ids = list(
+        User.objects.filter(last_login__gte=active_since)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    chunks = []
+    for i in range(0, len(user_ids), chunk_size):
+        end = i + chunk_size
+        chunks.append((user_ids[i:end], top))
+    if workers > 1 and len(chunks) > 1:
+        # Forked workers inherit the loaded apps and settings, but must not
+        # share the database connection of this process.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=connections.close_all,
+        ) as pool:
+            stored = sum(pool.map(_recommend, chunks))
+    else:
+        stored = sum(map(_recommend, chunks))
+    return {
+        "users": len(user_ids),
+        "recommendations": stored,
+        "seconds": time.monotonic() - start,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "worker_max_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+def _recommend(chunk):
+    user_ids, top = chunk
+    movies = connection.ops.quote_name(Movie._meta.db_table)
+    votes = connection.ops.quote_name(MovieVote._meta.db_table)
+    similar = connection.ops.quote_name(SimilarMovie._meta.db_table)
+    table = connection.ops.quote_name(Recommendation._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE user_id = ANY(%s)", [user_ids])
+        cursor.execute(
+            f"""
+            WITH scored AS (
+                SELECT v.user_id, s.similar_id AS movie_id,
+                       sum(v.value * s.score) AS score
+                FROM {votes} AS v
+                JOIN {similar} AS s ON s.movie_id = v.movie_id
+                WHERE v.user_id = ANY(%s)
+                GROUP BY v.user_id, s.similar_id
+                HAVING sum(v.value * s.score) > 0
+            ), ranked AS (
+                SELECT c.*, row_number() OVER (
+                    PARTITION BY c.user_id ORDER BY c.score DESC, c.movie_id DESC
+                ) AS rank
+                FROM scored AS c
+                JOIN {movies} AS m ON m.id = c.movie_id
+                WHERE m.user_id <> c.user_id
+                  AND NOT EXISTS (
+                    SELECT FROM {votes} AS v
+                    WHERE v.movie_id = c.movie_id AND v.user_id = c.user_id
+                  )
+            )
+            INSERT INTO {table} (user_id, rank, movie_id, score)
+            SELECT user_id, rank, movie_id, score
+            FROM ranked
+            WHERE rank <= %s
+            """,
+            [user_ids, top],
+        )
+        return cursor.rowcount
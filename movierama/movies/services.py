@@ -0,0 +1,126 @@
+"""
+Write path for movie votes.
+
+A vote is applied as one upsert (or delete) on :model:`movies.MovieVote`
+followed by one relative update of the movie's counters, in a short
+transaction. This replaces django-vote's ``votes.up()`` / ``votes.down()`` /
+``votes.delete()``, which lock the movie row, re-read it and save every
+counter on every call.
+With ``MOVIES_VOTE_BUFFER`` on, the counter update goes through the Redis
+buffer of ``movies.counters`` instead, and with ``MOVIES_VOTE_SHARDS`` set,
+through its sharded counters.
+
+A vote does not queue behind the locks of a busy movie: it gives up after
+``MOVIES_VOTE_LOCK_TIMEOUT`` milliseconds, and is tried again after a short
+random pause, up to ``MOVIES_VOTE_ATTEMPTS`` times in all, before
+:class:`VoteContention` is raised.
+"""
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from psycopg2 import errorcodes
+
+from movierama.utils.transactions import atomic
+
+from . import counters
+from .models import DISLIKE, LIKE, Movie, MovieVote
+from .ranking import hot_score_shift, wilson_score_after
+from .signals import votes_changed
+from .trending import add_to_rollups
+
+VOTE_VALUES = {"like": LIKE, "dislike": DISLIKE, "remove": None}
+# Base pause between two attempts of a vote, in seconds, doubled each time.
+VOTE_RETRY_DELAY = 0.05
+
+# Insert the vote, or switch an existing vote to the other value. The
+# ``WHERE`` clause turns a repeated vote into a no-op that returns no row, and
+# ``xmax = 0`` tells a fresh insert apart from a switch.
+UPSERT_VOTE_SQL = """
+    INSERT INTO {table} (user_id, movie_id, value, created_at)
+    VALUES (%s, %s, %s, now())
+    ON CONFLICT (movie_id, user_id) DO UPDATE
+        SET value = EXCLUDED.value, created_at = EXCLUDED.created_at
+        WHERE {table}.value <> EXCLUDED.value
+    RETURNING (xmax = 0)
+"""
+DELETE_VOTE_SQL = """
+    DELETE FROM {table}
+    WHERE user_id = %s AND movie_id = %s
+    RETURNING value
+"""
+
+
+class VoteContention(Exception):
+    """The movie was too busy to take the vote; it may be tried again later."""
+
+
+def cast_vote(movie, user_id, vote):
+    """
+    Apply ``vote`` ("like", "dislike" or "remove") of ``user_id`` on
+    ``movie``. Return whether anything changed; repeating the current vote
+    writes nothing.
+    """
+    attempts = settings.MOVIES_VOTE_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        try:
+            return _cast_vote(movie, user_id, VOTE_VALUES[vote])
+        except OperationalError as e:
+            if getattr(e.__cause__, "pgcode", None) != errorcodes.LOCK_NOT_AVAILABLE:
+                raise
+            if attempt == attempts:
+                raise VoteContention(movie.pk) from e
+        # Full jitter, so that the retries of colliding votes spread out.
+        time.sleep(random.uniform(0, VOTE_RETRY_DELAY * 2 ** (attempt - 1)))
+
+
+def _cast_vote(movie, user_id, value):
+    table = connection.ops.quote_name(MovieVote._meta.db_table)
+    params = [user_id, movie.pk]
+
+    with atomic(lock_timeout=settings.MOVIES_VOTE_LOCK_TIMEOUT):
+        with connection.cursor() as cursor:
+            if value is None:
+                cursor.execute(DELETE_VOTE_SQL.format(table=table), params)
+            else:
+                cursor.execute(UPSERT_VOTE_SQL.format(table=table), params + [value])
+            row = cursor.fetchone()
+        if row is None:
+            return False
+
+        if value is None:
+            delta = {row[0]: -1}
+        elif row[0]:
+            delta = {value: 1}
+        else:
+            delta = {value: 1, -value: -1}
+        apply_vote_delta(movie.pk, delta.get(LIKE, 0), delta.get(DISLIKE, 0))
+        transaction.on_commit(
+            lambda: votes_changed.send(sender=Movie, movie_ids=[movie.pk])
+        )
+    return True
+
+
+def apply_vote_delta(movie_id, up, down):
+    """
+    Shift the counters of a movie by ``up`` likes and ``down`` hates, or
+    leave the delta in the Redis buffer once the vote has committed, or in a
+    counter shard of the movie. The hourly rollup of the movie follows the
+    counters.
+    """
+    if counters.buffer_enabled():
+        transaction.on_commit(lambda: counters.buffer_vote_delta(movie_id, up, down))
+        return
+    if counters.shards_enabled():
+        counters.add_to_vote_shard(movie_id, up, down)
+        return
+    Movie.objects.filter(pk=movie_id).update(
+        num_vote_up=F("num_vote_up") + up,
+        num_vote_down=F("num_vote_down") + down,
+        vote_score=F("vote_score") + (up - down),
+        hot_score=F("hot_score") + hot_score_shift(up - down),
+        wilson_score=wilson_score_after(up, down),
+    )
+    add_to_rollups([(movie_id, up, down)])
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .cache import bump_list_generation, bump_row_versions, bump_user_generation
+from .models import Movie
+
+# Sent once the counters of movies have changed, with ``movie_ids``: after a
+# vote commits, or after buffered counters are flushed.
+votes_changed = Signal()
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def invalidate_movie(sender, instance, **kwargs):
+    bump_row_versions([instance.pk])
+    bump_list_generation()
+    bump_user_generation()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which the user pages do not show.
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    bump_user_generation()
+
+
+@receiver(votes_changed)
+def invalidate_voted_movies(sender, movie_ids, **kwargs):
+    bump_row_versions(movie_ids)
+    bump_list_generation()
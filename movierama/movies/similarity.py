@@ -0,0 +1,120 @@
+"""
+Item-item "similar movies", from the votes of the users who voted both.
+
+Each movie is a sparse vector of its votes, +1 or -1 per user. The similarity
+of two movies is the cosine of their vectors: the sum of the products of the
+votes of their common voters, over the square root of the product of their
+vote counts (the squared norms of ±1 vectors), counted from the same votes.
+:func:`build_similar_movies` computes the products of a chunk of movies with
+all others in one statement, joining the votes of the chunk to every other
+vote of their voters on the vote indexes, and keeps the top
+:data:`SIMILAR_MOVIES` with a positive score in :model:`movies.SimilarMovie`.
+The vote matrix never leaves the database, and each chunk is a statement and
+transaction of its own, so memory and lock times are bounded by the chunk.
+
+:func:`refresh_similar_movies` rebuilds the lists of the movies voted on
+since a given time, found from the hourly vote rollups. The other movies
+similar to those only see the change at the next full build.
+"""
+from datetime import timezone
+
+from django.db import connection, transaction
+
+from .models import Movie, MovieVote, SimilarMovie, VoteRollup
+
+# How many similar movies are kept per movie.
+SIMILAR_MOVIES = 10
+# How many movies are computed per statement.
+BUILD_CHUNK_SIZE = 500
+
+
+def build_similar_movies(
+    movie_ids=None, chunk_size=BUILD_CHUNK_SIZE, top=SIMILAR_MOVIES
+):
+    """
+    Rebuild the similar movies of ``movie_ids``, or of all movies, a chunk
+    of movies per transaction. Return the number of similar movies stored.
+    """
+    votes = connection.ops.quote_name(MovieVote._meta.db_table)
+    similar = connection.ops.quote_name(SimilarMovie._meta.db_table)
+    stored = 0
+    for condition, params in _chunks(movie_ids, chunk_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {similar} WHERE {condition.format('movie_id')}", params
+            )
+            cursor.execute(
+                f"""
+                WITH pairs AS (
+                    SELECT a.movie_id, b.movie_id AS similar_id,
+                           sum(a.value * b.value) AS dot
+                    FROM {votes} AS a
+                    JOIN {votes} AS b
+                        ON b.user_id = a.user_id AND b.movie_id <> a.movie_id
+                    WHERE {condition.format('a.movie_id')}
+                    GROUP BY a.movie_id, b.movie_id
+                    HAVING sum(a.value * b.value) > 0
+                ), norms AS (
+                    -- In the statement's snapshot, like the products, rather
+                    -- than from the counters, which a vote may have changed
+                    -- since.
+                    SELECT movie_id, count(*) AS votes
+                    FROM {votes}
+                    WHERE movie_id IN (
+                        SELECT movie_id FROM pairs
+                        UNION SELECT similar_id FROM pairs
+                    )
+                    GROUP BY movie_id
+                ), scored AS (
+                    SELECT p.movie_id, p.similar_id,
+                           least(p.dot / sqrt(na.votes::float * nb.votes), 1) AS score
+                    FROM pairs AS p
+                    JOIN norms AS na ON na.movie_id = p.movie_id
+                    JOIN norms AS nb ON nb.movie_id = p.similar_id
+                ), ranked AS (
+                    SELECT *, row_number() OVER (
+                        PARTITION BY movie_id ORDER BY score DESC, similar_id DESC
+                    ) AS rank
+                    FROM scored
+                )
+                INSERT INTO {similar} (movie_id, rank, similar_id, score)
+                SELECT movie_id, rank, similar_id, score
+                FROM ranked
+                WHERE rank <= %s
+                """,
+                params + [top],
+            )
+            stored += cursor.rowcount
+    return stored
+
+
+def refresh_similar_movies(since, **kwargs):
+    """
+    Rebuild the similar movies of the movies voted on since ``since``.
+    Return the number of similar movies stored.
+    """
+    # Rollups are by the hour, in UTC.
+    since = since.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    movie_ids = (
+        VoteRollup.objects.filter(bucket__gte=since)
+        .values_list("movie", flat=True)
+        .distinct()
+    )
+    return build_similar_movies(list(movie_ids), **kwargs)
+
+
+def _chunks(movie_ids, chunk_size):
+    # A condition on a movie id column, and its parameters.
+    if movie_ids is None:
+        bounds = Movie.objects.order_by("id").values_list("id", flat=True)
+        first, last = bounds.first(), bounds.last()
+        if first is None:
+            return
+        for start in range(first, last + 1, chunk_size):
+            yield "{0} >= %s AND {0} < %s", [start, start + chunk_size]
+    else:
+        movie_ids = sorted(set(movie_ids))
+        for start in range(0, len(movie_ids), chunk_size):
+            end = start + chunk_size
+            chunk = movie_ids[start:end]
+            yield "{0} = ANY(%s)", [chunk]
@@ -0,0 +1,53 @@
+import django_tables2 as tables
+from django.conf import settings
+
+from .models import Movie
+
+# Sort keys the movie table accepts, mapped to the keyset each one paginates
+# over. Every keyset is backed by a composite index on ``Movie``, and ends in
+# ``id`` so that rows with equal scores or dates still have a stable order.
+MOVIE_TABLE_ORDERINGS = {
+    "-hot_score": ("-hot_score", "-id"),
+    "-wilson_score": ("-wilson_score", "-id"),
+    "-vote_score": ("-vote_score", "-pub_date", "-id"),
+    "vote_score": ("vote_score", "pub_date", "id"),
+    "-pub_date": ("-pub_date", "-id"),
+    "pub_date": ("pub_date", "id"),
+}
+MOVIE_TABLE_DEFAULT_ORDERING = "-vote_score"
+
+
+class MovieTable(tables.Table):
+    """
+    All movies, sortable only on the indexed score and date columns.
+
+    The table is given a single, already sorted page of movies; sorting and
+    paging happen in the database through the keysets above. Rendered rows are
+    cached per movie version, see ``cache.annotate_row_versions``.
+    """
+
+    cache_timeout = settings.MOVIES_CACHE_TIMEOUT
+
+    title = tables.Column(linkify=("movies:movie_detail", [tables.A("pk")]))
+    user = tables.Column(accessor="user__username", verbose_name="Submitted by")
+    num_vote_up = tables.Column(verbose_name="Likes")
+    num_vote_down = tables.Column(verbose_name="Hates")
+    vote_score = tables.Column(
+        verbose_name="Score", orderable=True, order_by=("vote_score", "pub_date", "id")
+    )
+    pub_date = tables.DateTimeColumn(orderable=True, order_by=("pub_date", "id"))
+
+    class Meta:
+        model = Movie
+        fields = (
+            "title",
+            "description",
+            "user",
+            "num_vote_up",
+            "num_vote_down",
+            "vote_score",
+            "pub_date",
+        )
+        orderable = False
+        template_name = "movies/movie_table.html"
+        empty_text = "No movies yet."
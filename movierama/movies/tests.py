@@ -1,8 +1,71 @@
-from django.test import Client, TestCase
+import base64
+import csv
+import gzip
+import json
+import math
+import os
+import tempfile
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest.mock import patch
+
+import fakeredis
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import (
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from vote.models import DOWN, UP, Vote
 
 from movierama.users.models import User
 
-from .models import Movie
+from .cache import annotate_row_versions, cache_anonymous_page, cache_stats, get_cache
+from .counters import (
+    compact_vote_shards,
+    flush_vote_buffer,
+    pending_vote_deltas,
+    reconcile_vote_counts,
+    with_pending_votes,
+)
+from .imports import import_movies, import_votes
+from .models import (
+    DISLIKE,
+    LIKE,
+    HotScoreEpoch,
+    ImportProgress,
+    Movie,
+    MovieVote,
+    Recommendation,
+    SimilarMovie,
+    VoteCounterShard,
+    VoteRollup,
+)
+from .ranking import DEFAULT_EPOCH, backfill_wilson_scores, rebase_hot_scores
+from .recommendations import build_recommendations
+from .services import VoteContention, cast_vote
+from .similarity import build_similar_movies, refresh_similar_movies
+from .trending import compact_vote_rollups, trending_movies
+
+
+def select_queries(queries):
+    """The SELECT statements of a captured request, without savepoints"""
+    return [
+        q["sql"]
+        for q in queries.captured_queries
+        if q["sql"].lstrip().startswith("SELECT")
+    ]
 
 
 class TestMovieViews(TestCase):
@@ -250,3 +313,1369 @@ class TestMovieViews(TestCase):
         self.assertEqual(response.status_code, 200)
         # Check the movie is not in the response.
         self.assertNotContains(response, "Test Movie")
+
+
+class TestMovieListPagination(TestCase):
+    """Keyset paging and sorting of the public movies table"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        # Five movies with scores 0..4
+        for i in range(5):
+            Movie.objects.create(
+                title=f"Movie {i}",
+                description="Description",
+                user=self.user,
+                num_vote_up=i,
+            )
+
+    def titles(self, response):
+        return [movie.title for movie in response.context["page_obj"]]
+
+    @patch("movierama.movies.views.MOVIES_PER_PAGE", 2)
+    def test_walk_pages_forward_and_back(self):
+        # First page holds the two best scored movies
+        response = self.client.get("/movies/")
+        self.assertEqual(self.titles(response), ["Movie 4", "Movie 3"])
+        page = response.context["page_obj"]
+        self.assertFalse(page.has_previous())
+
+        # Follow the next cursor twice, to the last page
+        response = self.client.get("/movies/", {"cursor": page.next_cursor})
+        self.assertEqual(self.titles(response), ["Movie 2", "Movie 1"])
+        response = self.client.get(
+            "/movies/", {"cursor": response.context["page_obj"].next_cursor}
+        )
+        self.assertEqual(self.titles(response), ["Movie 0"])
+        page = response.context["page_obj"]
+        self.assertFalse(page.has_next())
+
+        # And back again
+        response = self.client.get("/movies/", {"cursor": page.previous_cursor})
+        self.assertEqual(self.titles(response), ["Movie 2", "Movie 1"])
+
+    @patch("movierama.movies.views.MOVIES_PER_PAGE", 2)
+    def test_sort_by_date_and_reject_foreign_cursor(self):
+        response = self.client.get("/movies/", {"sort": "pub_date"})
+        self.assertEqual(self.titles(response), ["Movie 0", "Movie 1"])
+        cursor = response.context["page_obj"].next_cursor
+
+        # A cursor issued for another ordering starts over from the first page
+        response = self.client.get(
+            "/movies/", {"sort": "-vote_score", "cursor": cursor}
+        )
+        self.assertEqual(self.titles(response), ["Movie 4", "Movie 3"])
+        # So does garbage, and sorting on a column without an index is ignored
+        response = self.client.get("/movies/", {"sort": "title", "cursor": "garbage"})
+        self.assertEqual(self.titles(response), ["Movie 4", "Movie 3"])
+
+    @patch("movierama.movies.views.MOVIES_PER_PAGE", 2)
+    def test_forged_cursor_starts_over(self):
+        response = self.client.get("/movies/", {"sort": "-pub_date"})
+        first_page = self.titles(response)
+        cursor = response.context["page_obj"].next_cursor
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        for key in ([[1], 1], [{"a": 1}, 1]):
+            payload["k"] = key
+            forged = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            response = self.client.get(
+                "/movies/", {"sort": "-pub_date", "cursor": forged}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.titles(response), first_page)
+
+    def test_page_cost_is_constant(self):
+        # One query for the page, author included
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/movies/")
+        self.assertEqual(len(select_queries(queries)), 1)
+
+
+class TestVoteMovies(TestCase):
+    """The vote state of the logged in user is read along with the movies"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="12345")
+        self.liked, self.disliked, self.unvoted = [
+            Movie.objects.create(
+                title=title, description="Description", user=self.author
+            )
+            for title in ("Liked Movie", "Disliked Movie", "Unvoted Movie")
+        ]
+        self.voter = User.objects.create_user(username="voter", password="12345")
+        self.liked.votes.up(self.voter.id)
+        self.disliked.votes.down(self.voter.id)
+        self.client.login(username="voter", password="12345")
+
+    def test_my_vote_annotation(self):
+        movies = Movie.objects.with_user_vote(self.voter.id)
+        self.assertEqual(movies.get(pk=self.liked.pk).my_vote, "liked")
+        self.assertEqual(movies.get(pk=self.disliked.pk).my_vote, "disliked")
+        self.assertEqual(movies.get(pk=self.unvoted.pk).my_vote, "have not voted")
+
+    def test_vote_movies_query_count_does_not_grow(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/movies/vote_movies/")
+        self.assertContains(response, "You liked!")
+        self.assertContains(response, "You disliked!")
+        self.assertContains(response, "You have not voted!")
+        baseline = len(select_queries(queries))
+
+        for i in range(10):
+            Movie.objects.create(
+                title=f"Movie {i}", description="Description", user=self.author
+            )
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/movies/vote_movies/")
+        self.assertEqual(len(select_queries(queries)), baseline)
+
+
+class TestCastVote(TestCase):
+    """The vote upsert keeps votes and counters in step"""
+
+    def setUp(self):
+        author = User.objects.create_user(username="author", password="12345")
+        self.voter = User.objects.create_user(username="voter", password="12345")
+        self.movie = Movie.objects.create(
+            title="Test Movie", description="Description", user=author
+        )
+
+    def assertCounters(self, up, down):
+        self.movie.refresh_from_db()
+        self.assertEqual(
+            (self.movie.num_vote_up, self.movie.num_vote_down, self.movie.vote_score),
+            (up, down, up - down),
+        )
+
+    def test_like_switch_and_remove(self):
+        self.assertTrue(cast_vote(self.movie, self.voter.id, "like"))
+        self.assertCounters(1, 0)
+        self.assertTrue(self.movie.votes.exists(self.voter.id, action=UP))
+
+        self.assertTrue(cast_vote(self.movie, self.voter.id, "dislike"))
+        self.assertCounters(0, 1)
+        self.assertTrue(self.movie.votes.exists(self.voter.id, action=DOWN))
+        self.assertFalse(self.movie.votes.exists(self.voter.id, action=UP))
+
+        self.assertTrue(cast_vote(self.movie, self.voter.id, "remove"))
+        self.assertCounters(0, 0)
+        self.assertIsNone(self.movie.votes.get(self.voter.id))
+
+    def test_repeated_vote_writes_nothing(self):
+        cast_vote(self.movie, self.voter.id, "like")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(cast_vote(self.movie, self.voter.id, "like"))
+        self.assertCounters(1, 0)
+
+        cast_vote(self.movie, self.voter.id, "remove")
+        with CaptureQueriesContext(connection) as more_queries:
+            self.assertFalse(cast_vote(self.movie, self.voter.id, "remove"))
+        self.assertCounters(0, 0)
+
+        # Neither repeat reached the movie counters
+        for query in queries.captured_queries + more_queries.captured_queries:
+            self.assertNotIn('UPDATE "movies_movie"', query["sql"])
+
+
+@override_settings(MOVIES_VOTE_LOCK_TIMEOUT=50, MOVIES_VOTE_ATTEMPTS=2)
+class TestVoteContention(TransactionTestCase):
+    """Votes on a locked movie give up quickly instead of queueing"""
+
+    # The lock is held by a second connection, which only sees committed
+    # rows; the flush between tests must keep the rows of the migrations.
+    serialized_rollback = True
+
+    def setUp(self):
+        author = User.objects.create_user(username="author", password="12345")
+        self.voter = User.objects.create_user(username="voter", password="12345")
+        self.movie = Movie.objects.create(title="Movie", description="-", user=author)
+
+    def lock_movie(self):
+        other = connections.create_connection("default")
+        self.addCleanup(other.close)
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM movies_movie WHERE id = %s FOR UPDATE", [self.movie.pk]
+            )
+        return other
+
+    def test_vote_on_a_locked_movie(self):
+        other = self.lock_movie()
+        with patch("movierama.movies.services.time.sleep") as sleep:
+            with self.assertRaises(VoteContention):
+                cast_vote(self.movie, self.voter.id, "like")
+        self.assertEqual(sleep.call_count, 1)
+        self.assertFalse(MovieVote.objects.exists())
+
+        other.rollback()
+        self.assertTrue(cast_vote(self.movie, self.voter.id, "like"))
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.num_vote_up, 1)
+
+    def test_vote_view_asks_to_retry(self):
+        self.client.login(username="voter", password="12345")
+        self.lock_movie()
+        response = self.client.post(
+            f"/movies/movie_vote/{self.movie.pk}/", {"vote": "like"}
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertContains(response, "busy", status_code=503)
+
+    def test_bench_transaction_hold(self):
+        cast_vote(self.movie, self.voter.id, "dislike")
+        out = StringIO()
+        call_command(
+            "bench_transaction_hold", "voter", requests=1, host="testserver", stdout=out
+        )
+        rows = {line.split()[0]: line.split() for line in out.getvalue().splitlines()}
+        self.assertEqual(
+            set(rows),
+            {
+                "view",
+                "movie_list",
+                "vote_movies",
+                "my_movie_list",
+                "user_vote_list",
+                "movie_vote",
+            },
+        )
+        # Reads hold no transaction any more
+        self.assertEqual(rows["movie_list"][-1], "0.0ms")
+        # The bench voted as a user of its own, on a movie of its own, both gone
+        self.assertEqual(
+            list(MovieVote.objects.values_list("user", "movie", "value")),
+            [(self.voter.id, self.movie.pk, DISLIKE)],
+        )
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(list(Movie.objects.all()), [self.movie])
+
+
+@override_settings(MOVIES_VOTE_BUFFER=True)
+class TestVoteBuffer(TestCase):
+    """Vote counters buffered in (fake) Redis and flushed in batches"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = patch("movierama.movies.counters.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        author = User.objects.create_user(username="author", password="12345")
+        self.movie = Movie.objects.create(
+            title="Test Movie", description="Description", user=author
+        )
+        self.voters = [
+            User.objects.create_user(username=f"voter{i}", password="12345")
+            for i in range(3)
+        ]
+
+    def vote(self, voter, vote):
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.movie, voter.id, vote)
+
+    def test_votes_are_buffered_and_merged_on_read(self):
+        self.vote(self.voters[0], "like")
+        self.vote(self.voters[1], "like")
+        self.vote(self.voters[2], "dislike")
+
+        # The movie row is untouched, reads see the buffered votes
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.num_vote_up, 0)
+        (movie,) = with_pending_votes([self.movie])
+        self.assertEqual((movie.num_vote_up, movie.num_vote_down), (2, 1))
+
+        self.assertEqual(flush_vote_buffer(), 1)
+        self.movie.refresh_from_db()
+        self.assertEqual(
+            (self.movie.num_vote_up, self.movie.num_vote_down, self.movie.vote_score),
+            (2, 1, 1),
+        )
+        # Nothing is left to merge or flush
+        self.assertEqual(pending_vote_deltas([self.movie.pk]), {})
+        self.assertEqual(flush_vote_buffer(), 0)
+
+    def test_crashed_flush_is_not_applied_twice(self):
+        self.vote(self.voters[0], "like")
+
+        # The flusher dies after committing, before clearing the batch
+        with patch.object(self.redis, "delete", side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                flush_vote_buffer()
+        self.redis.delete("movierama:vote-buffer:lock")
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.num_vote_up, 1)
+        # The committed batch is no longer merged into reads
+        self.assertEqual(pending_vote_deltas([self.movie.pk]), {})
+
+        # A vote arriving meanwhile and the replayed batch both land once
+        self.vote(self.voters[1], "like")
+        self.assertEqual(flush_vote_buffer(), 0)
+        self.assertEqual(flush_vote_buffer(), 1)
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.num_vote_up, 2)
+
+    def test_movie_deleted_with_buffered_votes(self):
+        other = Movie.objects.create(
+            title="Other Movie", description="Description", user=self.movie.user
+        )
+        self.vote(self.voters[0], "like")
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(other, self.voters[0].id, "like")
+        self.movie.delete()
+
+        self.assertEqual(flush_vote_buffer(), 2)
+        connection.check_constraints()
+        other.refresh_from_db()
+        self.assertEqual(other.num_vote_up, 1)
+        self.assertEqual(
+            list(VoteRollup.objects.values_list("movie", "ups")), [(other.pk, 1)]
+        )
+        self.assertEqual(flush_vote_buffer(), 0)
+
+
+@override_settings(MOVIES_VOTE_SHARDS=4)
+class TestVoteShards(TestCase):
+    """Vote counters spread over shards and compacted into the movies"""
+
+    def setUp(self):
+        author = User.objects.create_user(username="author", password="12345")
+        self.movie = Movie.objects.create(
+            title="Test Movie", description="Description", user=author
+        )
+        self.voters = [
+            User.objects.create_user(username=f"voter{i}", password="12345")
+            for i in range(8)
+        ]
+
+    def test_votes_are_sharded_and_compacted(self):
+        for voter in self.voters[:6]:
+            cast_vote(self.movie, voter.id, "like")
+        for voter in self.voters[6:]:
+            cast_vote(self.movie, voter.id, "dislike")
+        cast_vote(self.movie, self.voters[0].id, "remove")
+
+        # The movie row is untouched, reads sum the shards
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.num_vote_up, 0)
+        self.assertLessEqual(VoteCounterShard.objects.count(), 4)
+        (movie,) = with_pending_votes([self.movie])
+        self.assertEqual((movie.num_vote_up, movie.num_vote_down), (5, 2))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(compact_vote_shards(), 1)
+        self.assertEqual(len(callbacks), 1)
+        self.movie.refresh_from_db()
+        self.assertEqual(
+            (self.movie.num_vote_up, self.movie.num_vote_down, self.movie.vote_score),
+            (5, 2, 3),
+        )
+        self.assertAlmostEqual(self.movie.wilson_score, 0.3589, places=4)
+        # Nothing is left to merge or compact
+        self.assertFalse(VoteCounterShard.objects.exists())
+        (movie,) = with_pending_votes([self.movie])
+        self.assertEqual(movie.num_vote_up, 5)
+        self.assertEqual(compact_vote_shards(), 0)
+
+    def test_command_compacts_in_chunks(self):
+        movies = [self.movie] + [
+            Movie.objects.create(title=f"Movie {i}", description="-", user=voter)
+            for i, voter in enumerate(self.voters[:2])
+        ]
+        for movie in movies:
+            cast_vote(movie, self.voters[-1].id, "like")
+
+        out = StringIO()
+        with patch("movierama.movies.counters.FLUSH_CHUNK_SIZE", 2):
+            call_command("compact_vote_counters", stdout=out)
+        self.assertIn("Compacted vote counters of 3 movies.", out.getvalue())
+        self.assertEqual(
+            [
+                m.num_vote_up
+                for m in Movie.objects.filter(pk__in=[m.pk for m in movies])
+            ],
+            [1, 1, 1],
+        )
+
+
+class TestReconcileVoteCounts(TestCase):
+    """Counters recomputed from the vote table"""
+
+    def setUp(self):
+        author = User.objects.create_user(username="author", password="12345")
+        self.voters = [
+            User.objects.create_user(username=f"voter{i}", password="12345")
+            for i in range(3)
+        ]
+        self.movies = [
+            Movie.objects.create(title=f"Movie {i}", description="-", user=author)
+            for i in range(3)
+        ]
+        for voter in self.voters:
+            cast_vote(self.movies[0], voter.id, "like")
+        cast_vote(self.movies[1], self.voters[0].id, "dislike")
+
+    def counters(self):
+        return list(
+            Movie.objects.order_by("id").values_list(
+                "num_vote_up", "num_vote_down", "vote_score", "wilson_score"
+            )
+        )
+
+    def test_dry_run_reports_and_run_fixes_drift(self):
+        expected = self.counters()
+        # Bypass the vote service: an admin edit and a vote lost on the way
+        Movie.objects.filter(pk=self.movies[0].pk).update(num_vote_up=10, vote_score=10)
+        MovieVote.objects.filter(movie=self.movies[1]).delete()
+
+        out = StringIO()
+        call_command("reconcile_vote_counts", "--dry-run", chunk_size=2, stdout=out)
+        self.assertIn("Movie %d: 10/0/10 -> 3/0/3" % self.movies[0].pk, out.getvalue())
+        self.assertIn(
+            "Found 2 movies with drifted counters (-7 likes, -1 hates).", out.getvalue()
+        )
+        self.assertEqual(self.counters()[0][:3], (10, 0, 10))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("reconcile_vote_counts", chunk_size=2, stdout=StringIO())
+        expected[1] = (0, 0, 0, 0.0)
+        self.assertEqual(self.counters(), expected)
+        self.assertEqual(list(reconcile_vote_counts()), [])
+
+    @override_settings(MOVIES_VOTE_SHARDS=2)
+    def test_sharded_deltas_are_not_drift(self):
+        cast_vote(self.movies[2], self.voters[0].id, "like")
+        self.assertEqual(list(reconcile_vote_counts(dry_run=True)), [])
+        compact_vote_shards()
+        self.assertEqual(list(reconcile_vote_counts(dry_run=True)), [])
+
+
+class TestTrending(TestCase):
+    """Trending movies read off hourly vote rollups"""
+
+    def setUp(self):
+        author = User.objects.create_user(username="author", password="12345")
+        self.voters = [
+            User.objects.create_user(username=f"voter{i}", password="12345")
+            for i in range(3)
+        ]
+        self.movies = [
+            Movie.objects.create(title=f"Movie {i}", description="-", user=author)
+            for i in range(3)
+        ]
+
+    def test_votes_roll_up_into_the_hour(self):
+        for voter in self.voters:
+            cast_vote(self.movies[1], voter.id, "like")
+        cast_vote(self.movies[0], self.voters[0].id, "like")
+        cast_vote(self.movies[2], self.voters[0].id, "dislike")
+        cast_vote(self.movies[1], self.voters[2].id, "remove")
+
+        rollup = VoteRollup.objects.get(movie=self.movies[1])
+        self.assertEqual(
+            (rollup.span, rollup.ups, rollup.downs, rollup.net), (1, 2, 0, 2)
+        )
+        self.assertEqual(rollup.bucket.minute, 0)
+        self.assertEqual(
+            [(m.title, m.trend) for m in trending_movies()],
+            [("Movie 1", 2), ("Movie 0", 1)],
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/movies/trending/")
+        self.assertContains(response, "<b>Movie 1</b> (+2 in the last 24h)")
+        self.assertNotContains(response, "Movie 2")
+        self.assertFalse(any("movies_movievote" in q for q in select_queries(queries)))
+
+    def test_movies_deleted_meanwhile_are_left_out(self):
+        cast_vote(self.movies[0], self.voters[0].id, "like")
+        cast_vote(self.movies[1], self.voters[0].id, "like")
+        in_bulk = QuerySet.in_bulk
+
+        def delete_first(queryset, *args, **kwargs):
+            Movie.objects.filter(pk=self.movies[1].pk).delete()
+            return in_bulk(queryset, *args, **kwargs)
+
+        with patch.object(QuerySet, "in_bulk", delete_first):
+            trending = trending_movies()
+        self.assertEqual([(m.title, m.trend) for m in trending], [("Movie 0", 1)])
+
+    @override_settings(MOVIES_VOTE_SHARDS=2)
+    def test_sharded_votes_roll_up_when_compacted(self):
+        cast_vote(self.movies[0], self.voters[0].id, "like")
+        self.assertFalse(VoteRollup.objects.exists())
+        compact_vote_shards()
+        self.assertEqual(VoteRollup.objects.get().net, 1)
+
+    def test_past_hours_fold_into_days(self):
+        day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        day -= timedelta(days=3)
+        for hour, (ups, downs) in enumerate([(3, 1), (2, 0)]):
+            VoteRollup.objects.create(
+                movie=self.movies[0],
+                bucket=day + timedelta(hours=hour),
+                ups=ups,
+                downs=downs,
+                net=ups - downs,
+            )
+        cast_vote(self.movies[1], self.voters[0].id, "like")
+
+        out = StringIO()
+        call_command("compact_vote_rollups", stdout=out)
+        self.assertIn("Folded the vote rollups of 1 days.", out.getvalue())
+        self.assertEqual(
+            list(
+                VoteRollup.objects.order_by("bucket").values_list(
+                    "movie", "bucket", "span", "ups", "downs", "net"
+                )
+            )[0],
+            (self.movies[0].pk, day, VoteRollup.DAY, 5, 1, 4),
+        )
+        self.assertEqual(VoteRollup.objects.count(), 2)
+        self.assertEqual(compact_vote_rollups(), 0)
+
+        self.assertEqual([m.title for m in trending_movies("24h")], ["Movie 1"])
+        self.assertEqual(
+            [(m.title, m.trend) for m in trending_movies("7d")],
+            [("Movie 0", 4), ("Movie 1", 1)],
+        )
+
+
+class TestSimilarMovies(TestCase):
+    """Similar movies by the cosine of their vote vectors"""
+
+    def setUp(self):
+        author = User.objects.create_user(username="author", password="12345")
+        self.voters = [
+            User.objects.create_user(username=f"voter{i}", password="12345")
+            for i in range(4)
+        ]
+        self.a, self.b, self.c, self.d = [
+            Movie.objects.create(title=title, description="-", user=author)
+            for title in "ABCD"
+        ]
+        votes = [
+            (0, self.a, "like"),
+            (0, self.b, "like"),
+            (1, self.a, "like"),
+            (1, self.b, "like"),
+            (2, self.a, "like"),
+            (2, self.c, "dislike"),
+            (3, self.c, "like"),
+            (3, self.d, "like"),
+        ]
+        for voter, movie, vote in votes:
+            cast_vote(movie, self.voters[voter].id, vote)
+
+    def similar(self):
+        result = {}
+        for entry in SimilarMovie.objects.order_by("movie__title", "rank"):
+            result.setdefault(entry.movie.title, []).append(
+                (entry.similar.title, round(entry.score, 4))
+            )
+        return result
+
+    def test_build_and_serve(self):
+        self.assertEqual(build_similar_movies(chunk_size=2), 4)
+        # A and C are voted apart, B and C share no voter
+        self.assertEqual(
+            self.similar(),
+            {
+                "A": [("B", 0.8165)],
+                "B": [("A", 0.8165)],
+                "C": [("D", 0.7071)],
+                "D": [("C", 0.7071)],
+            },
+        )
+
+        response = self.client.get(f"/movies/{self.a.pk}/")
+        self.assertContains(response, f'<a href="/movies/{self.b.pk}/"><b>B</b></a>')
+        self.assertNotContains(response, "<b>C</b>")
+        response = self.client.get("/movies/")
+        self.assertContains(response, f'<a href="/movies/{self.a.pk}/">A</a>')
+
+    def test_norms_are_counted_from_the_votes(self):
+        # Counters off from the votes, as while a vote is being counted
+        Movie.objects.filter(pk=self.a.pk).update(num_vote_up=30)
+        build_similar_movies()
+        self.assertEqual(self.similar()["B"], [("A", 0.8165)])
+
+    def test_refresh_movies_voted_lately(self):
+        build_similar_movies()
+        VoteRollup.objects.update(bucket=timezone.now() - timedelta(days=3))
+        cast_vote(self.b, self.voters[3].id, "like")
+
+        out = StringIO()
+        call_command("build_similar_movies", "--changed-since=1", "--top=2", stdout=out)
+        self.assertIn("Stored 2 similar movies", out.getvalue())
+        similar = self.similar()
+        self.assertEqual(similar["B"], [("A", 0.6667), ("D", 0.5774)])
+        # The lists of the others wait for the next full build
+        self.assertEqual(similar["A"], [("B", 0.8165)])
+        self.assertEqual(similar["D"], [("C", 0.7071)])
+        self.assertEqual(refresh_similar_movies(timezone.now()), 3)
+
+
+class TestRecommendations(TransactionTestCase):
+    """Movies recommended from the similar movies of the ones voted"""
+
+    # Committed, for the worker processes to see; the flush between tests
+    # must not lose the hot score epoch row of the migrations.
+    serialized_rollback = True
+
+    def setUp(self):
+        author = User.objects.create_user(username="author", password="12345")
+        self.voters = [
+            User.objects.create_user(
+                username=f"voter{i}", password="12345", last_login=timezone.now()
+            )
+            for i in range(5)
+        ]
+        self.a, self.b, self.c, self.d = [
+            Movie.objects.create(title=title, description="-", user=author)
+            for title in "ABCD"
+        ]
+        votes = [
+            (0, self.a, "like"),
+            (0, self.b, "like"),
+            (1, self.a, "like"),
+            (1, self.b, "like"),
+            (2, self.a, "like"),
+            (2, self.c, "dislike"),
+            (3, self.c, "like"),
+            (3, self.d, "like"),
+            (4, self.d, "like"),
+        ]
+        for voter, movie, vote in votes:
+            cast_vote(movie, self.voters[voter].id, vote)
+        build_similar_movies()
+
+    def recommended(self):
+        return list(
+            Recommendation.objects.order_by("user", "rank").values_list(
+                "user__username", "movie__title"
+            )
+        )
+
+    def test_unvoted_movies_like_the_liked_ones(self):
+        # voter4 is not active, and voter2's hate of C keeps D away
+        User.objects.filter(pk=self.voters[4].pk).update(last_login=None)
+        stats = build_recommendations(timezone.now() - timedelta(days=1))
+        self.assertEqual(stats["users"], 4)
+        self.assertEqual(self.recommended(), [("voter2", "B")])
+
+        self.client.login(username="voter2", password="12345")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/movies/recommended/")
+        self.assertContains(response, f'<a href="/movies/{self.b.pk}/"><b>B</b></a>')
+        self.assertEqual(
+            len([q for q in select_queries(queries) if "movies_recommendation" in q]), 1
+        )
+
+        # Nobody is recommended their own movies
+        Movie.objects.filter(pk=self.b.pk).update(user=self.voters[2])
+        build_recommendations(timezone.now() - timedelta(days=1))
+        self.assertEqual(self.recommended(), [])
+
+    def test_process_pool(self):
+        out = StringIO()
+        call_command(
+            "build_recommendations", "--workers=2", "--chunk-size=2", stdout=out
+        )
+        self.assertIn("Stored 2 recommendations for 5 users", out.getvalue())
+        self.assertIn("peak memory", out.getvalue())
+        self.assertEqual(self.recommended(), [("voter2", "B"), ("voter4", "C")])
+
+
+class TestImports(TestCase):
+    """Movies and votes bulk loaded through COPY and merged"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="12345")
+        self.voter = User.objects.create_user(username="voter", password="12345")
+        Movie.objects.create(title="Existing", description="Old", user=self.author)
+
+    def write(self, suffix, content):
+        f = tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False)
+        self.addCleanup(lambda: os.unlink(f.name))
+        with f:
+            f.write(content)
+        return f.name
+
+    def test_movies_are_merged_and_resumed(self):
+        path = self.write(
+            ".csv",
+            "title,description,username,pub_date\n"
+            "Imported One,First imported movie,author,2022-05-01T10:00:00Z\n"
+            "Existing,New,author,\n"
+            "Bad Date,-,author,yesterday\n"
+            "Unknown Author,-,nobody,\n"
+            f"{'x' * 201},-,author,\n"
+            "Imported Two,Second imported movie,voter,\n",
+        )
+
+        def crash(stats):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            import_movies(path, batch_size=2, progress=crash)
+        self.assertEqual(Movie.objects.count(), 2)
+        self.assertEqual(ImportProgress.objects.get().position, 2)
+
+        out = StringIO()
+        call_command("import_movies", path, "--batch-size=2", stdout=out)
+        self.assertIn("4 records read, 1 rejected, 0 movies merged...", out.getvalue())
+        self.assertIn(
+            "Done: 6 records read, 2 rejected, 1 movies merged.", out.getvalue()
+        )
+        self.assertEqual(
+            list(
+                Movie.objects.order_by("title").values_list("title", "user__username")
+            ),
+            [
+                ("Existing", "author"),
+                ("Imported One", "author"),
+                ("Imported Two", "voter"),
+            ],
+        )
+        # The triggers did their part
+        movie = Movie.objects.search("imported").get(title="Imported One")
+        self.assertEqual(movie.pub_date.day, 1)
+        self.assertNotEqual(movie.hot_score, 0)
+        self.assertEqual(Movie.objects.get(title="Existing").description, "Old")
+
+        # Finished imports are not repeated, unless restarted
+        self.assertEqual(import_movies(path)["read"], 6)
+        existing = Movie.objects.get(title="Existing")
+        version = annotate_row_versions([existing])[0].cache_version
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = import_movies(path, on_conflict="update", restart=True)
+        self.assertEqual(stats["merged"], 1)
+        self.assertEqual(Movie.objects.get(title="Existing").description, "New")
+        # Its cached table row is rendered anew
+        (existing,) = annotate_row_versions([existing])
+        self.assertEqual(existing.cache_version, version + 1)
+
+    def test_votes_are_merged_and_counted(self):
+        movie = Movie.objects.get(title="Existing")
+        cast_vote(movie, self.voter.id, "dislike")
+        other = User.objects.create_user(username="other", password="12345")
+        records = [
+            {"username": "voter", "title": "Existing", "vote": "like"},
+            {"username": "other", "title": "Existing", "vote": "dislike"},
+            {"username": "other", "title": "Existing", "vote": "like"},
+            {"username": "author", "title": "Existing", "vote": "like"},
+            {"username": "other", "title": "Missing", "vote": "like"},
+            {"username": "other", "title": "Existing", "vote": "meh"},
+        ]
+        path = self.write(".jsonl", "\n".join(json.dumps(r) for r in records))
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("import_votes", path, stdout=out)
+        self.assertIn(
+            "Done: 6 records read, 1 rejected, 2 votes merged, "
+            "counters of 1 movies rebuilt.",
+            out.getvalue(),
+        )
+        self.assertEqual(
+            set(MovieVote.objects.values_list("user", "value")),
+            {(self.voter.id, LIKE), (other.id, LIKE)},
+        )
+        movie.refresh_from_db()
+        self.assertEqual(
+            (movie.num_vote_up, movie.num_vote_down, movie.vote_score), (2, 0, 2)
+        )
+        self.assertAlmostEqual(movie.wilson_score, 0.3424, places=4)
+
+    @override_settings(MOVIES_VOTE_BUFFER=True)
+    def test_votes_are_not_imported_over_the_vote_buffer(self):
+        path = self.write(
+            ".jsonl", '{"username": "voter", "title": "Existing", "vote": "like"}\n'
+        )
+        with self.assertRaisesMessage(CommandError, "Flush the vote buffer"):
+            call_command("import_votes", path, stdout=StringIO())
+        with self.assertRaises(ValueError):
+            import_votes(path)
+        self.assertFalse(MovieVote.objects.exists())
+        self.assertFalse(ImportProgress.objects.exists())
+
+    def test_malformed_records_are_rejected(self):
+        path = self.write(
+            ".jsonl",
+            '{"title": "Imported", "description": "-", "username": "author"}\n'
+            '{"title": "Truncated", "descr\n'
+            '["not", "an", "object"]\n'
+            '{"title": 5, "description": "-", "username": "author"}\n'
+            '{"title": "Dated", "username": "author", "pub_date": 1651399200}\n',
+        )
+        stats = import_movies(path, batch_size=2)
+        self.assertEqual(stats, {"read": 5, "rejected": 4, "merged": 1})
+        self.assertTrue(ImportProgress.objects.get().finished)
+        self.assertTrue(Movie.objects.filter(title="Imported").exists())
+
+
+class TestExports(TestCase):
+    """Staff exports streamed from server-side cursors"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            username="staff", password="12345", is_staff=True
+        )
+        self.author = User.objects.create_user(username="author", password="12345")
+        for i in range(3):
+            movie = Movie.objects.create(
+                title=f"Movie {i}", description="-", user=self.author
+            )
+            cast_vote(movie, self.staff.id, "like" if i else "dislike")
+        self.client.login(username="staff", password="12345")
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            content = b"".join(response.streaming_content)
+        return content, queries
+
+    def test_movies_csv_in_one_query(self):
+        content, queries = self.get("/movies/export/movies/")
+        lines = content.decode().splitlines()
+        self.assertEqual(
+            lines[0],
+            "id,title,description,user_username,pub_date,num_vote_up,"
+            "num_vote_down,vote_score,hot_score,wilson_score",
+        )
+        self.assertEqual(len(lines), 4)
+        self.assertIn(",Movie 2,-,author,", lines[3])
+        # Authors are joined, not fetched per movie
+        self.assertEqual(len(queries), 1)
+
+    def test_votes_jsonl_gzipped(self):
+        response = self.client.get("/movies/export/votes/?format=jsonl&gzip=1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('filename="votes.jsonl.gz"', response["Content-Disposition"])
+        content = gzip.decompress(b"".join(response.streaming_content))
+        votes = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(
+            [(v["movie_title"], v["user_username"], v["value"]) for v in votes],
+            [
+                ("Movie 0", "staff", -1),
+                ("Movie 1", "staff", 1),
+                ("Movie 2", "staff", 1),
+            ],
+        )
+        self.assertIn("T", votes[0]["created_at"])
+
+    def test_staff_only(self):
+        self.client.login(username="author", password="12345")
+        self.assertEqual(self.client.get("/movies/export/movies/").status_code, 302)
+        self.client.login(username="staff", password="12345")
+        self.assertEqual(self.client.get("/movies/export/nothing/").status_code, 404)
+
+    def test_command_writes_to_its_stdout(self):
+        out = StringIO()
+        call_command("export_data", "movies", "--format=jsonl", stdout=out)
+        movies = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [m["title"] for m in movies], ["Movie 0", "Movie 1", "Movie 2"]
+        )
+        with self.assertRaises(CommandError):
+            call_command("export_data", "movies", "--gzip", stdout=StringIO())
+
+    def test_command_writes_user_stats(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stats.csv.gz")
+            call_command("export_data", "user-stats", "--gzip", "-o", path)
+            with gzip.open(path, "rt") as f:
+                rows = list(csv.DictReader(f))
+        stats = {
+            row["username"]: [
+                int(row[column])
+                for column in (
+                    "movies",
+                    "likes_given",
+                    "hates_given",
+                    "likes_received",
+                    "hates_received",
+                )
+            ]
+            for row in rows
+        }
+        self.assertEqual(stats, {"staff": [0, 2, 1, 0, 0], "author": [3, 0, 0, 2, 1]})
+
+
+class TestUserMovieList(TestCase):
+    """Users are paged, and each user's movies load as a fragment on expand"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.client.login(username="testuser", password="12345")
+
+    def add_movies(self, user, count):
+        for i in range(count):
+            Movie.objects.create(
+                title=f"{user.username} movie {i}",
+                description="Description",
+                user=user,
+                num_vote_up=i,
+            )
+
+    def test_page_carries_only_user_headers(self):
+        self.add_movies(self.user, 3)
+        response = self.client.get("/movies/user_movies/")
+        self.assertContains(response, "testuser (3 movies)")
+        self.assertNotContains(response, "testuser movie 0")
+        self.assertContains(response, f"/movies/user_movies/{self.user.id}/")
+
+    @patch("movierama.movies.views.USER_TOP_MOVIES", 2)
+    def test_movie_fragment_pages_best_movies_first(self):
+        self.add_movies(self.user, 3)
+        response = self.client.get(f"/movies/user_movies/{self.user.id}/")
+        self.assertEqual(
+            [movie.title for movie in response.context["object_list"]],
+            ["testuser movie 2", "testuser movie 1"],
+        )
+        cursor = response.context["object_list"].next_cursor
+        response = self.client.get(
+            f"/movies/user_movies/{self.user.id}/", {"cursor": cursor}
+        )
+        self.assertEqual(
+            [movie.title for movie in response.context["object_list"]],
+            ["testuser movie 0"],
+        )
+        self.assertNotContains(response, "More movies")
+
+    def test_query_budget_does_not_grow_with_users(self):
+        self.add_movies(self.user, 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/movies/user_movies/")
+        baseline = len(select_queries(queries))
+
+        for i in range(30):
+            self.add_movies(
+                User.objects.create_user(username=f"user{i}", password="12345"), 3
+            )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/movies/user_movies/")
+        self.assertEqual(len(select_queries(queries)), baseline)
+        self.assertTrue(response.context["object_list"].has_next())
+
+    def test_cached_page_follows_movies_not_votes(self):
+        self.add_movies(self.user, 1)
+        voter = User.objects.create_user(username="voter", password="12345")
+        self.client.get("/movies/user_movies/")
+        entry = get_cache().get("movies:user-movie-page:1")
+        # Only what the page shows, no password hashes
+        self.assertEqual(
+            entry["value"][0],
+            [
+                {"id": self.user.id, "username": "testuser", "movie_count": 1},
+                {"id": voter.id, "username": "voter", "movie_count": 0},
+            ],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(Movie.objects.get(), voter.id, "like")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/movies/user_movies/")
+        self.assertNotIn("movie_count", " ".join(select_queries(queries)))
+
+        Movie.objects.create(title="Another", description="-", user=self.user)
+        response = self.client.get("/movies/user_movies/")
+        self.assertContains(response, "testuser (2 movies)")
+
+    def test_cached_page_follows_users(self):
+        self.client.get("/movies/user_movies/")
+        User.objects.create_user(username="newcomer", password="12345")
+        response = self.client.get("/movies/user_movies/")
+        self.assertContains(response, "newcomer (0 movies)")
+
+        User.objects.filter(username="newcomer").get().delete()
+        response = self.client.get("/movies/user_movies/")
+        self.assertNotContains(response, "newcomer")
+
+
+class TestUserVoteList(TestCase):
+    """Votes of one user are read in one query, in capped batches"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="12345")
+        self.voter = User.objects.create_user(username="voter", password="12345")
+        self.movies = [
+            Movie.objects.create(
+                title=f"Movie {i}", description="Description", user=self.author
+            )
+            for i in range(4)
+        ]
+        for movie in self.movies[:3]:
+            cast_vote(movie, self.voter.id, "like")
+        cast_vote(self.movies[3], self.voter.id, "dislike")
+        self.client.login(username="voter", password="12345")
+
+    def test_page_carries_only_user_headers(self):
+        response = self.client.get("/movies/user_votes/")
+        self.assertContains(response, f"/movies/user_votes/{self.voter.id}/")
+        self.assertNotContains(response, "Movie 0")
+
+    @patch("movierama.movies.views.USER_TOP_MOVIES", 2)
+    def test_vote_fragment_grouped_and_capped(self):
+        url = f"/movies/user_votes/{self.voter.id}/"
+        response = self.client.get(url)
+        liked, disliked = response.context["sections"]
+        self.assertEqual(liked["total"], 3)
+        self.assertEqual([m.title for m in liked["movies"]], ["Movie 2", "Movie 1"])
+        self.assertEqual(disliked["total"], 1)
+        self.assertEqual([m.title for m in disliked["movies"]], ["Movie 3"])
+        self.assertIsNone(disliked["before"])
+
+        # The next batch of likes, without counting them all again
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                url, {"action": "like", "before": liked["before"]}
+            )
+        self.assertNotIn("count(*)", " ".join(select_queries(queries)))
+        (liked,) = response.context["sections"]
+        self.assertEqual([m.title for m in liked["movies"]], ["Movie 0"])
+        self.assertIsNone(liked["before"])
+        self.assertIsNone(liked["total"])
+
+        response = self.client.get(url, {"action": "like", "before": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_vote_fragment_is_a_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f"/movies/user_votes/{self.voter.id}/")
+        # The session, the user, and the votes with their movies
+        self.assertEqual(len(select_queries(queries)), 3)
+
+
+class TestMovieListCache(TestCase):
+    """Anonymous movie list pages are cached until movies or votes change"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="12345")
+        self.voter = User.objects.create_user(username="voter", password="12345")
+        self.movie = Movie.objects.create(
+            title="Test Movie", description="Description", user=self.author
+        )
+
+    def test_anonymous_pages_are_served_without_the_database(self):
+        self.client.get("/movies/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/movies/")
+        self.assertContains(response, "Test Movie")
+        stats = cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_cached_pages_keep_their_headers(self):
+        @cache_anonymous_page("feed")
+        def feed(request):
+            response = HttpResponse("[]", content_type="application/json")
+            response["Content-Language"] = "en"
+            return response
+
+        request = RequestFactory().get("/feed/")
+        request.user = AnonymousUser()
+        feed(request)
+        response = feed(request)
+        self.assertEqual(cache_stats()["hits"], 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response["Content-Language"], "en")
+        self.assertEqual(response.content, b"[]")
+
+    def test_movie_changes_and_votes_invalidate_pages(self):
+        self.client.get("/movies/")
+        Movie.objects.create(title="Other Movie", description="-", user=self.author)
+        self.assertContains(self.client.get("/movies/"), "Other Movie")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.movie, self.voter.id, "like")
+        response = self.client.get("/movies/")
+        (movie,) = [m for m in response.context["page_obj"] if m == self.movie]
+        self.assertEqual(movie.num_vote_up, 1)
+
+    def test_signed_in_users_bypass_the_cache(self):
+        self.client.login(username="voter", password="12345")
+        self.client.get("/movies/")
+        self.client.get("/movies/")
+        self.assertEqual(cache_stats()["hits"], 0)
+
+
+class TestMovieSearch(TestCase):
+    """Ranked full-text search over movie titles and descriptions"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        self.in_title = Movie.objects.create(
+            title="Space Pirates", description="A comedy", user=self.user
+        )
+        self.in_description = Movie.objects.create(
+            title="Treasure", description="Pirates hunt for gold", user=self.user
+        )
+        Movie.objects.create(title="Garden", description="Flowers", user=self.user)
+
+    def titles(self, response):
+        return [movie.title for movie in response.context["object_list"]]
+
+    def test_title_matches_rank_first(self):
+        response = self.client.get("/movies/search/", {"q": "pirate"})
+        self.assertEqual(self.titles(response), ["Space Pirates", "Treasure"])
+        response = self.client.get("/movies/search/", {"q": "pirates -gold"})
+        self.assertEqual(self.titles(response), ["Space Pirates"])
+
+    def test_search_vector_follows_edits(self):
+        self.in_title.description = "Flowers in space"
+        self.in_title.save()
+        # Vote counter updates leave the search vector alone
+        Movie.objects.filter(pk=self.in_title.pk).update(num_vote_up=3)
+        self.assertQuerysetEqual(
+            Movie.objects.search("flower").order_by("title"),
+            ["Garden", "Space Pirates"],
+            transform=str,
+        )
+
+    @patch("movierama.movies.views.MOVIES_PER_PAGE", 1)
+    def test_results_are_keyset_paged(self):
+        response = self.client.get("/movies/search/", {"q": "pirate"})
+        self.assertEqual(self.titles(response), ["Space Pirates"])
+        cursor = response.context["object_list"].next_cursor
+        response = self.client.get("/movies/search/", {"q": "pirate", "cursor": cursor})
+        self.assertEqual(self.titles(response), ["Treasure"])
+        page = response.context["object_list"]
+        self.assertFalse(page.has_next())
+        response = self.client.get(
+            "/movies/search/", {"q": "pirate", "cursor": page.previous_cursor}
+        )
+        self.assertEqual(self.titles(response), ["Space Pirates"])
+
+    def test_empty_query_shows_the_form(self):
+        response = self.client.get("/movies/search/", {"q": "  "})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context["object_list"])
+
+
+class TestMovieAutocomplete(TestCase):
+    """Title completions, short prefixes served from the cache"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="12345")
+        for title, score in [("Stardust", 5), ("Star Wars", 1), ("The Lost Star", 9)]:
+            Movie.objects.create(
+                title=title, description="-", user=self.user, num_vote_up=score
+            )
+        Movie.objects.create(title="Mustang", description="-", user=self.user)
+
+    def titles(self, response):
+        return [movie["title"] for movie in response.json()["results"]]
+
+    def test_best_completions_first(self):
+        response = self.client.get("/movies/autocomplete/", {"q": "  Star   W"})
+        self.assertEqual(self.titles(response), ["Star Wars", "The Lost Star"])
+        # Equally similar titles go by score
+        response = self.client.get("/movies/autocomplete/", {"q": "sta"})
+        self.assertEqual(
+            self.titles(response), ["The Lost Star", "Stardust", "Star Wars"]
+        )
+        response = self.client.get("/movies/autocomplete/", {"q": ""})
+        self.assertEqual(self.titles(response), [])
+
+    def test_short_prefixes_are_cached(self):
+        self.client.get("/movies/autocomplete/", {"q": "mu"})
+        with self.assertNumQueries(0):
+            response = self.client.get("/movies/autocomplete/", {"q": "MU"})
+        self.assertEqual(self.titles(response), ["Mustang"])
+        self.assertIn("max-age=", response["Cache-Control"])
+        # Longer ones always go to the database
+        self.client.get("/movies/autocomplete/", {"q": "must"})
+        with self.assertNumQueries(1):
+            self.client.get("/movies/autocomplete/", {"q": "must"})
+
+
+class TestHotRanking(TestCase):
+    """Hot scores decay with age and follow the vote counters"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="12345")
+        self.voters = [
+            User.objects.create_user(username=f"voter{i}", password="12345")
+            for i in range(10)
+        ]
+        self.old, self.new = [
+            Movie.objects.create(title=title, description="-", user=self.author)
+            for title in ("Old", "New")
+        ]
+        # The old movie was posted 12.5 hours earlier
+        Movie.objects.filter(pk=self.old.pk).update(
+            pub_date=self.new.pub_date - timedelta(hours=12.5)
+        )
+        rebase_hot_scores()
+
+    def hot_scores(self):
+        return dict(Movie.objects.values_list("title", "hot_score"))
+
+    def titles(self, response):
+        return [movie.title for movie in response.context["page_obj"]]
+
+    def test_newer_movies_rank_first_until_outvoted(self):
+        response = self.client.get("/movies/", {"sort": "-hot_score"})
+        self.assertEqual(self.titles(response), ["New", "Old"])
+
+        # A decay period older takes ten times the score to make up
+        with self.captureOnCommitCallbacks(execute=True):
+            for voter in self.voters[:9]:
+                cast_vote(self.old, voter.id, "like")
+        scores = self.hot_scores()
+        self.assertAlmostEqual(scores["Old"] - scores["New"], math.log10(9) - 1)
+        response = self.client.get("/movies/", {"sort": "-hot_score"})
+        self.assertEqual(self.titles(response), ["New", "Old"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.new, self.voters[0].id, "dislike")
+            cast_vote(self.new, self.voters[1].id, "dislike")
+        response = self.client.get("/movies/", {"sort": "-hot_score"})
+        self.assertEqual(self.titles(response), ["Old", "New"])
+
+    def test_rebase_keeps_the_ranking(self):
+        for voter in self.voters[:3]:
+            cast_vote(self.old, voter.id, "like")
+        cast_vote(self.old, self.voters[0].id, "remove")
+        before = self.hot_scores()
+
+        epoch = HotScoreEpoch.objects.get().epoch
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                rebase_hot_scores(epoch + timedelta(hours=125), chunk_size=1), 2
+            )
+        # A statement and transaction per id
+        updates = [q for q in queries.captured_queries if "SET hot_score" in q["sql"]]
+        self.assertEqual(len(updates), self.new.pk - self.old.pk + 1)
+        after = self.hot_scores()
+        for title in before:
+            # Votes shifted the score just as a recomputation does
+            self.assertAlmostEqual(after[title], before[title] - 10)
+
+    def test_missing_epoch(self):
+        # As after a flush of the tables
+        HotScoreEpoch.objects.all().delete()
+        movie = Movie.objects.create(title="Flushed", description="-", user=self.author)
+        movie.refresh_from_db()
+        age = (movie.pub_date - DEFAULT_EPOCH).total_seconds() / 45000
+        self.assertAlmostEqual(movie.hot_score, age)
+
+        rebase_hot_scores()
+        self.assertEqual(HotScoreEpoch.objects.count(), 1)
+        response = self.client.get("/movies/", {"sort": "-hot_score"})
+        self.assertEqual(self.titles(response), ["Flushed", "New", "Old"])
+
+
+class TestWilsonRanking(TestCase):
+    """Best movies rank by the confidence that they are liked"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="12345")
+        self.few, self.solid = [
+            Movie.objects.create(title=title, description="-", user=self.author)
+            for title in ("Few", "Solid")
+        ]
+        # Counters loaded behind the back of the vote path
+        Movie.objects.filter(pk=self.few.pk).update(num_vote_up=2, vote_score=2)
+        Movie.objects.filter(pk=self.solid.pk).update(
+            num_vote_up=20, num_vote_down=19, vote_score=1
+        )
+
+    def titles(self, response):
+        return [movie.title for movie in response.context["page_obj"]]
+
+    def test_backfill_and_best_sort(self):
+        call_command("backfill_wilson_scores", "--chunk-size=1", stdout=StringIO())
+        self.assertEqual(backfill_wilson_scores(), 0)
+        few, solid = Movie.objects.order_by("title")
+        self.assertAlmostEqual(few.wilson_score, 0.3424, places=4)
+        self.assertAlmostEqual(solid.wilson_score, 0.3620, places=4)
+
+        response = self.client.get("/movies/", {"sort": "-vote_score"})
+        self.assertEqual(self.titles(response), ["Few", "Solid"])
+        response = self.client.get("/movies/", {"sort": "-wilson_score"})
+        self.assertEqual(self.titles(response), ["Solid", "Few"])
+
+    def test_votes_keep_the_score_current(self):
+        backfill_wilson_scores()
+        voter = User.objects.create_user(username="voter", password="12345")
+        cast_vote(self.few, voter.id, "like")
+        cast_vote(self.solid, voter.id, "dislike")
+        cast_vote(self.solid, voter.id, "like")
+        # Nothing left for a recomputation to fix
+        self.assertEqual(backfill_wilson_scores(), 0)
+        self.assertGreater(Movie.objects.get(pk=self.few.pk).wilson_score, 0.34)
+
+
+class TestMovieVote(TestCase):
+    """Votes live in their own table, behind django-vote's API"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="12345")
+        self.voter = User.objects.create_user(username="voter", password="12345")
+        self.first, self.second = [
+            Movie.objects.create(title=title, description="-", user=self.author)
+            for title in ("First", "Second")
+        ]
+
+    def values(self):
+        return dict(MovieVote.objects.values_list("movie__title", "value"))
+
+    def test_legacy_votes_are_mirrored_and_copied(self):
+        legacy = Vote.objects.create(
+            user_id=self.voter.id,
+            content_type=ContentType.objects.get_for_model(Movie),
+            object_id=self.first.pk,
+            action=DOWN,
+        )
+        self.assertEqual(self.values(), {"First": DISLIKE})
+        legacy.action = UP
+        legacy.save()
+        self.assertEqual(self.values(), {"First": LIKE})
+
+        # Votes from before the mirror are copied; those of users gone are not
+        MovieVote.objects.all().delete()
+        Vote.objects.create(
+            user_id=self.author.id + self.voter.id,
+            content_type=ContentType.objects.get_for_model(Movie),
+            object_id=self.second.pk,
+        )
+        migration = import_module("movierama.movies.migrations.0016_movievote_copy")
+        with connection.schema_editor() as schema_editor:
+            migration.copy_votes(apps, schema_editor)
+        self.assertEqual(self.values(), {"First": LIKE})
+
+        legacy.delete()
+        self.assertEqual(self.values(), {})
+
+    def test_votes_api(self):
+        self.assertTrue(self.first.votes.up(self.voter.id))
+        self.assertTrue(self.second.votes.down(self.voter.id))
+        self.assertEqual(self.first.votes.count(), 1)
+        self.assertEqual(Movie.votes.count(action=DOWN), 1)
+        self.assertEqual(self.first.votes.get(self.voter.id).action, UP)
+        self.assertEqual(
+            [user_id for user_id, _ in self.second.votes.user_ids(action=DOWN)],
+            [self.voter.id],
+        )
+        self.assertQuerysetEqual(
+            Movie.votes.all(self.voter.id, action=DOWN), ["Second"], transform=str
+        )
+
+        movies = Movie.votes.vote_by(self.voter.id, ids=[self.second.pk, self.first.pk])
+        self.assertEqual(
+            [(m.title, m.is_voted_up, m.is_voted_down) for m in movies],
+            [("Second", False, True), ("First", True, False)],
+        )
+        self.assertEqual(
+            [m.title for m in Movie.votes.annotate(user_id=self.voter.id)],
+            ["First", "Second"],
+        )
+
+        self.assertTrue(self.second.votes.delete(self.voter.id))
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.num_vote_down, 0)
@@ -0,0 +1,122 @@
+"""
+Hourly vote rollups, and the trending movies read from them.
+
+Every counter update also adds its likes and hates to the
+:model:`movies.VoteRollup` row of the movie for the current hour: votes do so
+directly, the Redis buffer and the counter shards of ``movies.counters`` when
+they are folded into the movies, which then dates them. A vote taken back
+counts against the hour it is taken back in.
+
+Trending lists sum the ``net`` of the buckets of a recent window, off the
+(bucket, net) index, so their cost depends on the votes of the window, not
+on the whole vote history. :func:`compact_vote_rollups` (the
+``compact_vote_rollups`` command) folds the hours of past days into a row
+per day, so a window longer than :data:`HOURLY_RETENTION` counts days whole.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Min, Sum
+from django.utils import timezone
+
+from .models import Movie, VoteRollup
+
+# Windows of the trending lists, by name.
+TRENDING_WINDOWS = {"24h": timedelta(hours=24), "7d": timedelta(days=7)}
+TRENDING_DEFAULT_WINDOW = "24h"
+# How long hourly buckets are kept before being folded into days.
+HOURLY_RETENTION = timedelta(days=2)
+
+
+def add_to_rollups(rows):
+    """
+    Add the ``(movie_id, up, down)`` deltas of ``rows`` to this hour, for
+    the movies that still exist.
+    """
+    rows = [row for row in rows if row[1] or row[2]]
+    if not rows:
+        return
+    table = connection.ops.quote_name(VoteRollup._meta.db_table)
+    movies = connection.ops.quote_name(Movie._meta.db_table)
+    values = ", ".join(["(%s, %s, %s)"] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS r (movie_id, bucket, span, ups, downs, net)
+            SELECT d.id, date_trunc('hour', now()), %s, d.up, d.down, d.up - d.down
+            FROM (VALUES {values}) AS d (id, up, down)
+            -- Buffered deltas may outlive their movie.
+            JOIN {movies} AS m ON m.id = d.id
+            ORDER BY d.id
+            ON CONFLICT (movie_id, bucket, span) DO UPDATE SET
+                ups = r.ups + EXCLUDED.ups,
+                downs = r.downs + EXCLUDED.downs,
+                net = r.net + EXCLUDED.net
+            """,
+            [VoteRollup.HOUR] + [value for row in rows for value in row],
+        )
+
+
+def trending_movies(window=TRENDING_DEFAULT_WINDOW, limit=25):
+    """
+    Return the ``limit`` movies with the most net likes within ``window``
+    (a key of :data:`TRENDING_WINDOWS`), most first. Each carries its
+    ``trend``, the net likes of the window.
+    """
+    since = timezone.now() - TRENDING_WINDOWS[window]
+    trends = (
+        VoteRollup.objects.filter(bucket__gte=since)
+        .values("movie")
+        .annotate(trend=Sum("net"))
+        .filter(trend__gt=0)
+        .order_by("-trend", "-movie")
+        .values_list("movie", "trend")[:limit]
+    )
+    trends = dict(trends)
+    movies = Movie.objects.select_related("user").in_bulk(trends)
+    # A movie may be deleted between the two queries.
+    trending = []
+    for movie_id, trend in trends.items():
+        if movie_id in movies:
+            movies[movie_id].trend = trend
+            trending.append(movies[movie_id])
+    return trending
+
+
+def compact_vote_rollups(keep=HOURLY_RETENTION):
+    """
+    Fold the hourly buckets of the days ended more than ``keep`` ago into
+    daily ones, a day per transaction. Return the number of days folded.
+    """
+    cutoff = (timezone.now() - keep).replace(hour=0, minute=0, second=0, microsecond=0)
+    first = VoteRollup.objects.filter(
+        span=VoteRollup.HOUR, bucket__lt=cutoff
+    ).aggregate(first=Min("bucket"))["first"]
+    if first is None:
+        return 0
+    table = connection.ops.quote_name(VoteRollup._meta.db_table)
+    day = first.replace(hour=0, minute=0, second=0, microsecond=0)
+    folded = 0
+    while day < cutoff:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH hours AS (
+                    DELETE FROM {table}
+                    WHERE span = %s AND bucket >= %s AND bucket < %s
+                    RETURNING movie_id, ups, downs
+                )
+                INSERT INTO {table} AS r (movie_id, bucket, span, ups, downs, net)
+                SELECT movie_id, %s, %s, sum(ups), sum(downs), sum(ups - downs)
+                FROM hours
+                GROUP BY movie_id
+                ON CONFLICT (movie_id, bucket, span) DO UPDATE SET
+                    ups = r.ups + EXCLUDED.ups,
+                    downs = r.downs + EXCLUDED.downs,
+                    net = r.net + EXCLUDED.net
+                """,
+                [VoteRollup.HOUR, day, day + timedelta(days=1), day, VoteRollup.DAY],
+            )
+            folded += bool(cursor.rowcount)
+        day += timedelta(days=1)
+    return folded
@@ -5,11 +5,27 @@ from . import views
 app_name = "movies"
 urlpatterns = [
     path("", views.movie_list, name="movie_list"),
+    path("search/", views.movie_search, name="movie_search"),
+    path("trending/", views.movie_trending, name="movie_trending"),
+    path("export/<slug:name>/", views.export_data, name="export_data"),
+    path("autocomplete/", views.movie_autocomplete, name="movie_autocomplete"),
+    path("recommended/", views.recommended_movies, name="recommended_movies"),
     path("my_movies/", views.my_movie_list, name="my_movie_list"),
     path("user_movies/", views.user_movie_list, name="user_movie_list"),
+    path(
+        "user_movies/<int:user_id>/",
+        views.user_movie_fragment,
+        name="user_movie_fragment",
+    ),
     path("movie_users/", views.movie_user_list, name="movie_user_list"),
     path("user_votes/", views.user_vote_list, name="user_vote_list"),
+    path(
+        "user_votes/<int:user_id>/",
+        views.user_vote_fragment,
+        name="user_vote_fragment",
+    ),
     path("new/", views.movie_create, name="movie_new"),
+    path("<int:pk>/", views.movie_detail, name="movie_detail"),
     path("edit/<int:pk>/", views.movie_update, name="movie_edit"),
     path("delete/<int:pk>/", views.movie_delete, name="movie_delete"),
     path("vote_movies/", views.vote_movies, name="vote_movies"),
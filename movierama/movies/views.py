@@ -1,22 +1,183 @@
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
+from django.db import router
+from django.db.models import Count
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
-from vote.models import DOWN, UP
+from django.utils.cache import patch_cache_control
 
 from movierama.users.models import User
-
+from movierama.utils.cache import get_or_compute
+from movierama.utils.replicas import replica_reads
+from movierama.utils.transactions import view_policy
+
+from .cache import (
+    annotate_row_versions,
+    cache_anonymous_page,
+    get_cache,
+    user_generation,
+)
+from .counters import with_pending_votes
+from .exports import EXPORT_FORMATS, EXPORTS, export
 from .filters import MovieUserFilter
 from .forms import MovieForm, VoteForm
-from .models import Movie
+from .models import DISLIKE, LIKE, Movie, Recommendation
+from .pagination import KeysetPaginator
+from .services import VoteContention, cast_vote
+from .tables import MOVIE_TABLE_DEFAULT_ORDERING, MOVIE_TABLE_ORDERINGS, MovieTable
+from .trending import TRENDING_DEFAULT_WINDOW, TRENDING_WINDOWS, trending_movies
+
+MOVIES_PER_PAGE = 25
+USERS_PER_PAGE = 20
+# Movies shown per user, and per batch, on the user listing pages.
+USER_TOP_MOVIES = 5
+VOTE_FRAGMENT_VALUES = {"like": LIKE, "dislike": DISLIKE}
+AUTOCOMPLETE_RESULTS = 10
+AUTOCOMPLETE_MAX_LENGTH = 100
+# Completions of prefixes up to this length are shared through the cache.
+AUTOCOMPLETE_CACHED_LENGTH = 3
+TRENDING_MOVIES = 25
+
+
+# Cached pages must not open a transaction, and with it a connection.
+@replica_reads
+@view_policy("read")
+@cache_anonymous_page("movie_list")
+def movie_list(request, template_name="movies/movie_list.html"):
+    sort = request.GET.get("sort")
+    if sort not in MOVIE_TABLE_ORDERINGS:
+        sort = MOVIE_TABLE_DEFAULT_ORDERING
+    paginator = KeysetPaginator(
+        Movie.objects.select_related("user"),
+        MOVIE_TABLE_ORDERINGS[sort],
+        per_page=MOVIES_PER_PAGE,
+    )
+    page_obj = paginator.get_page(request.GET.get("cursor"))
+    annotate_row_versions(with_pending_votes(page_obj.object_list))
+
+    data = {}
+    data["table"] = MovieTable(page_obj.object_list, order_by=sort)
+    data["page_obj"] = page_obj
+    return render(request, template_name, data)
 
 
-def movie_list(request, template_name="movies/movie_list.html"):
-    movies = Movie.objects.all()
+@replica_reads
+@view_policy("read")
+def movie_search(request, template_name="movies/movie_search.html"):
+    """Movies matching the ``q`` search terms, best matches first."""
+    query = request.GET.get("q", "").strip()
+    page_obj = None
+    if query:
+        paginator = KeysetPaginator(
+            Movie.objects.search(query).select_related("user"),
+            ("-rank", "-id"),
+            per_page=MOVIES_PER_PAGE,
+        )
+        page_obj = paginator.get_page(request.GET.get("cursor"))
+        with_pending_votes(page_obj.object_list)
+
     data = {}
-    data["object_list"] = movies
+    data["query"] = query
+    data["object_list"] = page_obj
+    return render(request, template_name, data)
+
+
+@replica_reads
+@view_policy("read")
+@cache_anonymous_page("movie_trending")
+def movie_trending(request, template_name="movies/movie_trending.html"):
+    """The movies with the most net likes lately, read off the vote rollups."""
+    window = request.GET.get("window")
+    if window not in TRENDING_WINDOWS:
+        window = TRENDING_DEFAULT_WINDOW
+
+    data = {}
+    data["window"] = window
+    data["windows"] = list(TRENDING_WINDOWS)
+    data["object_list"] = with_pending_votes(trending_movies(window, TRENDING_MOVIES))
+    return render(request, template_name, data)
+
+
+@replica_reads
+@view_policy("read")
+def movie_detail(request, pk, template_name="movies/movie_detail.html"):
+    """A movie, and the movies most similar to it by their voters."""
+    movie = get_object_or_404(Movie.objects.select_related("user"), pk=pk)
+    similar = movie.similar_movies.select_related("similar__user").order_by("rank")
+
+    data = {}
+    data["object"], *data["similar_movies"] = with_pending_votes(
+        [movie] + [entry.similar for entry in similar]
+    )
     return render(request, template_name, data)
 
 
+# The rows stream from a server-side cursor after the view returns, which
+# must not be closed by the end of a request transaction.
+@replica_reads
+@view_policy("read")
+@staff_member_required
+def export_data(request, name):
+    """Stream the export ``name``, in ``format`` csv or jsonl, maybe gzipped."""
+    fmt = request.GET.get("format", "csv")
+    if name not in EXPORTS or fmt not in EXPORT_FORMATS:
+        raise Http404
+    compress = request.GET.get("gzip") == "1"
+    filename = f"{name}.{fmt}"
+    content_type = EXPORT_FORMATS[fmt]
+    if compress:
+        filename += ".gz"
+        content_type = "application/gzip"
+    # Bound to the database now, while the request may still use a replica.
+    chunks = export(name, fmt, compress, using=router.db_for_read(Movie))
+    response = StreamingHttpResponse(chunks, content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Requested on every keystroke: no transaction, and as little work as possible.
+@replica_reads
+@view_policy("read")
+def movie_autocomplete(request):
+    """Titles completing the ``q`` typed so far, as JSON."""
+    text = " ".join(request.GET.get("q", "").lower().split())
+    text = text[:AUTOCOMPLETE_MAX_LENGTH]
+
+    def completions():
+        movies = Movie.objects.autocomplete(text, AUTOCOMPLETE_RESULTS)
+        return list(movies.values("id", "title"))
+
+    if not text:
+        results = []
+    elif len(text) <= AUTOCOMPLETE_CACHED_LENGTH:
+        # Short prefixes match many titles, and are typed by everyone.
+        key = hashlib.md5(text.encode()).hexdigest()
+        results = get_or_compute(
+            f"movies:autocomplete:{key}",
+            completions,
+            settings.MOVIES_AUTOCOMPLETE_CACHE_TIMEOUT,
+            cache=get_cache(),
+        )
+    else:
+        results = completions()
+
+    response = JsonResponse({"results": results})
+    patch_cache_control(response, max_age=settings.MOVIES_AUTOCOMPLETE_CACHE_TIMEOUT)
+    return response
+
+
+@replica_reads
+@view_policy("read")
 @login_required
 def movie_user_list(request):
     f = MovieUserFilter(request.GET, queryset=Movie.objects.all())
@@ -24,11 +185,13 @@ def movie_user_list(request):
 
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = with_pending_votes(page_obj.object_list)
     return render(
         request, "movies/movie_user_list.html", {"user_movies": page_obj, "filter": f}
     )
 
 
+@view_policy("write")
 @login_required
 def movie_vote(request, pk, template_name="movies/movie_vote_form.html"):
     movie = get_object_or_404(Movie, pk=pk)
@@ -36,79 +199,178 @@ def movie_vote(request, pk, template_name="movies/movie_vote_form.html"):
 
     # Voting logic
     if form.is_valid():
-        cd = form.cleaned_data
-
-        # Remove vote if user already voted before
-        if movie.votes.exists(request.user.id, action=UP) or movie.votes.exists(
-            request.user.id, action=DOWN
-        ):
-            movie.votes.delete(request.user.id)
-
-        # Revote according to user's choice
-        if cd["vote"] == "like":
-            movie.votes.up(request.user.id)
-        elif cd["vote"] == "dislike":
-            movie.votes.down(request.user.id)
-        else:
-            pass
-
+        try:
+            cast_vote(movie, request.user.id, form.cleaned_data["vote"])
+        except VoteContention:
+            form.add_error(None, "This movie is busy right now, please try again.")
+            response = render(request, template_name, {"form": form}, status=503)
+            response["Retry-After"] = "1"
+            return response
         return redirect("movies:vote_movies")
     return render(request, template_name, {"form": form})
 
 
+@replica_reads
+@view_policy("read")
 @login_required
 def vote_movies(request, template_name="movies/vote_movies.html"):
-    movies = Movie.objects.exclude(user=request.user).all()
-    for movie in movies:
-        my_vote = "have not voted"
-        if movie.votes.exists(request.user.id):
-            my_vote = "liked"
-        elif movie.votes.exists(request.user.id, action=DOWN):
-            my_vote = "disliked"
-        movie.my_vote = my_vote
+    movies = (
+        Movie.objects.exclude(user=request.user)
+        .select_related("user")
+        .with_user_vote(request.user.id)
+    )
+    paginator = KeysetPaginator(movies, ("-pub_date", "-id"), per_page=MOVIES_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get("cursor"))
+    with_pending_votes(page_obj.object_list)
 
     data = {}
-    data["object_list"] = movies
+    data["object_list"] = page_obj
+    return render(request, template_name, data)
+
+
+@replica_reads
+@view_policy("read")
+@login_required
+def recommended_movies(request, template_name="movies/recommended_movies.html"):
+    """The movies precomputed for the user, as the ones they liked suggest."""
+    recommendations = Recommendation.objects.filter(user=request.user).order_by("rank")
+    movies = [
+        recommendation.movie
+        for recommendation in recommendations.select_related("movie__user")
+    ]
+
+    data = {}
+    data["object_list"] = with_pending_votes(movies)
     return render(request, template_name, data)
 
 
+@replica_reads
+@view_policy("read")
 @login_required
 def my_movie_list(request, template_name="movies/my_movie_list.html"):
-    movies = Movie.objects.filter(user=request.user).all()
+    movies = with_pending_votes(Movie.objects.filter(user=request.user).all())
     data = {}
     data["object_list"] = movies
     return render(request, template_name, data)
 
 
+@replica_reads
+@view_policy("read")
 @login_required
 def user_movie_list(request, template_name="movies/user_movie_list.html"):
-    user_movies = {}
-    users = User.objects.all()
+    number = request.GET.get("page", "")
+    number = int(number) if number.isdigit() else 1
+
+    def user_page():
+        users = (
+            User.objects.annotate(movie_count=Count("movie"))
+            .order_by("username", "id")
+            .values("id", "username", "movie_count")
+        )
+        page = Paginator(users, USERS_PER_PAGE).get_page(number)
+        return list(page.object_list), page.paginator.count, page.number
+
+    # Counting the movies of every user is shared by all visitors, and rebuilt
+    # by one worker at a time when movies are added or removed. Only what the
+    # page shows is cached, not the users themselves.
+    users, count, number = get_or_compute(
+        f"movies:user-movie-page:{number}",
+        user_page,
+        settings.MOVIES_CACHE_TIMEOUT,
+        generation=user_generation(),
+        cache=get_cache(),
+    )
+    page_obj = Page(users, number, Paginator(range(count), USERS_PER_PAGE))
 
-    for user in users:
-        movies = Movie.objects.filter(user=user).all()
-        user_movies.update({user: movies})
+    data = {}
+    data["object_list"] = page_obj
+    return render(request, template_name, data)
+
+
+@replica_reads
+@view_policy("read")
+@login_required
+def user_movie_fragment(
+    request, user_id, template_name="movies/user_movie_fragment.html"
+):
+    """The best scored movies of one user, loaded when its panel expands."""
+    paginator = KeysetPaginator(
+        Movie.objects.filter(user_id=user_id),
+        ("-vote_score", "-pub_date", "-id"),
+        per_page=USER_TOP_MOVIES,
+    )
+    page_obj = paginator.get_page(request.GET.get("cursor"))
+    with_pending_votes(page_obj.object_list)
 
     data = {}
-    data["object_list"] = user_movies
+    data["object_list"] = page_obj
+    data["user_id"] = user_id
     return render(request, template_name, data)
 
 
+@replica_reads
+@view_policy("read")
 @login_required
 def user_vote_list(request, template_name="movies/user_vote_list.html"):
-    user_movies = {}
-    users = User.objects.all()
+    paginator = Paginator(User.objects.order_by("username", "id"), USERS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get("page"))
 
-    for user in users:
-        movies_liked = Movie.votes.all(user.id, action=UP)
-        movies_disliked = Movie.votes.all(user.id, action=DOWN)
-        user_movies.update({user: {"liked": movies_liked, "disliked": movies_disliked}})
+    data = {}
+    data["object_list"] = page_obj
+    return render(request, template_name, data)
+
+
+@replica_reads
+@view_policy("read")
+@login_required
+def user_vote_fragment(
+    request, user_id, template_name="movies/user_vote_fragment.html"
+):
+    """
+    The latest likes and dislikes of one user, loaded when its panel expands.
+    ``?action=like&before=<movie id>`` returns the next batch of one action.
+    """
+    values = VOTE_FRAGMENT_VALUES
+    before = None
+    if request.GET.get("action") in values:
+        values = {request.GET["action"]: values[request.GET["action"]]}
+        before = request.GET.get("before", "")
+        if not before.isdigit():
+            return HttpResponseBadRequest()
+        before = int(before)
+
+    # One extra movie per value tells whether there is a next batch.
+    movies = Movie.objects.voted_by(
+        [user_id], USER_TOP_MOVIES + 1, values=values.values(), before=before
+    )
+    by_value = defaultdict(list)
+    totals = {}
+    for movie in with_pending_votes(movies):
+        by_value[movie.vote_value].append(movie)
+        totals[movie.vote_value] = movie.vote_total
+
+    sections = []
+    for name, value in values.items():
+        movies = by_value[value]
+        sections.append(
+            {
+                "action": name,
+                "movies": movies[:USER_TOP_MOVIES],
+                "total": totals.get(value, 0),
+                "before": movies[USER_TOP_MOVIES - 1].id
+                if len(movies) > USER_TOP_MOVIES
+                else None,
+            }
+        )
 
     data = {}
-    data["object_list"] = user_movies
+    data["sections"] = sections
+    data["user_id"] = user_id
+    data["more"] = before is not None
     return render(request, template_name, data)
 
 
+@view_policy("write")
 @login_required
 def movie_create(request, template_name="movies/movie_form.html"):
     form = MovieForm(request.POST or None)
@@ -120,6 +382,7 @@ def movie_create(request, template_name="movies/movie_form.html"):
     return render(request, template_name, {"form": form})
 
 
+@view_policy("write")
 @login_required
 def movie_update(request, pk, template_name="movies/movie_form.html"):
     if request.user.is_superuser:
@@ -133,6 +396,7 @@ def movie_update(request, pk, template_name="movies/movie_form.html"):
     return render(request, template_name, {"form": form})
 
 
+@view_policy("write")
 @login_required
 def movie_delete(request, pk, template_name="movies/movie_confirm_delete.html"):
     if request.user.is_superuser:
@@ -1 +1,76 @@
 /* Project specific Javascript goes here. */
+
+/*
+ * Accordion panels with a data-fragment-url load their body the first time
+ * they are expanded. Links marked data-fragment-more inside them are replaced
+ * by the next batch of the fragment.
+ */
+window.addEventListener('DOMContentLoaded', () => {
+  const loadInto = (element, url, replace) => {
+    fetch(url, { credentials: 'same-origin' })
+      .then((response) => response.text())
+      .then((html) => {
+        if (replace) {
+          element.outerHTML = html;
+        } else {
+          element.innerHTML = html;
+        }
+      });
+  };
+
+  document.querySelectorAll('.accordion-collapse').forEach((panel) => {
+    panel.addEventListener('show.bs.collapse', () => {
+      const body = panel.querySelector('[data-fragment-url]');
+      if (body && !body.dataset.fragmentLoaded) {
+        body.dataset.fragmentLoaded = 'true';
+        loadInto(body, body.dataset.fragmentUrl, false);
+      }
+    });
+  });
+
+  document.addEventListener('click', (event) => {
+    const link = event.target.closest('a[data-fragment-more]');
+    if (link) {
+      event.preventDefault();
+      loadInto(link, link.href, true);
+    }
+  });
+});
+
+/*
+ * Text inputs with a data-autocomplete-url suggest the titles it returns for
+ * what was typed so far, once typing pauses.
+ */
+window.addEventListener('DOMContentLoaded', () => {
+  document.querySelectorAll('input[data-autocomplete-url]').forEach((input, i) => {
+    const list = document.createElement('datalist');
+    list.id = `autocomplete-${i}`;
+    input.after(list);
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+
+    let timer;
+    let controller;
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      timer = setTimeout(() => {
+        const query = input.value.trim();
+        if (controller) {
+          controller.abort();
+        }
+        if (!query) {
+          list.replaceChildren();
+          return;
+        }
+        controller = new AbortController();
+        const url = `${input.dataset.autocompleteUrl}?q=${encodeURIComponent(query)}`;
+        fetch(url, { signal: controller.signal })
+          .then((response) => response.json())
+          .then((data) => {
+            list.replaceChildren(...data.results.map((movie) => new Option(movie.title)));
+          })
+          .catch(() => {});
+      }, 150);
+    });
+  });
+});
@@ -0,0 +1,95 @@
+"""
+Stampede-safe caching of expensive computations.
+
+:func:`get_or_compute` keeps a value in the cache together with the time it
+took to compute and the time it goes stale, and keeps serving it for a grace
+period after that. Two mechanisms keep workers from recomputing it all at
+once:
+
+* Probabilistic early refresh (XFetch): before the value goes stale, each
+  read refreshes it with a probability that rises as expiry approaches and
+  with the cost of the computation, so that usually a single reader refreshes
+  it ahead of time.
+* Single flight: only the worker that takes the per-key lock recomputes; the
+  others keep serving the stale value meanwhile, or, on a cold miss, wait
+  briefly for the lock holder to publish the new one.
+
+With ``django_redis`` the lock is a Redis ``SET NX EX``, shared by every
+worker and node.
+"""
+import math
+import random
+import time
+import uuid
+
+from django.core.cache import cache as default_cache
+
+# How long a stale value keeps being served, relative to its time to live.
+GRACE_FACTOR = 5
+# How often a worker waiting on a cold miss checks for the new value.
+WAIT_INTERVAL = 0.05
+
+
+def get_or_compute(
+    key, compute, ttl, generation=None, cache=None, beta=1.0, lock_timeout=30
+):
+    """
+    Return the cached value of ``key``, calling ``compute()`` to (re)build it
+    when needed.
+
+    The value is fresh for ``ttl`` seconds and as long as it was computed for
+    the same ``generation``; bumping the generation makes it stale at once,
+    but it is still served while a new one is built. ``beta`` tunes the early
+    refresh, above 1 favouring earlier refreshes.
+    """
+    cache = cache or default_cache
+    entry = cache.get(key)
+    if entry is not None and not _needs_refresh(entry, generation, beta):
+        return entry["value"]
+
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, lock_timeout):
+        try:
+            return _compute_and_store(key, compute, ttl, generation, cache)
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    if entry is not None:
+        # Someone else is rebuilding it; the stale value will do until then.
+        return entry["value"]
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry["generation"] == generation:
+            return entry["value"]
+        if cache.get(lock_key) is None:
+            break
+    return _compute_and_store(key, compute, ttl, generation, cache)
+
+
+def _needs_refresh(entry, generation, beta):
+    if entry["generation"] != generation:
+        return True
+    # XFetch: refresh once now - delta * beta * ln(U) reaches the expiry, U
+    # being uniform in (0, 1]. -ln(U) is usually small, but occasionally
+    # large enough to let one early reader refresh the value.
+    jitter = -entry["delta"] * beta * math.log(1.0 - random.random())
+    return time.time() + jitter >= entry["expiry"]
+
+
+def _compute_and_store(key, compute, ttl, generation, cache):
+    start = time.time()
+    value = compute()
+    delta = time.time() - start
+    entry = {
+        "value": value,
+        "delta": delta,
+        "expiry": start + delta + ttl,
+        "generation": generation,
+    }
+    cache.set(key, entry, ttl * (1 + GRACE_FACTOR))
+    return value
@@ -0,0 +1,30 @@
+"""
+A PostgreSQL backend that borrows its connections from a pool per process.
+
+``CONN_MAX_AGE`` keeps one connection per thread, so a worker holds as many
+connections as it has threads, busy or not, and never checks that they still
+work. With this backend, a thread takes a connection from the pool of its
+process when it first queries the database, and hands it back when Django
+closes it, at the end of each request with ``CONN_MAX_AGE = 0``. The pool:
+
+* opens at most ``MAX_SIZE`` connections; a thread finding them all taken
+  waits up to ``TIMEOUT`` seconds for one, then fails with ``OperationalError``;
+* checks an idle connection with a ``SELECT 1`` before handing it out, with
+  ``PRE_PING`` on, and replaces it if that fails;
+* closes connections left idle for more than ``MAX_IDLE`` seconds;
+* rolls back and ``DISCARD ALL``'s connections handed back, so that no
+  transaction, session setting or temporary table outlives its request.
+
+Usage::
+
+    DATABASES["default"]["ENGINE"] = "movierama.utils.pooled_postgresql"
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["POOL"] = {
+        "MAX_SIZE": 10,
+        "TIMEOUT": 5.0,
+        "PRE_PING": True,
+        "MAX_IDLE": 300,
+    }
+
+:func:`~.pool.pool_stats` reports the pools of the current process.
+"""
@@ -0,0 +1,27 @@
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+from .pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pool = None
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        # Connections go back to the pool they came from, even if the
+        # settings changed meanwhile, as they do when the tests set up.
+        self.pool = get_pool(
+            self.alias, conn_params, self.settings_dict.get("POOL", {})
+        )
+        connection = self.pool.checkout(lambda: connect(conn_params))
+        options = self.settings_dict["OPTIONS"]
+        self.isolation_level = options.get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            self.pool.checkin(self.connection)
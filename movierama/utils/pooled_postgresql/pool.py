@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+# Pools of the current process, by database alias and connection parameters;
+# a forked worker starts its own.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No connection of the pool became free in time."""
+
+
+class ConnectionPool:
+    """A thread-safe pool of psycopg2 connections."""
+
+    def __init__(self, max_size=10, timeout=5.0, pre_ping=True, max_idle=300.0):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self.max_idle = max_idle
+        # Idle connections with the time they were handed back, the most
+        # recent last: reusing those first lets the others go idle for long
+        # enough to be closed.
+        self._idle = deque()
+        self._size = 0
+        self._waiting = 0
+        self._peak = 0
+        self._stats = Counter()
+        self._lock = threading.Condition()
+
+    def checkout(self, connect):
+        """
+        Return an idle connection, or a new one from ``connect()`` while
+        there are fewer than ``max_size``.
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            conn = self._take(deadline)
+            if conn is None:
+                try:
+                    conn = connect()
+                except Exception:
+                    self._release()
+                    raise
+                new = True
+                break
+            if not self.pre_ping or self._ping(conn):
+                new = False
+                break
+            self._discard(conn)
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["connects"] += new
+            self._stats["wait_ms"] += (time.monotonic() - start) * 1000
+        return conn
+
+    def checkin(self, conn):
+        """Take ``conn`` back, reset, or close it if it is broken."""
+        try:
+            if conn.closed:
+                raise psycopg2.InterfaceError("connection already closed")
+            if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute("DISCARD ALL")
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+            self._reap()
+            self._lock.notify()
+
+    def close(self):
+        """Close the idle connections; those in use close when handed back."""
+        with self._lock:
+            while self._idle:
+                self._close(self._idle.pop()[0])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "peak": self._peak,
+                **{
+                    name: round(self._stats[name], 1)
+                    for name in (
+                        "checkouts",
+                        "connects",
+                        "timeouts",
+                        "discarded",
+                        "reaped",
+                        "wait_ms",
+                    )
+                },
+            }
+
+    def _take(self, deadline):
+        # An idle connection, or None once a new one may be opened.
+        with self._lock:
+            self._reap()
+            while True:
+                if self._idle:
+                    return self._idle.pop()[0]
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._peak = max(self._peak, self._size)
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No database connection free after {self.timeout}s "
+                        f"({self.max_size} in use)"
+                    )
+                self._waiting += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _reap(self):
+        # Called with the lock held.
+        expiry = time.monotonic() - self.max_idle
+        while self._idle and self._idle[0][1] < expiry:
+            self._close(self._idle.popleft()[0])
+            self._stats["reaped"] += 1
+
+    def _close(self, conn):
+        # Called with the lock held.
+        self._size -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _release(self):
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def _discard(self, conn):
+        with self._lock:
+            self._close(conn)
+            self._stats["discarded"] += 1
+            self._lock.notify()
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+
+def get_pool(alias, conn_params, options):
+    """The pool of the current process for ``alias`` and ``conn_params``."""
+    key = (
+        os.getpid(),
+        alias,
+        tuple(sorted((k, str(v)) for k, v in conn_params.items())),
+    )
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                max_size=options.get("MAX_SIZE", 10),
+                timeout=options.get("TIMEOUT", 5.0),
+                pre_ping=options.get("PRE_PING", True),
+                max_idle=options.get("MAX_IDLE", 300.0),
+            )
+        return pool
+
+
+def pool_stats():
+    """The stats of the pools of the current process, by database alias."""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items() if key[0] == pid]
+    stats = {}
+    for (_, alias, params), pool in pools:
+        database = dict(params).get("database")
+        name = alias if alias not in stats else f"{alias}:{database}"
+        stats[name] = {"database": database, **pool.stats()}
+    return stats
+
+
+def close_pools():
+    """Close the idle connections of every pool of the current process."""
+    pid = os.getpid()
+    with _pools_lock:
+        for key, pool in _pools.items():
+            if key[0] == pid:
+                pool.close()
@@ -0,0 +1,140 @@
+"""
+Read replicas of the ``default`` database, with read-your-writes.
+
+:class:`ReplicaRouter` sends the reads of the views marked with
+:func:`replica_reads` to one of the ``DATABASE_REPLICAS`` aliases, picked at
+random, and everything else to ``default``. :class:`ReplicaMiddleware` tells
+it which requests may go there:
+
+* Only marked views, which must be read-only; they run outside of a request
+  transaction, and anything they run in a transaction reads from ``default``.
+* Not for a client who wrote something lately: a request with an unsafe
+  method that succeeds pins its client to ``default`` with a cookie, for
+  ``DATABASE_REPLICA_PIN_SECONDS``, which should outlast the usual lag.
+* Not to a replica more than ``DATABASE_REPLICA_MAX_LAG`` seconds behind, or
+  unreachable. Each process checks the lag of a replica at most every
+  ``DATABASE_REPLICA_LAG_CHECK_INTERVAL`` seconds.
+
+With no replicas configured, everything goes to ``default``.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = "movierama_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_use_replicas = contextvars.ContextVar("use_replicas", default=False)
+# Replica alias -> (time of the check, healthy or not), per process.
+_health = {}
+_health_lock = threading.Lock()
+
+
+def replica_reads(view):
+    """Mark ``view`` as read-only, and its reads fit for a replica."""
+    view = transaction.non_atomic_requests(view)
+    view.replica_reads = True
+    return view
+
+
+def replica_lag(alias):
+    """How many seconds the replica ``alias`` is behind, 0 if caught up."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+def healthy_replicas():
+    """The replica aliases reachable and lagging less than allowed."""
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        checked_at, ok = _health.get(alias, (None, False))
+        if checked_at is None or now - checked_at > (
+            settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL
+        ):
+            ok = _check(alias)
+            with _health_lock:
+                _health[alias] = (now, ok)
+        if ok:
+            healthy.append(alias)
+    return healthy
+
+
+def _check(alias):
+    try:
+        lag = replica_lag(alias)
+    except DatabaseError:
+        logger.warning("Replica %s is unreachable, reading from the primary", alias)
+        return False
+    if lag > settings.DATABASE_REPLICA_MAX_LAG:
+        logger.warning(
+            "Replica %s is %.1fs behind, reading from the primary", alias, lag
+        )
+        return False
+    return True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Within a transaction, reads must see its writes.
+        if not _use_replicas.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _use_replicas.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replicas.reset(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            getattr(view_func, "replica_reads", False)
+            and request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+        ):
+            _use_replicas.set(True)
@@ -0,0 +1,369 @@
+import threading
+import time
+import uuid
+from unittest.mock import patch
+
+import fakeredis
+import psycopg2
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import OperationalError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from movierama.movies.models import Movie
+from movierama.users.models import User
+
+from . import replicas
+from .cache import get_or_compute
+from .pooled_postgresql import base as pooled_backend
+from .pooled_postgresql.pool import ConnectionPool, PoolTimeout
+from .tiered_cache import TieredRedisCache
+from .transactions import atomic, db_timeouts, view_policy
+
+
+class TestGetOrCompute(SimpleTestCase):
+    """Single flight and early refresh of cached computations"""
+
+    def setUp(self):
+        self.cache = LocMemCache(f"test-get-or-compute-{self.id()}", {})
+        self.addCleanup(self.cache.clear)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def get(self, **kwargs):
+        return get_or_compute("key", self.compute, 60, cache=self.cache, **kwargs)
+
+    def test_fresh_values_are_served_from_the_cache(self):
+        self.assertEqual(self.get(), 1)
+        self.assertEqual(self.get(), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_new_generation_rebuilds_the_value(self):
+        self.assertEqual(self.get(generation=1), 1)
+        self.assertEqual(self.get(generation=2), 2)
+        self.assertEqual(self.get(generation=2), 2)
+
+    def test_stale_value_is_served_while_another_worker_rebuilds(self):
+        self.get(generation=1)
+        # Another worker holds the lock
+        self.cache.add("lock:key", "other", 30)
+        self.assertEqual(self.get(generation=2), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_early_refresh_close_to_expiry(self):
+        def slow_compute():
+            time.sleep(0.05)
+            return self.compute()
+
+        get_or_compute("key", slow_compute, 60, cache=self.cache)
+        # A second before expiry, a read with an unlucky draw refreshes early
+        with patch("movierama.utils.cache.time.time", return_value=time.time() + 59):
+            with patch("movierama.utils.cache.random.random", return_value=1 - 1e-12):
+                self.assertEqual(self.get(), 2)
+
+    def test_concurrent_cold_misses_compute_once(self):
+        def slow_compute():
+            time.sleep(0.2)
+            return self.compute()
+
+        results = []
+
+        def read():
+            results.append(get_or_compute("cold", slow_compute, 60, cache=self.cache))
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [1] * 8)
+
+
+class TestTieredRedisCache(SimpleTestCase):
+    """The in-process tier is dropped on writes from any node"""
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        # Connection pools are shared per URL, hence unique ones per test.
+        name = uuid.uuid4().hex
+        # Two nodes sharing one Redis, each with its own local tier.
+        self.nodes = [
+            TieredRedisCache(
+                f"redis://{name}-{i}",
+                {
+                    "OPTIONS": {
+                        "CONNECTION_POOL_KWARGS": {
+                            "connection_class": fakeredis.FakeConnection,
+                            "server": server,
+                        },
+                        "L1_KEY_PREFIXES": ["hot:"],
+                        "L1_CHANNEL": f"test-invalidation-{self.id()}",
+                    }
+                },
+            )
+            for i in range(2)
+        ]
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_reads_are_served_locally(self):
+        first, _ = self.nodes
+        first.set("hot:key", "value")
+        self.assertEqual(first.get("hot:key"), "value")
+        # Gone from Redis, still in the local tier
+        first.client.delete("hot:key")
+        self.assertEqual(first.get("hot:key"), "value")
+        self.assertEqual(first.get_many(["hot:key"]), {"hot:key": "value"})
+
+    def test_cold_keys_always_go_to_redis(self):
+        first, _ = self.nodes
+        first.set("cold:key", "value")
+        self.assertEqual(first.get("cold:key"), "value")
+        first.client.delete("cold:key")
+        self.assertIsNone(first.get("cold:key"))
+
+    def test_writes_invalidate_other_nodes(self):
+        first, second = self.nodes
+        first.set("hot:key", 1)
+        self.assertEqual(second.get("hot:key"), 1)
+        # Wait for the listener of the second node to subscribe
+        redis = first.client.get_client()
+        self.wait_for(lambda: redis.publish(second._channel, '{"keys": []}'))
+
+        first.incr("hot:key")
+        self.wait_for(lambda: second.get("hot:key") == 2)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class TestReplicaRouter(TransactionTestCase):
+    """Read-only views read from a replica, unless it lags or the client wrote"""
+
+    # The replica alias is a second connection, which only sees committed
+    # rows; the flush between tests must keep the rows of the migrations.
+    databases = {"default", "replica1"}
+    serialized_rollback = True
+
+    def setUp(self):
+        replicas._health.clear()
+        self.addCleanup(replicas._health.clear)
+        author = User.objects.create_user(username="author", password="12345")
+        User.objects.create_user(username="voter", password="12345")
+        self.movie = Movie.objects.create(title="Movie", description="-", user=author)
+        self.client.login(username="voter", password="12345")
+
+    def replica_queries(self, url):
+        with CaptureQueriesContext(connections["replica1"]) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_read_only_views_read_from_the_replica(self):
+        self.assertGreater(self.replica_queries("/movies/user_movies/"), 0)
+        self.assertGreater(self.replica_queries(f"/movies/{self.movie.pk}/"), 0)
+        # Views not marked read-only stay on the primary
+        self.assertEqual(self.replica_queries("/movies/new/"), 0)
+        self.assertEqual(replicas.replica_lag("replica1"), 0)
+
+    def test_writers_are_pinned_to_the_primary(self):
+        response = self.client.post(
+            f"/movies/movie_vote/{self.movie.pk}/", {"vote": "like"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.replica_queries("/movies/vote_movies/"), 0)
+
+        del self.client.cookies[replicas.PIN_COOKIE]
+        self.assertGreater(self.replica_queries("/movies/vote_movies/"), 0)
+
+    def test_lagging_or_unreachable_replicas_are_skipped(self):
+        with patch("movierama.utils.replicas.replica_lag", return_value=60):
+            self.assertEqual(self.replica_queries("/movies/user_movies/"), 0)
+        # The verdict holds until the next check
+        self.assertEqual(self.replica_queries("/movies/user_movies/"), 0)
+
+        replicas._health.clear()
+        with patch(
+            "movierama.utils.replicas.replica_lag", side_effect=OperationalError
+        ):
+            self.assertEqual(self.replica_queries("/movies/user_movies/"), 0)
+
+
+class TestTransactionPolicies(TransactionTestCase):
+    """Views without a request transaction, under the timeouts of their policy"""
+
+    # Outside of a test transaction, like the views; the flush between tests
+    # must keep the rows of the migrations.
+    serialized_rollback = True
+
+    def show(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SHOW {name}")
+            return cursor.fetchone()[0]
+
+    def test_timeouts_apply_within_and_are_reset_after(self):
+        default = self.show("lock_timeout")
+        with db_timeouts(lock_timeout=1234, statement_timeout=None):
+            self.assertEqual(self.show("lock_timeout"), "1234ms")
+        self.assertEqual(self.show("lock_timeout"), default)
+
+    def test_timeouts_wait_for_a_query_outside_a_transaction(self):
+        default = self.show("statement_timeout")
+        with db_timeouts(statement_timeout=1234):
+            with transaction.atomic():
+                # A rollback would undo them
+                self.assertEqual(self.show("statement_timeout"), default)
+            self.assertEqual(self.show("statement_timeout"), "1234ms")
+        self.assertEqual(self.show("statement_timeout"), default)
+
+    def test_atomic_timeouts_last_for_the_transaction(self):
+        default = self.show("lock_timeout")
+        with atomic(lock_timeout=50):
+            self.assertEqual(self.show("lock_timeout"), "50ms")
+            with atomic(lock_timeout=10):
+                # Nested blocks run under the outermost one's
+                self.assertEqual(self.show("lock_timeout"), "50ms")
+        self.assertEqual(self.show("lock_timeout"), default)
+
+    @override_settings(VIEW_TRANSACTION_POLICIES={"write": {"lock_timeout": 321}})
+    def test_view_policy(self):
+        @view_policy("write")
+        def view(request):
+            return connection.in_atomic_block, self.show("lock_timeout")
+
+        self.assertEqual(view._non_atomic_requests, {"default"})
+        self.assertEqual(view.transaction_policy, "write")
+        self.assertEqual(view(None), (False, "321ms"))
+
+    def test_only_the_movies_views_opt_out_of_atomic_requests(self):
+        self.assertTrue(connection.settings_dict["ATOMIC_REQUESTS"])
+        for url in ("/movies/", "/movies/new/", "/movies/movie_vote/1/"):
+            self.assertTrue(hasattr(resolve(url).func, "transaction_policy"))
+        self.assertFalse(
+            getattr(resolve("/users/~update/").func, "_non_atomic_requests", set())
+        )
+
+    def test_timeouts_are_reset_when_the_view_raises(self):
+        default = self.show("lock_timeout")
+        author = User.objects.create_user(username="author", password="12345")
+        User.objects.create_user(username="other", password="12345")
+        movie = Movie.objects.create(title="Movie", description="-", user=author)
+        self.client.login(username="other", password="12345")
+
+        response = self.client.get(f"/movies/edit/{movie.pk}/")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.show("lock_timeout"), default)
+
+
+class TestConnectionPool(SimpleTestCase):
+    """Capped, checked and reaped connections, reset between borrowers"""
+
+    def setUp(self):
+        self.params = connections["default"].get_connection_params()
+
+    def pool(self, **options):
+        pool = ConnectionPool(**options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def connect(self):
+        return psycopg2.connect(**self.params)
+
+    def backend_pid(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            return cursor.fetchone()[0]
+
+    def test_connections_are_reused_up_to_the_max_size(self):
+        pool = self.pool(max_size=2, timeout=0.05)
+        a, b = pool.checkout(self.connect), pool.checkout(self.connect)
+        self.addCleanup(b.close)
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(self.connect)
+
+        pool.checkin(a)
+        self.assertIs(pool.checkout(self.connect), a)
+        stats = pool.stats()
+        self.assertEqual((stats["size"], stats["in_use"], stats["idle"]), (2, 2, 0))
+        self.assertEqual((stats["connects"], stats["timeouts"]), (2, 1))
+        pool.checkin(a)
+
+    def test_connections_are_reset_when_handed_back(self):
+        pool = self.pool()
+        conn = pool.checkout(self.connect)
+        with conn.cursor() as cursor:
+            cursor.execute("SET statement_timeout = 1234")
+            cursor.execute("SELECT 1")
+        self.assertEqual(conn.info.transaction_status, TRANSACTION_STATUS_INTRANS)
+        pool.checkin(conn)
+
+        conn = pool.checkout(self.connect)
+        self.assertEqual(conn.info.transaction_status, TRANSACTION_STATUS_IDLE)
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW statement_timeout")
+            self.assertEqual(cursor.fetchone()[0], "0")
+        pool.checkin(conn)
+
+    def test_broken_connections_are_replaced(self):
+        pool = self.pool()
+        conn = pool.checkout(self.connect)
+        pid = self.backend_pid(conn)
+        pool.checkin(conn)
+        other = self.connect()
+        with other.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [pid])
+        other.close()
+
+        conn = pool.checkout(self.connect)
+        self.assertNotEqual(self.backend_pid(conn), pid)
+        pool.checkin(conn)
+        self.assertEqual(pool.stats()["discarded"], 1)
+
+    def test_idle_connections_are_closed(self):
+        pool = self.pool(max_idle=0)
+        conn = pool.checkout(self.connect)
+        pool.checkin(conn)
+        self.assertTrue(conn.closed)
+        stats = pool.stats()
+        self.assertEqual((stats["size"], stats["reaped"]), (0, 1))
+
+    def test_backend(self):
+        settings_dict = {
+            **connections["default"].settings_dict,
+            "ENGINE": "movierama.utils.pooled_postgresql",
+            "POOL": {"MAX_SIZE": 1},
+        }
+        wrapper = pooled_backend.DatabaseWrapper(settings_dict, "pooled")
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            pid = cursor.fetchone()[0]
+        wrapper.close()
+        self.addCleanup(wrapper.pool.close)
+        self.assertEqual(wrapper.pool.stats()["idle"], 1)
+
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            self.assertEqual(cursor.fetchone()[0], pid)
+        wrapper.close()
+
+
+class TestDatabasePoolStats(TestCase):
+    def test_staff_only(self):
+        User.objects.create_user(username="user", password="12345")
+        User.objects.create_user(username="staff", password="12345", is_staff=True)
+        self.client.login(username="user", password="12345")
+        self.assertEqual(self.client.get("/db-pool-stats/").status_code, 302)
+
+        self.client.login(username="staff", password="12345")
+        response = self.client.get("/db-pool-stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("pools", response.json())
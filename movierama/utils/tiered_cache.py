@@ -0,0 +1,259 @@
+"""
+Two-tier cache backend: a small in-process LRU in front of ``django_redis``.
+
+Reads of selected hot keys are answered from process memory for up to
+``L1_TIMEOUT`` seconds, which also bounds how long a read racing with a write
+elsewhere can keep a stale value. Every write to such a key drops it from the local
+tier and is broadcast on a Redis pub/sub channel, so that the other workers
+and nodes drop it as well. A listener thread per process applies those
+messages; if it loses its connection it empties the local tier, since it may
+have missed some.
+
+Usage, in place of ``django_redis.cache.RedisCache``::
+
+    CACHES = {
+        "default": {
+            "BACKEND": "movierama.utils.tiered_cache.TieredRedisCache",
+            "LOCATION": "redis://...",
+            "OPTIONS": {
+                "L1_MAX_ENTRIES": 1000,
+                "L1_TIMEOUT": 5,
+                # Keys cached in process; everything else goes to Redis only.
+                "L1_KEY_PREFIXES": ["movies:page:"],
+            },
+        }
+    }
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis.cache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+# Local tiers and listeners are shared by every thread of a process.
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """A thread-safe LRU mapping with a per-entry time to live."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.listener_pid = None
+        self.id = uuid.uuid4().hex
+
+    @property
+    def node(self):
+        # Forked workers share the id, but not the pid.
+        return f"{self.id}:{os.getpid()}"
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            value, expiry = entry
+            if expiry < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredRedisCache(RedisCache):
+    def __init__(self, server, params):
+        options = dict(params.get("OPTIONS", {}))
+        max_entries = options.pop("L1_MAX_ENTRIES", 1000)
+        timeout = options.pop("L1_TIMEOUT", 5)
+        self._prefixes = tuple(options.pop("L1_KEY_PREFIXES", None) or ("",))
+        self._channel = options.pop("L1_CHANNEL", "movierama:cache-invalidation")
+        super().__init__(server, dict(params, OPTIONS=options))
+
+        with _tiers_lock:
+            self._tier = _tiers.setdefault(
+                (server, self._channel), LocalTier(max_entries, timeout)
+            )
+
+    # Reads
+
+    def get(self, key, default=None, version=None, client=None):
+        if not self._local(key):
+            return super().get(key, default, version, client)
+        self._ensure_listener()
+        full_key = self.make_key(key, version)
+        value = self._tier.get(full_key)
+        if value is _MISSING:
+            value = super().get(key, _MISSING, version, client)
+            if value is _MISSING:
+                return default
+            self._tier.set(full_key, value)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        found, remote = {}, []
+        for key in keys:
+            value = _MISSING
+            if self._local(key):
+                value = self._tier.get(self.make_key(key, version))
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        if remote:
+            fetched = super().get_many(remote, version=version, client=client)
+            self._ensure_listener()
+            for key, value in fetched.items():
+                if self._local(key):
+                    self._tier.set(self.make_key(key, version), value)
+            found.update(fetched)
+        return found
+
+    # Writes
+
+    def set(
+        self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, **kwargs
+    ):
+        result = super().set(key, value, timeout, version, client, **kwargs)
+        self._invalidate([key], version)
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().add(key, value, timeout, version, client)
+        if result:
+            self._invalidate([key], version)
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().set_many(data, timeout, version=version, client=client)
+        self._invalidate(list(data), version)
+        return result
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        result = super().delete(key, version=version, prefix=prefix, client=client)
+        self._invalidate([key], version)
+        return result
+
+    def delete_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        result = super().delete_many(keys, version=version, client=client)
+        self._invalidate(keys, version)
+        return result
+
+    def incr(self, key, delta=1, version=None, client=None):
+        result = super().incr(key, delta=delta, version=version, client=client)
+        self._invalidate([key], version)
+        return result
+
+    def decr(self, key, delta=1, version=None, client=None):
+        result = super().decr(key, delta=delta, version=version, client=client)
+        self._invalidate([key], version)
+        return result
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().touch(key, timeout, version=version, client=client)
+        self._invalidate([key], version)
+        return result
+
+    def delete_pattern(self, *args, **kwargs):
+        result = super().delete_pattern(*args, **kwargs)
+        self._broadcast({"clear": True})
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self._broadcast({"clear": True})
+        return result
+
+    # Invalidation
+
+    def _local(self, key):
+        return key.startswith(self._prefixes)
+
+    def _invalidate(self, keys, version):
+        keys = [self.make_key(key, version) for key in keys if self._local(key)]
+        if keys:
+            self._broadcast({"keys": keys})
+
+    def _broadcast(self, message):
+        self._apply(message)
+        message["node"] = self._tier.node
+        try:
+            self.client.get_client(write=True).publish(
+                self._channel, json.dumps(message)
+            )
+        except Exception:
+            # Other processes fall back on the local time to live.
+            logger.exception("Could not broadcast cache invalidation")
+
+    def _apply(self, message):
+        if message.get("clear"):
+            self._tier.clear()
+        else:
+            self._tier.discard(message.get("keys", []))
+
+    def _ensure_listener(self):
+        # One listener per process; a forked worker starts its own.
+        pid = os.getpid()
+        if self._tier.listener_pid == pid:
+            return
+        with _tiers_lock:
+            if self._tier.listener_pid == pid:
+                return
+            self._tier.clear()
+            self._tier.listener_pid = pid
+            thread = threading.Thread(
+                target=self._listen, name="cache-invalidation", daemon=True
+            )
+            thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.get_client(write=False).pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(self._channel)
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    # Own messages were applied when they were sent.
+                    payload = json.loads(message["data"])
+                    if payload.get("node") != self._tier.node:
+                        self._apply(payload)
+            except Exception:
+                logger.exception("Cache invalidation listener lost its connection")
+                # Invalidations may have been missed while disconnected.
+                self._tier.clear()
+                time.sleep(1)
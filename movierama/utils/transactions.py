@@ -0,0 +1,110 @@
+"""
+Per-view transaction policies, in place of a transaction per request.
+
+A request transaction holds its connection, and whatever locks its queries
+took, until the response is rendered. ``ATOMIC_REQUESTS`` stays on for the
+views that write several rows per request (users, allauth, admin); views
+decorated with :func:`view_policy` opt out of it: their queries autocommit,
+and their writes take short explicit transactions of their own (see
+:func:`atomic`).
+Each policy of ``VIEW_TRANSACTION_POLICIES`` names the ``lock_timeout`` and
+``statement_timeout`` (in milliseconds) of the queries of its views, such as
+"read" and "write"::
+
+    @view_policy("read")
+    def movie_list(request):
+        ...
+
+The timeouts are set on each connection the view uses, before its first
+query outside of a transaction, and reset when the view returns.
+"""
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+
+TIMEOUTS = ("lock_timeout", "statement_timeout")
+
+
+def view_policy(name):
+    """Run the decorated view under the transaction policy ``name``."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with db_timeouts(**settings.VIEW_TRANSACTION_POLICIES[name]):
+                return view(request, *args, **kwargs)
+
+        wrapper.transaction_policy = name
+        return transaction.non_atomic_requests(wrapper)
+
+    return decorator
+
+
+@contextmanager
+def db_timeouts(**timeouts):
+    """Apply ``timeouts`` to the queries run within, on every database."""
+    timeouts = {name: value for name, value in timeouts.items() if value is not None}
+    if not timeouts:
+        yield
+        return
+    setters = [_TimeoutSetter(timeouts) for _ in connections]
+    try:
+        with ExitStack() as stack:
+            for alias, setter in zip(connections, setters):
+                stack.enter_context(connections[alias].execute_wrapper(setter))
+            yield
+    finally:
+        # Connections outlive the request, and serve views of other policies.
+        for setter in setters:
+            setter.reset()
+
+
+@contextmanager
+def atomic(using=None, **timeouts):
+    """
+    ``transaction.atomic``, with ``timeouts`` local to the transaction when
+    it is the outermost one.
+    """
+    conn = connections[using] if using else connection
+    outermost = not conn.in_atomic_block
+    with transaction.atomic(using=using):
+        if outermost:
+            with conn.cursor() as cursor:
+                _set(cursor, timeouts, local=True)
+        yield
+
+
+class _TimeoutSetter:
+    def __init__(self, timeouts):
+        self.timeouts = timeouts
+        self.connection = None
+
+    def __call__(self, execute, sql, params, many, context):
+        conn = context["connection"]
+        # Set once per connection, not within a transaction, which could roll
+        # it back.
+        if self.connection is None and not conn.in_atomic_block:
+            self.connection = conn
+            _set(context["cursor"].cursor, self.timeouts)
+        return execute(sql, params, many, context)
+
+    def reset(self):
+        conn = self.connection
+        if conn is None or conn.connection is None or conn.in_atomic_block:
+            return
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("; ".join(f"RESET {name}" for name in self.timeouts))
+        except DatabaseError:
+            # A broken connection is closed at the end of the request anyway.
+            pass
+
+
+def _set(cursor, timeouts, local=False):
+    scope = "LOCAL " if local else ""
+    for name, value in timeouts.items():
+        if name not in TIMEOUTS:
+            raise ValueError(f"Unknown timeout {name!r}")
+        cursor.execute(f"SET {scope}{name} = %s", [int(value)])
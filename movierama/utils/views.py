@@ -0,0 +1,12 @@
+import os
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+
+from .pooled_postgresql.pool import pool_stats
+
+
+@staff_member_required
+def database_pool_stats(request):
+    """The database connection pools of the worker process serving the request."""
+    return JsonResponse({"pid": os.getpid(), "pools": pool_stats()})